@@ -0,0 +1,152 @@
+import datetime
+import gzip
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+BACKUP_DIR = 'backups'
+KEEP_BACKUPS = 14             # newest generations kept, older ones are deleted
+BACKUP_INTERVAL_HOURS = 24    # scheduled backups run when the newest one is older than this
+PAGES_PER_STEP = 100          # pages copied per step, progress is reported after each
+STEP_PAUSE = 0.02             # seconds to wait after a step that found the source locked
+SQLITE_BUSY = 5               # step statuses for a step that copied nothing because
+SQLITE_LOCKED = 6             # another connection held a lock
+
+
+class BackupError(Exception):
+    pass
+
+
+class BackupResult:
+    def __init__(self):
+        self.path = None
+        self.size = 0
+        self.pages = 0
+        self.seconds = 0.0
+        self.finished = None  # when the attempt ended, successful or not
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class BackupManager:
+    def __init__(self, db_path, backup_dir=BACKUP_DIR, keep=KEEP_BACKUPS,
+                 pages=PAGES_PER_STEP, pause=STEP_PAUSE):
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self.pages = pages
+        self.pause = pause
+        self.prefix = os.path.splitext(os.path.basename(db_path))[0] + '_'
+        self.thread = None
+        self.progress = (0, 0)  # (pages copied, total pages) of the running backup
+        self.last_result = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def backups(self):
+        # Newest first
+        if not os.path.isdir(self.backup_dir):
+            return []
+        names = [name for name in os.listdir(self.backup_dir)
+                 if name.startswith(self.prefix) and name.endswith('.db.gz')]
+        return [os.path.join(self.backup_dir, name) for name in sorted(names, reverse=True)]
+
+    def latest_time(self):
+        backups = self.backups()
+        if not backups:
+            return None
+        return datetime.datetime.fromtimestamp(os.path.getmtime(backups[0]))
+
+    def is_due(self, hours=BACKUP_INTERVAL_HOURS):
+        latest = self.latest_time()
+        return latest is None or datetime.datetime.now() - latest >= datetime.timedelta(hours=hours)
+
+    def start(self):
+        # Returns False if a backup is already running; poll `running` and `last_result`
+        if self.running:
+            return False
+        self.progress = (0, 0)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return True
+
+    def run(self):
+        result = BackupResult()
+        start = time.perf_counter()
+        os.makedirs(self.backup_dir, exist_ok=True)
+        stamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        final_path = os.path.join(self.backup_dir, f"{self.prefix}{stamp}.db.gz")
+        copy_path = os.path.join(self.backup_dir, f".{self.prefix}{stamp}.db")
+
+        try:
+            self.copy(copy_path)
+            result.pages = self.progress[1]
+            self.verify(copy_path)
+            self.compress(copy_path, final_path)
+            result.path = final_path
+            result.size = os.path.getsize(final_path)
+            self.rotate()
+        except Exception as e:
+            result.error = str(e)
+        finally:
+            for path in (copy_path, final_path + '.tmp'):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        result.seconds = time.perf_counter() - start
+        result.finished = datetime.datetime.now()
+        self.last_result = result
+        return result
+
+    def copy(self, copy_path):
+        # The database is in WAL mode, so a read transaction held open on the source
+        # sees one consistent state for the whole copy while checkouts keep
+        # committing to the log. Writes never restart the copy and it never blocks
+        # them; the log just grows until the copy is done.
+        src = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        dst = sqlite3.connect(copy_path)
+        try:
+            mode = src.execute('PRAGMA journal_mode = WAL').fetchone()[0]
+            if mode != 'wal':
+                raise BackupError(f"Online backup needs WAL mode, the database is in {mode} mode")
+            src.execute('BEGIN')
+            src.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()  # starts the read
+            src.backup(dst, pages=self.pages, progress=self.on_progress)
+        finally:
+            if src.in_transaction:
+                src.execute('ROLLBACK')
+            src.close()
+            dst.close()
+
+    def on_progress(self, status, remaining, total):
+        if status in (SQLITE_BUSY, SQLITE_LOCKED):
+            # The step waited on another connection's lock and copied nothing
+            time.sleep(self.pause)
+            return
+        self.progress = (total - remaining, total)
+
+    def verify(self, copy_path):
+        conn = sqlite3.connect(copy_path)
+        try:
+            problems = [row[0] for row in conn.execute('PRAGMA integrity_check')]
+        finally:
+            conn.close()
+        if problems != ['ok']:
+            raise BackupError("Integrity check failed: " + '; '.join(problems[:5]))
+
+    def compress(self, copy_path, final_path):
+        tmp_path = final_path + '.tmp'
+        with open(copy_path, 'rb') as src, gzip.open(tmp_path, 'wb', compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.replace(tmp_path, final_path)
+
+    def rotate(self):
+        for path in self.backups()[self.keep:]:
+            os.remove(path)
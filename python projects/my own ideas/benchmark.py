@@ -0,0 +1,198 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import time
+
+from datagen import SCALES, generate_database
+import inventory_core
+from inventory_core import InventoryDatabase
+
+BENCH_DIR = 'bench_data'
+DEFAULT_OUTPUT = 'benchmark_results.json'
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+
+
+def now():
+    return datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def prepare_database(scale, seed, fresh=False):
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    pristine = os.path.join(BENCH_DIR, f"bench_{scale}_{seed}.db")
+    if fresh and os.path.exists(pristine):
+        os.remove(pristine)
+    if not os.path.exists(pristine):
+        print(f"Generating {scale} dataset (seed {seed})...")
+        generate_database(pristine, scale, seed).conn.close()
+
+    # The write benchmarks change stock, so every run works on a copy
+    work = os.path.join(BENCH_DIR, f"work_{scale}.db")
+    shutil.copyfile(pristine, work)
+    return work
+
+
+def build_operations(db, rng):
+    barcodes = [row[0] for row in db.conn.execute('SELECT barcode FROM products')]
+    names = [row[0] for row in db.conn.execute('SELECT name FROM products LIMIT 1000')]
+
+    def get_product():
+        db.get_product(rng.choice(barcodes))
+
+    def search_products():
+        # Mix of barcode fragments, name words and categories like a cashier types
+        query = rng.choice((
+            rng.choice(barcodes)[:3],
+            rng.choice(names).split()[0],
+            rng.choice(names).split()[-1],
+        ))
+        db.search_products(query)
+
+    def checkout():
+        # Scan three items into the cart, then check out like the POS does
+        lines = []
+        for barcode in rng.sample(barcodes, 3):
+            product = db.get_product(barcode)
+            lines.append((barcode, product.name, 1, product.selling_price, 0, product.selling_price))
+        inventory_core.checkout(db, lines)
+
+    def add_return():
+        barcode = rng.choice(barcodes)
+        db.add_return((barcode, 'Benchmark item', 1, 'Benchmark', now(), None))
+
+    def add_exchange():
+        old, new = rng.sample(barcodes, 2)
+        db.add_exchange((old, new, 'Benchmark old', 'Benchmark new', now()))
+
+    # name -> (callable, number of timed runs)
+    return {
+        'get_product': (get_product, 500),
+        'search_products': (search_products, 20),
+        'checkout': (checkout, 50),
+        'add_return': (add_return, 50),
+        'add_exchange': (add_exchange, 50),
+        'get_next_barcode': (db.get_next_barcode, 50),
+        'report_stock': (db.get_all_products, 5),
+        'report_low_stock': (db.get_low_stock_products, 5),
+        'report_recent_sales': (lambda: db.get_recent_sales(50), 5),
+        'report_revenue_summary': (db.get_revenue_summary, 5),
+        'report_top_products': (lambda: db.get_top_selling_products(10), 5),
+        'report_top_category_week': (lambda: db.bestsellers.top('week', k=10, category='shirt'), 20),
+        'report_returns': (db.get_returns, 5),
+        'report_exchanges': (db.get_exchanges, 5),
+    }
+
+
+def time_operation(func, runs):
+    func()  # warm up the page cache and statement cache
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        'runs': runs,
+        'min_ms': round(timings[0], 4),
+        'median_ms': round(statistics.median(timings), 4),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 4),
+        'max_ms': round(timings[-1], 4),
+    }
+
+
+def run_scale(scale, seed, only=None, fresh=False):
+    db = InventoryDatabase(prepare_database(scale, seed, fresh))
+    rng = random.Random(seed)
+    results = {}
+    for name, (func, runs) in build_operations(db, rng).items():
+        if only and name not in only:
+            continue
+        results[name] = time_operation(func, runs)
+        print(f"  {name:<24} median {results[name]['median_ms']:>10.3f} ms   "
+              f"p95 {results[name]['p95_ms']:>10.3f} ms")
+    db.conn.close()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    comparison = {}
+    regressions = []
+    for scale, operations in results.items():
+        base_ops = baseline.get('results', {}).get(scale, {})
+        for name, stats in operations.items():
+            if name not in base_ops:
+                continue
+            base = base_ops[name]['median_ms']
+            ratio = stats['median_ms'] / base if base else float('inf')
+            regressed = ratio > 1 + tolerance
+            comparison.setdefault(scale, {})[name] = {
+                'baseline_ms': base,
+                'current_ms': stats['median_ms'],
+                'ratio': round(ratio, 3),
+                'regressed': regressed,
+            }
+            if regressed:
+                regressions.append(f"{scale}/{name}: {base:.3f} ms -> {stats['median_ms']:.3f} ms ({ratio:.2f}x)")
+    return comparison, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark InventoryDatabase on synthetic data")
+    parser.add_argument('--scale', action='append', choices=sorted(SCALES),
+                        help="dataset size to run, can be repeated (default: small)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--only', action='append', help="run only the named operation, can be repeated")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="store this run as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed slowdown of the median before it counts as a regression")
+    parser.add_argument('--fresh', action='store_true', help="regenerate the datasets")
+    args = parser.parse_args()
+
+    results = {}
+    for scale in args.scale or ['small']:
+        print(f"[{scale}] products/sales/returns/exchanges = {SCALES[scale]}")
+        results[scale] = run_scale(scale, args.seed, args.only, args.fresh)
+
+    report = {
+        'generated': now(),
+        'seed': args.seed,
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'machine': platform.platform(),
+        'results': results,
+    }
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        report['baseline'] = {'file': args.baseline, 'generated': baseline.get('generated')}
+        report['comparison'], regressions = compare(results, baseline, args.tolerance)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=4)
+        print(f"Baseline saved to {args.baseline}")
+
+    if regressions:
+        print("REGRESSIONS:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
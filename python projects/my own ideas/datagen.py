@@ -0,0 +1,162 @@
+import argparse
+import datetime
+import random
+
+from inventory_core import InventoryDatabase
+
+# Dataset sizes used by the benchmark (products, sales, returns, exchanges)
+SCALES = {
+    'small': (1000, 20000, 500, 200),
+    'medium': (10000, 500000, 10000, 4000),
+    'large': (100000, 5000000, 100000, 40000),
+}
+
+CATEGORIES = ['shirt', 'trouser', 'jeans', 'kurta', 'shalwar kameez', 'jacket',
+              'sweater', 't-shirt', 'dupatta', 'waistcoat']
+SIZES = ['XS', 'S', 'M', 'L', 'XL', 'XXL', 'mix']
+COLORS = ['black', 'white', 'blue', 'red', 'green', 'grey', 'maroon', 'beige', 'mix']
+BRANDS = ['JD', 'Khaadi', 'Edenrobe', 'Outfitters', 'Bonanza', 'Gul Ahmed', 'Cambridge']
+REASONS = ['Wrong size', 'Defective', 'Changed mind', 'Colour mismatch']
+
+BATCH_SIZE = 10000
+
+
+def fmt(dt):
+    return dt.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def product_rows(rng, count, start, end):
+    span = int((end - start).total_seconds())
+    for i in range(count):
+        barcode = str(1001 + i).zfill(4)
+        category = rng.choice(CATEGORIES)
+        cost = rng.randrange(300, 8000, 50)
+        added = start + datetime.timedelta(seconds=rng.randrange(span))
+        yield (
+            barcode,
+            f"{category.title()} {rng.choice(BRANDS)} {i}",
+            category,
+            rng.choice(SIZES),
+            rng.choice(COLORS),
+            float(cost),
+            float(cost + rng.randrange(100, 4000, 50)),
+            rng.randint(0, 60),
+            5,
+            fmt(added),
+            fmt(added),
+        )
+
+
+def sale_rows(rng, count, products, start, end):
+    span = (end - start).total_seconds()
+    # Sales are written in date order like a real till would, so draw the
+    # gaps between them instead of sorting millions of random timestamps
+    offset = 0.0
+    for _ in range(count):
+        offset = min(offset + rng.expovariate(count / span), span)
+        # Skew towards the front of the catalogue so there are clear bestsellers
+        barcode, name, price = products[int(len(products) * rng.random() ** 3)]
+        quantity = rng.choice((1, 1, 1, 1, 2, 2, 3))
+        discount = rng.choice((0, 0, 0, 5, 10)) * price / 100
+        yield (
+            barcode, name, quantity, price, discount,
+            (price - discount) * quantity,
+            fmt(start + datetime.timedelta(seconds=offset)),
+        )
+
+
+def return_rows(rng, count, products, start, end):
+    span = int((end - start).total_seconds())
+    for _ in range(count):
+        barcode, name, _ = rng.choice(products)
+        yield (barcode, name, 1, rng.choice(REASONS),
+               fmt(start + datetime.timedelta(seconds=rng.randrange(span))), None)
+
+
+def exchange_rows(rng, count, products, start, end):
+    span = int((end - start).total_seconds())
+    for _ in range(count):
+        old = rng.choice(products)
+        new = rng.choice(products)
+        yield (old[0], new[0], old[1], new[1],
+               fmt(start + datetime.timedelta(seconds=rng.randrange(span))))
+
+
+def insert_batches(conn, sql, rows):
+    cursor = conn.cursor()
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            cursor.executemany(sql, batch)
+            batch = []
+    if batch:
+        cursor.executemany(sql, batch)
+
+
+def generate_database(db_path, scale='small', seed=42, years=3, end=None):
+    n_products, n_sales, n_returns, n_exchanges = SCALES[scale]
+    rng = random.Random(seed)
+    end = end or datetime.datetime.now().replace(microsecond=0)
+    start = end - datetime.timedelta(days=365 * years)
+
+    # Let the application create the schema so the shape always matches
+    db = InventoryDatabase(db_path)
+    conn = db.conn
+    conn.execute('PRAGMA synchronous = OFF')
+
+    insert_batches(conn, '''
+        INSERT INTO products (barcode, name, category, size, color, cost_price,
+                            selling_price, stock_quantity, min_stock_level,
+                            date_added, last_updated)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', product_rows(rng, n_products, start, end))
+    conn.commit()
+
+    products = conn.execute('SELECT barcode, name, selling_price FROM products ORDER BY id').fetchall()
+
+    insert_batches(conn, '''
+        INSERT INTO sales (barcode, product_name, quantity, original_price,
+                         discount_price, final_price, sale_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', sale_rows(rng, n_sales, products, start, end))
+    insert_batches(conn, '''
+        INSERT INTO returns (barcode, product_name, quantity, reason, return_date, sale_id)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', return_rows(rng, n_returns, products, start, end))
+    insert_batches(conn, '''
+        INSERT INTO exchanges (old_barcode, new_barcode, old_product, new_product, exchange_date)
+        VALUES (?, ?, ?, ?, ?)
+    ''', exchange_rows(rng, n_exchanges, products, start, end))
+    conn.commit()
+
+    # The synthetic history has no ledger behind it, so replace the empty
+    # snapshot taken when the schema was created with the generated stock
+    conn.execute('DELETE FROM stock_snapshot_items')
+    conn.execute('DELETE FROM stock_snapshots')
+    db.take_snapshot()
+    conn.execute('PRAGMA synchronous = FULL')
+    return db
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill a garments_inventory.db-shaped database with synthetic data")
+    parser.add_argument('db_path')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    try:
+        open(args.db_path, 'x').close()
+    except FileExistsError:
+        parser.error(f"{args.db_path} already exists, refusing to add data to it")
+
+    db = generate_database(args.db_path, args.scale, args.seed)
+    for table in ('products', 'sales', 'returns', 'exchanges'):
+        count = db.conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        print(f"{table:<10} {count}")
+    db.conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+import logging
+import logging.handlers
+import os
+import threading
+import time
+
+SLOW_QUERY_MS = 50
+SLOW_QUERY_LOG = 'slow_queries.log'
+
+# Upper bounds (ms) of the latency histogram buckets, the last one catches everything
+BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, float('inf'))
+
+
+def normalize_sql(sql):
+    return ' '.join(sql.split())
+
+
+class StatementStats:
+    __slots__ = ('sql', 'calls', 'total_ms', 'max_ms', 'rows', 'buckets')
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.buckets = [0] * len(BUCKETS_MS)
+
+    def add(self, elapsed_ms, rows):
+        self.calls += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.rows += rows
+        for i, bound in enumerate(BUCKETS_MS):
+            if elapsed_ms <= bound:
+                self.buckets[i] += 1
+                break
+
+    def percentile(self, p):
+        # Upper bound of the bucket holding the p-th percentile
+        target = self.calls * p / 100
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.buckets):
+            seen += count
+            if count and seen >= target:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    @property
+    def avg_ms(self):
+        return self.total_ms / self.calls if self.calls else 0.0
+
+
+class QueryStats:
+    def __init__(self, slow_ms=SLOW_QUERY_MS, log_path=SLOW_QUERY_LOG):
+        self.slow_ms = slow_ms
+        self.log_path = log_path
+        self.statements = {}
+        self.lock = threading.Lock()
+        self._logger = None
+
+    def record(self, sql, elapsed_ms, rows):
+        key = normalize_sql(sql)
+        with self.lock:
+            stats = self.statements.get(key)
+            if stats is None:
+                stats = self.statements[key] = StatementStats(key)
+            stats.add(elapsed_ms, rows)
+        return key
+
+    def add_rows(self, key, rows):
+        with self.lock:
+            self.statements[key].rows += rows
+
+    def reset(self):
+        with self.lock:
+            self.statements.clear()
+
+    def snapshot(self):
+        # Slowest statements (by total time spent) first
+        with self.lock:
+            return sorted(self.statements.values(), key=lambda s: s.total_ms, reverse=True)
+
+    @property
+    def logger(self):
+        if self._logger is None:
+            # One logger per log file; connections sharing a file share its handler
+            # so every slow query is written once, and only to its own file
+            path = os.path.abspath(self.log_path)
+            self._logger = logging.getLogger(f'inventory.slow_queries.{path}')
+            self._logger.setLevel(logging.INFO)
+            self._logger.propagate = False
+            if not self._logger.handlers:
+                handler = logging.handlers.RotatingFileHandler(
+                    path, maxBytes=1024 * 1024, backupCount=5, encoding='utf-8')
+                handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+                self._logger.addHandler(handler)
+        return self._logger
+
+    def log_slow(self, sql, elapsed_ms, rows, plan):
+        lines = [f"{elapsed_ms:.1f} ms, {rows} rows: {normalize_sql(sql)}"]
+        lines += [f"    PLAN {detail}" for detail in plan]
+        self.logger.info('\n'.join(lines))
+
+
+class InstrumentedCursor:
+    def __init__(self, connection, cursor):
+        self._connection = connection
+        self._cursor = cursor
+        self._pending = None
+        self._key = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    @property
+    def row_factory(self):
+        return self._cursor.row_factory
+
+    @row_factory.setter
+    def row_factory(self, factory):
+        self._cursor.row_factory = factory
+
+    def __iter__(self):
+        while True:
+            start = time.perf_counter()
+            rows = self._cursor.fetchmany(256)
+            self._fetched(start, len(rows), finished=not rows)
+            if not rows:
+                return
+            yield from rows
+
+    def execute(self, sql, params=()):
+        self._finish()
+        start = time.perf_counter()
+        self._cursor.execute(sql, params)
+        self._started(sql, params, start)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._finish()
+        start = time.perf_counter()
+        self._cursor.executemany(sql, seq_of_params)
+        self._started(sql, None, start)
+        return self
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = self._cursor.fetchone()
+        # Most callers read a single row, so the first fetch completes the statement
+        self._fetched(start, 1 if row is not None else 0, finished=True)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = self._cursor.fetchmany(size or self._cursor.arraysize)
+        self._fetched(start, len(rows), finished=not rows)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._fetched(start, len(rows), finished=True)
+        return rows
+
+    def close(self):
+        self._finish()
+        self._cursor.close()
+
+    def _started(self, sql, params, start):
+        elapsed = (time.perf_counter() - start) * 1000
+        self._key = None
+        self._pending = [sql, params, elapsed, 0]
+        if self._cursor.description is None:
+            # INSERT/UPDATE/DELETE: all the work is already done
+            self._pending[3] = max(self._cursor.rowcount, 0)
+            self._finish()
+
+    def _fetched(self, start, rows, finished):
+        elapsed = (time.perf_counter() - start) * 1000
+        if self._pending is not None:
+            self._pending[2] += elapsed
+            self._pending[3] += rows
+            if finished:
+                self._finish()
+        elif self._key is not None and rows:
+            self._connection.stats.add_rows(self._key, rows)
+
+    def _finish(self):
+        if self._pending is None:
+            return
+        sql, params, elapsed, rows = self._pending
+        self._pending = None
+        self._key = self._connection.stats.record(sql, elapsed, rows)
+        if elapsed >= self._connection.stats.slow_ms:
+            self._connection.log_slow_query(sql, params, elapsed, rows)
+
+
+class InstrumentedConnection:
+    def __init__(self, conn, stats=None):
+        self._conn = conn
+        self.stats = stats or QueryStats()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    @property
+    def raw(self):
+        return self._conn
+
+    def cursor(self):
+        return InstrumentedCursor(self, self._conn.cursor())
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def log_slow_query(self, sql, params, elapsed, rows):
+        plan = []
+        if params is not None and not sql.lstrip().upper().startswith(('PRAGMA', 'EXPLAIN')):
+            try:
+                plan = [row[-1] for row in self._conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+            except Exception as e:
+                plan = [f"unavailable: {e}"]
+        self.stats.log_slow(sql, elapsed, rows, plan)
@@ -0,0 +1,123 @@
+import datetime
+import itertools
+import math
+
+from inventory_core import InventoryError
+
+SMOOTHING = 0.05         # exponential smoothing factor, about a 40 day memory
+WEIGHT_CUTOFF = 1e-4     # older days weigh less than this and are not read at all
+LEAD_TIME_DAYS = 7       # days between placing an order and the stock arriving
+REVIEW_DAYS = 14         # an order should cover demand until the next reorder
+SERVICE_Z = 1.65         # safety stock for ~95% of lead times without a stock-out
+MIN_STOCK_FLOOR = 1
+
+
+def load_numpy():
+    # Only the forecast needs numpy, the till runs without it
+    try:
+        import numpy
+    except ImportError:
+        raise InventoryError("Demand forecasting needs numpy (pip install numpy)")
+    return numpy
+
+
+class Forecast:
+    def __init__(self, product_ids, barcodes, daily_demand, demand_std,
+                 min_stock_level, reorder_quantity, current_min, days):
+        self.product_ids = product_ids
+        self.barcodes = barcodes
+        self.daily_demand = daily_demand
+        self.demand_std = demand_std
+        self.min_stock_level = min_stock_level
+        self.reorder_quantity = reorder_quantity
+        self.current_min = current_min
+        self.days = days
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def changed(self):
+        # Indices of products whose suggested minimum differs from the current one
+        return (self.min_stock_level != self.current_min).nonzero()[0]
+
+
+def history_days(alpha=SMOOTHING, cutoff=WEIGHT_CUTOFF):
+    # Days until a sale's smoothing weight falls below the cutoff
+    return math.ceil(math.log(cutoff) / math.log(1 - alpha))
+
+
+def load_daily_sales(db, start, days, chunk_size=100000):
+    # (product index, day offset, quantity) arrays for every product and day with sales.
+    # The bestseller tracker already keeps one net row per barcode per day, so
+    # nothing has to be grouped here; rows are read in chunks to bound memory.
+    np = load_numpy()
+    cursor = db.conn.cursor()
+    cursor.execute('SELECT id, barcode, min_stock_level FROM products ORDER BY id')
+    products = cursor.fetchall()
+    product_ids = np.fromiter((row[0] for row in products), dtype=np.int64, count=len(products))
+    barcodes = [row[1] for row in products]
+    current_min = np.fromiter((row[2] or 0 for row in products), dtype=np.int64, count=len(products))
+
+    position = {barcode: i for i, barcode in enumerate(barcodes)}
+    day_offset = {(start + datetime.timedelta(days=d)).strftime('%Y-%m-%d'): d for d in range(days + 1)}
+
+    cursor.execute('''
+        SELECT barcode, period_key, quantity FROM sales_counters 
+        WHERE period = 'day' AND period_key >= ?
+    ''', (start.strftime('%Y-%m-%d'),))
+    chunks = []
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        # Counters of deleted products are skipped
+        mapped = [(position[barcode], day_offset[key], quantity) for barcode, key, quantity in rows
+                  if barcode in position and key in day_offset]
+        chunks.append(np.fromiter(itertools.chain.from_iterable(mapped), dtype=np.int64, count=3 * len(mapped)))
+    flat = np.concatenate(chunks).reshape(-1, 3) if chunks else np.zeros((0, 3), dtype=np.int64)
+
+    return product_ids, barcodes, current_min, flat[:, 0], flat[:, 1], flat[:, 2].astype(np.float64)
+
+
+def forecast(db, today=None, alpha=SMOOTHING, lead_time=LEAD_TIME_DAYS,
+             review_days=REVIEW_DAYS, z=SERVICE_Z):
+    # Exponentially smoothed daily demand and its spread for every product at once.
+    # With zero-sales days the smoothed level is a weighted sum of the sale days
+    # alone, weight alpha * (1 - alpha) ** age, so no products x days matrix is built.
+    np = load_numpy()
+    today = today or datetime.date.today()
+    days = history_days(alpha)
+    start = today - datetime.timedelta(days=days)
+    product_ids, barcodes, current_min, index, day, quantity = load_daily_sales(db, start, days)
+
+    age = days - day  # today is age 0
+    weight = alpha * (1 - alpha) ** age
+    # Weights over the window sum to just under 1, normalise so demand is not understated
+    total_weight = 1 - (1 - alpha) ** (days + 1)
+
+    n = len(product_ids)
+    # Returns can push a day negative, demand itself never is
+    mean = np.maximum(np.bincount(index, weights=weight * quantity, minlength=n) / total_weight, 0)
+    mean_sq = np.bincount(index, weights=weight * quantity ** 2, minlength=n) / total_weight
+    std = np.sqrt(np.maximum(mean_sq - mean ** 2, 0))
+
+    safety = z * std * math.sqrt(lead_time)
+    min_level = np.maximum(np.ceil(mean * lead_time + safety), MIN_STOCK_FLOOR).astype(np.int64)
+    reorder = np.ceil(mean * review_days).astype(np.int64)
+
+    return Forecast(product_ids, barcodes, mean, std, min_level, reorder, current_min, days)
+
+
+def apply_forecast(db, result, only=None):
+    # Writes suggested levels back in one transaction; `only` limits it to some indices
+    np = load_numpy()
+    indices = np.arange(len(result)) if only is None else np.asarray(only)
+    rows = zip(result.min_stock_level[indices].tolist(),
+               result.reorder_quantity[indices].tolist(),
+               result.product_ids[indices].tolist())
+    cursor = db.conn.cursor()
+    cursor.executemany('''
+        UPDATE products SET min_stock_level = ?, reorder_quantity = ? WHERE id = ?
+    ''', rows)
+    db.commit()
+    return len(indices)
@@ -0,0 +1,871 @@
+import datetime
+import sqlite3
+
+from db_instrumentation import InstrumentedConnection
+from rows import Product, Sale, Return, Exchange, record_factory
+
+
+SNAPSHOT_INTERVAL_DAYS = 7
+CACHED_STATEMENTS = 256  # sqlite3 keeps this many prepared statements per connection
+
+
+class InventoryError(Exception):
+    pass
+
+
+def timestamp():
+    return datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def snapshot_due(taken):
+    # When the snapshot after one taken at `taken` is due, as a timestamp
+    due = datetime.datetime.strptime(taken, '%Y-%m-%d %H:%M:%S') + datetime.timedelta(days=SNAPSHOT_INTERVAL_DAYS)
+    return due.strftime('%Y-%m-%d %H:%M:%S')
+
+
+class InventoryDatabase:
+    def __init__(self, db_path='garments_inventory.db'):
+        self.db_path = db_path
+        self.conn = InstrumentedConnection(sqlite3.connect(db_path, cached_statements=CACHED_STATEMENTS))
+        # WAL lets the backup, receipt and cache connections read while the till commits
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        # Reused for every record fetch, the rows are always read to the end
+        self.read_cursor = self.conn.cursor()
+        self.last_reserved_barcode = 0
+        self.bestsellers = BestsellerTracker(self)
+        self.create_tables()
+        self.low_stock = LowStockMonitor(self)
+        self.maybe_snapshot()
+    
+    def commit(self):
+        self.conn.commit()
+        # Push any low stock changes made by this transaction to listeners
+        self.low_stock.poll()
+        # A till left running takes its snapshots here, not only when it starts
+        if timestamp() >= self.snapshot_due:
+            self.take_snapshot()
+    
+    def fetch_all(self, record, sql, params=()):
+        cursor = self.read_cursor
+        cursor.execute(sql, params)
+        cursor.row_factory = record_factory(record, cursor.description)
+        return cursor.fetchall()
+    
+    def fetch_one(self, record, sql, params=()):
+        # fetchall also finishes the statement, so no read lock is left behind
+        result = self.fetch_all(record, sql, params)
+        return result[0] if result else None
+    
+    def create_tables(self):
+        cursor = self.conn.cursor()
+        
+        # Products table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS products (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                barcode TEXT UNIQUE NOT NULL,
+                name TEXT NOT NULL,
+                category TEXT,
+                size TEXT,
+                color TEXT,
+                cost_price REAL,
+                selling_price REAL,
+                stock_quantity INTEGER DEFAULT 0,
+                min_stock_level INTEGER DEFAULT 5,
+                date_added TEXT,
+                last_updated TEXT
+            )
+        ''')
+        
+        # Columns added after the first release
+        cursor.execute('PRAGMA table_info(products)')
+        columns = {row[1] for row in cursor.fetchall()}
+        if 'reorder_quantity' not in columns:
+            # Suggested order size, filled in by the demand forecast
+            cursor.execute('ALTER TABLE products ADD COLUMN reorder_quantity INTEGER')
+        
+        # Sales table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sales (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                barcode TEXT,
+                product_name TEXT,
+                quantity INTEGER,
+                original_price REAL,
+                discount_price REAL,
+                final_price REAL,
+                sale_date TEXT,
+                FOREIGN KEY (barcode) REFERENCES products (barcode)
+            )
+        ''')
+        
+        cursor.execute('PRAGMA table_info(sales)')
+        if 'promotion_id' not in {row[1] for row in cursor.fetchall()}:
+            # Promotion that priced the line, NULL for full price or a haggled discount
+            cursor.execute('ALTER TABLE sales ADD COLUMN promotion_id INTEGER')
+        
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_products_last_updated 
+            ON products (last_updated)
+        ''')
+        
+        # Catalogue sync between shops. Each peer's watermark is kept per stream.
+        # change_seq numbers every change to a product's catalogue fields in this shop,
+        # whether edited here or received, and exports follow it. catalogue_updated
+        # is when those fields were last edited in any shop and settles conflicts;
+        # unlike last_updated, stock changes leave both alone.
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sync_state (
+                peer TEXT,
+                stream TEXT,
+                watermark TEXT,
+                updated TEXT,
+                PRIMARY KEY (peer, stream)
+            )
+        ''')
+        if 'change_seq' not in columns:
+            cursor.execute('ALTER TABLE products ADD COLUMN catalogue_updated TEXT')
+            cursor.execute('ALTER TABLE products ADD COLUMN change_seq INTEGER')
+            cursor.execute('UPDATE products SET catalogue_updated = COALESCE(last_updated, date_added), change_seq = id')
+            # Watermarks used to be timestamps; every peer gets the catalogue once more
+            cursor.execute("DELETE FROM sync_state WHERE stream = 'products_out'")
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_products_change_seq 
+            ON products (change_seq)
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_catalogue_insert 
+            AFTER INSERT ON products 
+            BEGIN
+                UPDATE products 
+                SET catalogue_updated = COALESCE(NEW.catalogue_updated, NEW.last_updated, NEW.date_added,
+                                                 datetime('now', 'localtime')),
+                    change_seq = (SELECT COALESCE(MAX(change_seq), 0) + 1 FROM products)
+                WHERE id = NEW.id;
+            END
+        ''')
+        # A local edit sets neither catalogue_updated nor change_seq and takes the
+        # edit's time; a row applied by sync sets change_seq and keeps the version it
+        # came with, even when that equals the old one. Recreated on every open so
+        # databases made before this rule pick it up.
+        cursor.execute('DROP TRIGGER IF EXISTS trg_catalogue_update')
+        cursor.execute('''
+            CREATE TRIGGER trg_catalogue_update 
+            AFTER UPDATE OF name, category, size, color, cost_price, selling_price ON products 
+            WHEN OLD.name IS NOT NEW.name OR OLD.category IS NOT NEW.category 
+             OR OLD.size IS NOT NEW.size OR OLD.color IS NOT NEW.color 
+             OR OLD.cost_price IS NOT NEW.cost_price OR OLD.selling_price IS NOT NEW.selling_price
+            BEGIN
+                UPDATE products 
+                SET catalogue_updated = CASE WHEN NEW.catalogue_updated IS OLD.catalogue_updated 
+                                              AND NEW.change_seq IS OLD.change_seq 
+                                             THEN COALESCE(NEW.last_updated, datetime('now', 'localtime')) 
+                                             ELSE NEW.catalogue_updated END,
+                    change_seq = (SELECT COALESCE(MAX(change_seq), 0) + 1 FROM products)
+                WHERE id = NEW.id;
+            END
+        ''')
+        # Daily sales per shop and barcode, received by head office
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS shop_sales (
+                shop TEXT,
+                sale_date TEXT,
+                barcode TEXT,
+                quantity INTEGER,
+                revenue REAL,
+                PRIMARY KEY (shop, sale_date, barcode)
+            )
+        ''')
+        
+        # Receipts: a zlib-compressed copy of each printed receipt for reprints,
+        # stored with the sale and listing its sales rows
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS receipts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                receipt_date TEXT,
+                total REAL,
+                payload BLOB,
+                sale_ids TEXT
+            )
+        ''')
+        cursor.execute('PRAGMA table_info(receipts)')
+        if 'sale_ids' not in {row[1] for row in cursor.fetchall()}:
+            # Comma separated ids of the sales rows the receipt was printed for
+            cursor.execute('ALTER TABLE receipts ADD COLUMN sale_ids TEXT')
+        
+        # Promotions: percent off or buy X get Y, for one barcode, a category,
+        # a size or the whole shop, optionally limited to a date range
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS promotions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                kind TEXT,
+                scope TEXT,
+                target TEXT,
+                percent REAL,
+                buy_qty INTEGER,
+                free_qty INTEGER,
+                starts TEXT,
+                ends TEXT,
+                active INTEGER DEFAULT 1
+            )
+        ''')
+        
+        # Returns table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS returns (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                barcode TEXT,
+                product_name TEXT,
+                quantity INTEGER,
+                reason TEXT,
+                return_date TEXT,
+                sale_id INTEGER,
+                FOREIGN KEY (barcode) REFERENCES products (barcode)
+            )
+        ''')
+        
+        # Exchanges table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS exchanges (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                old_barcode TEXT,
+                new_barcode TEXT,
+                old_product TEXT,
+                new_product TEXT,
+                exchange_date TEXT
+            )
+        ''')
+        
+        # Low stock tracking: the partial index holds only products at or below their
+        # minimum, and the triggers log every change to that set for listeners
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_products_low_stock 
+            ON products (stock_quantity) WHERE stock_quantity <= min_stock_level
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS low_stock_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                barcode TEXT,
+                event TEXT,
+                stock_quantity INTEGER,
+                min_stock_level INTEGER,
+                event_date TEXT
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_low_stock_insert 
+            AFTER INSERT ON products 
+            WHEN NEW.stock_quantity <= NEW.min_stock_level
+            BEGIN
+                INSERT INTO low_stock_events (barcode, event, stock_quantity, min_stock_level, event_date)
+                VALUES (NEW.barcode, 'low', NEW.stock_quantity, NEW.min_stock_level, 
+                        datetime('now', 'localtime'));
+            END
+        ''')
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_low_stock_update 
+            AFTER UPDATE OF stock_quantity, min_stock_level ON products 
+            WHEN (OLD.stock_quantity <= OLD.min_stock_level OR NEW.stock_quantity <= NEW.min_stock_level)
+             AND (OLD.stock_quantity IS NOT NEW.stock_quantity OR OLD.min_stock_level IS NOT NEW.min_stock_level)
+            BEGIN
+                INSERT INTO low_stock_events (barcode, event, stock_quantity, min_stock_level, event_date)
+                VALUES (NEW.barcode, 
+                        CASE WHEN NEW.stock_quantity <= NEW.min_stock_level THEN 'low' ELSE 'ok' END, 
+                        NEW.stock_quantity, NEW.min_stock_level, datetime('now', 'localtime'));
+            END
+        ''')
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_low_stock_delete 
+            AFTER DELETE ON products 
+            WHEN OLD.stock_quantity <= OLD.min_stock_level
+            BEGIN
+                INSERT INTO low_stock_events (barcode, event, stock_quantity, min_stock_level, event_date)
+                VALUES (OLD.barcode, 'ok', OLD.stock_quantity, OLD.min_stock_level, 
+                        datetime('now', 'localtime'));
+            END
+        ''')
+        
+        # Listeners start from the index, so old events are only kept for a while
+        cursor.execute('''
+            DELETE FROM low_stock_events WHERE event_date < datetime('now', 'localtime', '-30 days')
+        ''')
+        
+        # Bestseller counters per barcode for every day, week and month (plus all time),
+        # kept current by triggers on sales, returns and exchanges
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='sales_counters'")
+        needs_backfill = cursor.fetchone() is None
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sales_counters (
+                period TEXT,
+                period_key TEXT,
+                barcode TEXT,
+                quantity INTEGER DEFAULT 0,
+                revenue REAL DEFAULT 0,
+                PRIMARY KEY (period, period_key, barcode)
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_sales_counters_top 
+            ON sales_counters (period, period_key, quantity DESC)
+        ''')
+        
+        for name, table, rows in BestsellerTracker.TRIGGERS:
+            cursor.execute(BestsellerTracker.trigger_sql(name, table, rows))
+        
+        # Append-only stock ledger: every stock change is written in the same
+        # transaction as the change itself. Snapshots of the whole catalogue bound
+        # how much of the ledger a point-in-time query has to read.
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_movements (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                barcode TEXT,
+                change INTEGER,
+                reason TEXT,
+                reference_id INTEGER,
+                movement_date TEXT
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_stock_movements_barcode 
+            ON stock_movements (barcode, movement_date)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_stock_movements_date 
+            ON stock_movements (movement_date)
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                snapshot_date TEXT,
+                last_movement_id INTEGER
+            )
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_stock_snapshots_date 
+            ON stock_snapshots (snapshot_date)
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_snapshot_items (
+                snapshot_id INTEGER,
+                barcode TEXT,
+                quantity INTEGER,
+                PRIMARY KEY (snapshot_id, barcode)
+            )
+        ''')
+        
+        self.conn.commit()
+        
+        if needs_backfill:
+            self.bestsellers.rebuild()
+    
+    def get_next_barcode(self):
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT MAX(CAST(barcode AS INTEGER)) FROM products WHERE LENGTH(barcode) = 4')
+        result = cursor.fetchone()[0]
+        if result:
+            return str(int(result) + 1).zfill(4)
+        return '1001'
+    
+    def reserve_barcodes(self, count):
+        # Next `count` numeric barcodes after the highest one in use or already handed out
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT MAX(CAST(barcode AS INTEGER)) FROM products WHERE barcode NOT GLOB '*[^0-9]*'")
+        start = max(cursor.fetchone()[0] or 1000, self.last_reserved_barcode) + 1
+        self.last_reserved_barcode = start + count - 1
+        return [str(number).zfill(4) for number in range(start, start + count)]
+    
+    def insert_products(self, rows, reason='import'):
+        # Bulk insert without committing, the caller decides the transaction size
+        cursor = self.conn.cursor()
+        cursor.executemany('''
+            INSERT INTO products (barcode, name, category, size, color, cost_price, 
+                                selling_price, stock_quantity, min_stock_level, 
+                                date_added, last_updated)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        cursor.executemany('''
+            INSERT INTO stock_movements (barcode, change, reason, reference_id, movement_date)
+            VALUES (?, ?, ?, NULL, ?)
+        ''', [(row[0], row[7], reason, row[9]) for row in rows if row[7]])
+    
+    def record_movement(self, cursor, barcode, change, reason, reference_id=None, when=None):
+        if change:
+            cursor.execute('''
+                INSERT INTO stock_movements (barcode, change, reason, reference_id, movement_date)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (barcode, change, reason, reference_id, when or timestamp()))
+    
+    def add_product(self, data):
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute('''
+                INSERT INTO products (barcode, name, category, size, color, cost_price, 
+                                    selling_price, stock_quantity, min_stock_level, 
+                                    date_added, last_updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', data)
+            self.record_movement(cursor, data[0], data[7], 'create', None, data[9])
+            self.commit()
+            return True
+        except sqlite3.IntegrityError:
+            self.conn.rollback()
+            return False
+    
+    def update_product(self, barcode, data):
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT stock_quantity FROM products WHERE barcode=?', (barcode,))
+        row = cursor.fetchone()
+        if row:
+            self.record_movement(cursor, barcode, data[6] - row[0], 'adjust', None, data[8])
+        cursor.execute('''
+            UPDATE products 
+            SET name=?, category=?, size=?, color=?, cost_price=?, 
+                selling_price=?, stock_quantity=?, min_stock_level=?, last_updated=?
+            WHERE barcode=?
+        ''', (*data, barcode))
+        self.commit()
+    
+    def apply_stock_counts(self, counts):
+        # counts: (barcode, counted) pairs, all applied in one transaction
+        cursor = self.conn.cursor()
+        now = timestamp()
+        counts = list(counts)
+        cursor.executemany('''
+            INSERT INTO stock_movements (barcode, change, reason, reference_id, movement_date)
+            SELECT barcode, ? - stock_quantity, 'stocktake', NULL, ? 
+            FROM products WHERE barcode = ? AND stock_quantity != ?
+        ''', [(counted, now, barcode, counted) for barcode, counted in counts])
+        cursor.executemany('''
+            UPDATE products SET stock_quantity = ?, last_updated = ? 
+            WHERE barcode = ?
+        ''', [(counted, now, barcode) for barcode, counted in counts])
+        self.commit()
+    
+    def delete_product(self, barcode):
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT stock_quantity FROM products WHERE barcode=?', (barcode,))
+        row = cursor.fetchone()
+        if row:
+            self.record_movement(cursor, barcode, -row[0], 'delete')
+        cursor.execute('DELETE FROM products WHERE barcode=?', (barcode,))
+        self.commit()
+    
+    def get_product(self, barcode):
+        return self.fetch_one(Product, 'SELECT * FROM products WHERE barcode=?', (barcode,))
+    
+    def get_all_products(self):
+        return self.fetch_all(Product, 'SELECT * FROM products ORDER BY last_updated DESC')
+    
+    def search_products(self, query):
+        return self.fetch_all(Product, '''
+            SELECT * FROM products 
+            WHERE name LIKE ? OR barcode LIKE ? OR category LIKE ?
+        ''', (f'%{query}%', f'%{query}%', f'%{query}%'))
+    
+    def add_sale(self, data):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            INSERT INTO sales (barcode, product_name, quantity, original_price, 
+                             discount_price, final_price, sale_date)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', data)
+        self.record_movement(cursor, data[0], -data[2], 'sale', cursor.lastrowid, data[6])
+        
+        # Update stock
+        cursor.execute('''
+            UPDATE products SET stock_quantity = stock_quantity - ? 
+            WHERE barcode = ?
+        ''', (data[2], data[0]))
+        self.commit()
+    
+    def add_return(self, data):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            INSERT INTO returns (barcode, product_name, quantity, reason, return_date, sale_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', data)
+        self.record_movement(cursor, data[0], data[2], 'return', cursor.lastrowid, data[4])
+        
+        # Update stock
+        cursor.execute('''
+            UPDATE products SET stock_quantity = stock_quantity + ? 
+            WHERE barcode = ?
+        ''', (data[2], data[0]))
+        self.commit()
+    
+    def add_exchange(self, data):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            INSERT INTO exchanges (old_barcode, new_barcode, old_product, new_product, exchange_date)
+            VALUES (?, ?, ?, ?, ?)
+        ''', data)
+        exchange_id = cursor.lastrowid
+        self.record_movement(cursor, data[0], 1, 'exchange', exchange_id, data[4])
+        self.record_movement(cursor, data[1], -1, 'exchange', exchange_id, data[4])
+        
+        # Update stocks
+        cursor.execute('UPDATE products SET stock_quantity = stock_quantity + 1 WHERE barcode = ?', (data[0],))
+        cursor.execute('UPDATE products SET stock_quantity = stock_quantity - 1 WHERE barcode = ?', (data[1],))
+        self.commit()
+    
+    # Report queries
+    def get_low_stock_products(self):
+        return self.fetch_all(Product, '''
+            SELECT * FROM products 
+            WHERE stock_quantity <= min_stock_level 
+            ORDER BY stock_quantity ASC
+        ''')
+    
+    def get_recent_sales(self, limit=50):
+        return self.fetch_all(Sale, 'SELECT * FROM sales ORDER BY sale_date DESC LIMIT ?', (limit,))
+    
+    def get_revenue_summary(self):
+        cursor = self.conn.cursor()
+        
+        # Today's sales
+        cursor.execute('''
+            SELECT SUM(final_price) FROM sales 
+            WHERE DATE(sale_date) = DATE('now')
+        ''')
+        today_revenue = cursor.fetchone()[0] or 0
+        
+        # This month's sales
+        cursor.execute('''
+            SELECT SUM(final_price) FROM sales 
+            WHERE strftime('%Y-%m', sale_date) = strftime('%Y-%m', 'now')
+        ''')
+        month_revenue = cursor.fetchone()[0] or 0
+        
+        # Total sales
+        cursor.execute('SELECT SUM(final_price) FROM sales')
+        total_revenue = cursor.fetchone()[0] or 0
+        
+        # Total products sold
+        cursor.execute('SELECT SUM(quantity) FROM sales')
+        total_items = cursor.fetchone()[0] or 0
+        
+        return today_revenue, month_revenue, total_revenue, total_items
+    
+    def get_top_selling_products(self, limit=10, period='all', category=None):
+        # (name, quantity, revenue) rows, read from the bestseller counters
+        return [row[1:] for row in self.bestsellers.top(period, k=limit, category=category)]
+    
+    def get_returns(self):
+        return self.fetch_all(Return, 'SELECT * FROM returns ORDER BY return_date DESC')
+    
+    def get_exchanges(self):
+        return self.fetch_all(Exchange, 'SELECT * FROM exchanges ORDER BY exchange_date DESC')
+    
+    def add_sales(self, rows, receipt=None):
+        # A whole cart in one transaction, each line keeps its sale id in the ledger.
+        # The receipt (see receipts.Receipt) is stored in the same transaction with
+        # those sale ids; returns its id, None without one.
+        cursor = self.conn.cursor()
+        sale_ids = []
+        for row in rows:
+            cursor.execute('''
+                INSERT INTO sales (barcode, product_name, quantity, original_price, 
+                                 discount_price, final_price, sale_date, promotion_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', row)
+            sale_ids.append(cursor.lastrowid)
+            self.record_movement(cursor, row[0], -row[2], 'sale', cursor.lastrowid, row[6])
+        
+        # Update stock
+        cursor.executemany('''
+            UPDATE products SET stock_quantity = stock_quantity - ? 
+            WHERE barcode = ?
+        ''', [(row[2], row[0]) for row in rows])
+        
+        receipt_id = None
+        if receipt is not None:
+            cursor.execute('''
+                INSERT INTO receipts (receipt_date, total, payload, sale_ids) VALUES (?, ?, ?, ?)
+            ''', (receipt.receipt_date, receipt.total, receipt.to_payload(), ','.join(map(str, sale_ids))))
+            receipt_id = cursor.lastrowid
+        self.commit()
+        return receipt_id
+    
+    # Point-in-time stock
+    def take_snapshot(self):
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT MAX(id) FROM stock_movements')
+        last_movement_id = cursor.fetchone()[0] or 0
+        cursor.execute('INSERT INTO stock_snapshots (snapshot_date, last_movement_id) VALUES (?, ?)', 
+                       (timestamp(), last_movement_id))
+        cursor.execute('''
+            INSERT INTO stock_snapshot_items (snapshot_id, barcode, quantity)
+            SELECT ?, barcode, stock_quantity FROM products
+        ''', (cursor.lastrowid,))
+        self.conn.commit()
+        self.snapshot_due = snapshot_due(timestamp())
+    
+    def maybe_snapshot(self):
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT MAX(snapshot_date) FROM stock_snapshots')
+        latest = cursor.fetchone()[0]
+        if latest is None or snapshot_due(latest) <= timestamp():
+            self.take_snapshot()
+        else:
+            self.snapshot_due = snapshot_due(latest)
+    
+    def history_start(self):
+        # Time of the first snapshot; the ledger knows nothing about stock before it
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT MIN(snapshot_date) FROM stock_snapshots')
+        return cursor.fetchone()[0]
+    
+    def stock_on(self, when, barcode=None):
+        # {barcode: quantity on hand at `when`}; a bare date means the end of that day.
+        # Starts from the nearest snapshot and adds only the movements between it
+        # and `when`. Raises InventoryError for a time before the first snapshot.
+        if len(when) == 10:
+            when += ' 23:59:59'
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT id, last_movement_id FROM stock_snapshots 
+            WHERE snapshot_date <= ? ORDER BY snapshot_date DESC LIMIT 1
+        ''', (when,))
+        snapshot = cursor.fetchone()
+        if snapshot is None:
+            raise InventoryError(f"No stock history before {self.history_start()}")
+        
+        barcode_filter = ' AND barcode = ?' if barcode is not None else ''
+        params = [snapshot[0]] + ([barcode] if barcode is not None else [])
+        params += [snapshot[1], when] + ([barcode] if barcode is not None else [])
+        cursor.execute(f'''
+            SELECT barcode, SUM(quantity) FROM (
+                SELECT barcode, quantity FROM stock_snapshot_items 
+                WHERE snapshot_id = ?{barcode_filter}
+                UNION ALL
+                SELECT barcode, change FROM stock_movements 
+                WHERE id > ? AND movement_date <= ?{barcode_filter}
+            ) GROUP BY barcode
+        ''', params)
+        return dict(cursor.fetchall())
+
+
+class BestsellerTracker:
+    # Period name -> SQL expression turning a date column into that period's key.
+    # Python's strftime gives the same keys, see period_key()
+    PERIODS = {
+        'day': "date({0})",
+        'week': "strftime('%Y-W%W', {0})",
+        'month': "strftime('%Y-%m', {0})",
+        'all': "''",
+    }
+    
+    # (trigger name, table, [(barcode, quantity change, revenue change, date)])
+    # Quantities are net of returns and exchanges, revenue is what the till took
+    TRIGGERS = [
+        ('trg_counters_sale', 'sales', 
+         [('NEW.barcode', 'NEW.quantity', 'NEW.final_price', 'NEW.sale_date')]),
+        ('trg_counters_return', 'returns', 
+         [('NEW.barcode', '-NEW.quantity', '0', 'NEW.return_date')]),
+        ('trg_counters_exchange', 'exchanges', 
+         [('NEW.old_barcode', '-1', '0', 'NEW.exchange_date'), 
+          ('NEW.new_barcode', '1', '0', 'NEW.exchange_date')]),
+    ]
+    
+    def __init__(self, db):
+        self.db = db
+    
+    @classmethod
+    def trigger_sql(cls, name, table, rows):
+        statements = []
+        for barcode, quantity, revenue, date in rows:
+            for period, key in cls.PERIODS.items():
+                statements.append(f'''
+                INSERT INTO sales_counters (period, period_key, barcode, quantity, revenue)
+                VALUES ('{period}', {key.format(date)}, {barcode}, {quantity}, {revenue})
+                ON CONFLICT (period, period_key, barcode) DO UPDATE SET 
+                    quantity = quantity + excluded.quantity, 
+                    revenue = revenue + excluded.revenue;''')
+        return f'''
+            CREATE TRIGGER IF NOT EXISTS {name} AFTER INSERT ON {table}
+            BEGIN{''.join(statements)}
+            END
+        '''
+    
+    @staticmethod
+    def period_key(period, when=None):
+        when = when or datetime.datetime.now()
+        if period == 'day':
+            return when.strftime('%Y-%m-%d')
+        if period == 'week':
+            return when.strftime('%Y-W%W')
+        if period == 'month':
+            return when.strftime('%Y-%m')
+        if period == 'all':
+            return ''
+        raise ValueError(f"Unknown period: {period}")
+    
+    def top(self, period='all', when=None, k=10, category=None):
+        # (barcode, name, quantity, revenue) for the k bestsellers of the period containing `when`
+        sql = '''
+            SELECT c.barcode, COALESCE(p.name, c.barcode), c.quantity, c.revenue
+            FROM sales_counters c LEFT JOIN products p ON p.barcode = c.barcode
+            WHERE c.period = ? AND c.period_key = ?
+        '''
+        params = [period, self.period_key(period, when)]
+        if category is not None:
+            sql += ' AND p.category = ?'
+            params.append(category)
+        sql += ' ORDER BY c.quantity DESC LIMIT ?'
+        params.append(k)
+        
+        cursor = self.db.conn.cursor()
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+    
+    def rebuild(self):
+        # Recount everything from the history tables, used once when the counters are created
+        movements = ' UNION ALL '.join(
+            f"SELECT {barcode} AS barcode, {quantity} AS quantity, {revenue} AS revenue, "
+            f"{date} AS moved FROM {table}"
+            for name, table, rows in self.TRIGGERS
+            for barcode, quantity, revenue, date in rows
+        ).replace('NEW.', '')
+        
+        cursor = self.db.conn.cursor()
+        cursor.execute('DELETE FROM sales_counters')
+        for period, key in self.PERIODS.items():
+            cursor.execute(f'''
+                INSERT INTO sales_counters (period, period_key, barcode, quantity, revenue)
+                SELECT '{period}', {key.format('moved')}, barcode, SUM(quantity), SUM(revenue)
+                FROM ({movements})
+                GROUP BY 2, 3
+            ''')
+        self.db.conn.commit()
+
+
+class LowStockMonitor:
+    # Keeps the set of low stock products up to date from low_stock_events
+    # and tells subscribers what changed, so nobody has to rescan products
+    def __init__(self, db):
+        self.db = db
+        self.items = {}  # barcode -> (stock_quantity, min_stock_level)
+        self.listeners = []
+        self.last_event_id = 0
+        self.reload()
+    
+    def reload(self):
+        cursor = self.db.conn.cursor()
+        cursor.execute('SELECT MAX(id) FROM low_stock_events')
+        self.last_event_id = cursor.fetchone()[0] or 0
+        cursor.execute('''
+            SELECT barcode, stock_quantity, min_stock_level FROM products 
+            WHERE stock_quantity <= min_stock_level
+        ''')
+        self.items = {barcode: (stock, min_level) for barcode, stock, min_level in cursor.fetchall()}
+    
+    @property
+    def count(self):
+        return len(self.items)
+    
+    def subscribe(self, callback):
+        # callback(monitor, changes) where changes maps barcode -> (stock, min) or None when cleared
+        self.listeners.append(callback)
+        return lambda: self.listeners.remove(callback)
+    
+    def poll(self):
+        cursor = self.db.conn.cursor()
+        cursor.execute('''
+            SELECT id, barcode, event, stock_quantity, min_stock_level 
+            FROM low_stock_events WHERE id > ? ORDER BY id
+        ''', (self.last_event_id,))
+        events = cursor.fetchall()
+        if not events:
+            return {}
+        
+        changes = {}
+        for event_id, barcode, event, stock, min_level in events:
+            if event == 'low':
+                self.items[barcode] = changes[barcode] = (stock, min_level)
+            else:
+                self.items.pop(barcode, None)
+                changes[barcode] = None
+            self.last_event_id = event_id
+        
+        for callback in list(self.listeners):
+            callback(self, changes)
+        return changes
+
+
+def load_product_cache(db_path):
+    # Runs off the UI thread, so it opens a private connection
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.execute('SELECT * FROM products')
+        cursor.row_factory = record_factory(Product, cursor.description)
+        return {product.barcode: product for product in cursor}
+    finally:
+        conn.close()
+
+
+# Sale, return and exchange rules shared by the POS and any script using the database
+
+def checkout(db, lines, receipt=None):
+    # lines: (barcode, product_name, quantity, original_price, discount_price, final_price
+    #         [, promotion_id])
+    # A receipt is stored with the sale, dated like it, and gets its receipt_id
+    if not lines:
+        raise InventoryError("Cart is empty!")
+    
+    sale_date = timestamp()
+    rows = [(*line[:6], sale_date, line[6] if len(line) > 6 else None) for line in lines]
+    if receipt is not None:
+        receipt.receipt_date = sale_date
+    receipt_id = db.add_sales(rows, receipt)
+    if receipt is not None:
+        receipt.receipt_id = receipt_id
+    return sum(line[5] for line in lines)
+
+
+def process_return(db, barcode, quantity, reason, sale_id=None):
+    if not barcode or quantity <= 0 or not reason:
+        raise InventoryError("Please fill all fields correctly!")
+    
+    product = db.get_product(barcode)
+    if not product:
+        raise InventoryError("Product not found!")
+    
+    db.add_return((
+        barcode,
+        product.name,
+        quantity,
+        reason,
+        timestamp(),
+        sale_id
+    ))
+    return product
+
+
+def process_exchange(db, old_barcode, new_barcode):
+    if not old_barcode or not new_barcode:
+        raise InventoryError("Please enter both barcodes!")
+    
+    old_product = db.get_product(old_barcode)
+    new_product = db.get_product(new_barcode)
+    
+    if not old_product or not new_product:
+        raise InventoryError("One or both products not found!")
+    
+    if new_product.stock_quantity <= 0:
+        raise InventoryError("New product out of stock!")
+    
+    db.add_exchange((
+        old_barcode,
+        new_barcode,
+        old_product.name,
+        new_product.name,
+        timestamp()
+    ))
+    return old_product, new_product
@@ -1,183 +1,34 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
-import sqlite3
-import barcode
-from barcode.writer import ImageWriter
-from PIL import Image, ImageTk, ImageDraw, ImageFont
+from tkinter import ttk, messagebox, filedialog, simpledialog
 import io
+import csv
 import datetime
 import os
 from pathlib import Path
 import json
+import queue
+import threading
+from inventory_core import InventoryDatabase, InventoryError
+import inventory_core
+import product_import
+import forecasting
+import promotions
+from stocktake import StockTakeSession
+from backup import BackupManager
+from receipts import Receipt, ReceiptSpooler
 
-class InventoryDatabase:
-    def __init__(self):
-        self.conn = sqlite3.connect('garments_inventory.db')
-        self.create_tables()
-    
-    def create_tables(self):
-        cursor = self.conn.cursor()
-        
-        # Products table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS products (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                barcode TEXT UNIQUE NOT NULL,
-                name TEXT NOT NULL,
-                category TEXT,
-                size TEXT,
-                color TEXT,
-                cost_price REAL,
-                selling_price REAL,
-                stock_quantity INTEGER DEFAULT 0,
-                min_stock_level INTEGER DEFAULT 5,
-                date_added TEXT,
-                last_updated TEXT
-            )
-        ''')
-        
-        # Sales table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS sales (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                barcode TEXT,
-                product_name TEXT,
-                quantity INTEGER,
-                original_price REAL,
-                discount_price REAL,
-                final_price REAL,
-                sale_date TEXT,
-                FOREIGN KEY (barcode) REFERENCES products (barcode)
-            )
-        ''')
-        
-        # Returns table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS returns (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                barcode TEXT,
-                product_name TEXT,
-                quantity INTEGER,
-                reason TEXT,
-                return_date TEXT,
-                sale_id INTEGER,
-                FOREIGN KEY (barcode) REFERENCES products (barcode)
-            )
-        ''')
-        
-        # Exchanges table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS exchanges (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                old_barcode TEXT,
-                new_barcode TEXT,
-                old_product TEXT,
-                new_product TEXT,
-                exchange_date TEXT
-            )
-        ''')
-        
-        self.conn.commit()
-    
-    def get_next_barcode(self):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT MAX(CAST(barcode AS INTEGER)) FROM products WHERE LENGTH(barcode) = 4')
-        result = cursor.fetchone()[0]
-        if result:
-            return str(int(result) + 1).zfill(4)
-        return '1001'
-    
-    def add_product(self, data):
-        cursor = self.conn.cursor()
-        try:
-            cursor.execute('''
-                INSERT INTO products (barcode, name, category, size, color, cost_price, 
-                                    selling_price, stock_quantity, min_stock_level, 
-                                    date_added, last_updated)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', data)
-            self.conn.commit()
-            return True
-        except sqlite3.IntegrityError:
-            return False
-    
-    def update_product(self, barcode, data):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            UPDATE products 
-            SET name=?, category=?, size=?, color=?, cost_price=?, 
-                selling_price=?, stock_quantity=?, min_stock_level=?, last_updated=?
-            WHERE barcode=?
-        ''', (*data, barcode))
-        self.conn.commit()
-    
-    def delete_product(self, barcode):
-        cursor = self.conn.cursor()
-        cursor.execute('DELETE FROM products WHERE barcode=?', (barcode,))
-        self.conn.commit()
-    
-    def get_product(self, barcode):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM products WHERE barcode=?', (barcode,))
-        return cursor.fetchone()
-    
-    def get_all_products(self):
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM products ORDER BY last_updated DESC')
-        return cursor.fetchall()
-    
-    def search_products(self, query):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT * FROM products 
-            WHERE name LIKE ? OR barcode LIKE ? OR category LIKE ?
-        ''', (f'%{query}%', f'%{query}%', f'%{query}%'))
-        return cursor.fetchall()
-    
-    def add_sale(self, data):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            INSERT INTO sales (barcode, product_name, quantity, original_price, 
-                             discount_price, final_price, sale_date)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', data)
-        
-        # Update stock
-        cursor.execute('''
-            UPDATE products SET stock_quantity = stock_quantity - ? 
-            WHERE barcode = ?
-        ''', (data[2], data[0]))
-        self.conn.commit()
-    
-    def add_return(self, data):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            INSERT INTO returns (barcode, product_name, quantity, reason, return_date, sale_id)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', data)
-        
-        # Update stock
-        cursor.execute('''
-            UPDATE products SET stock_quantity = stock_quantity + ? 
-            WHERE barcode = ?
-        ''', (data[2], data[0]))
-        self.conn.commit()
-    
-    def add_exchange(self, data):
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            INSERT INTO exchanges (old_barcode, new_barcode, old_product, new_product, exchange_date)
-            VALUES (?, ?, ?, ?, ?)
-        ''', data)
-        
-        # Update stocks
-        cursor.execute('UPDATE products SET stock_quantity = stock_quantity + 1 WHERE barcode = ?', (data[0],))
-        cursor.execute('UPDATE products SET stock_quantity = stock_quantity - 1 WHERE barcode = ?', (data[1],))
-        self.conn.commit()
+# Product fields shown in the inventory table, in column order
+PRODUCT_TABLE_FIELDS = ('barcode', 'name', 'category', 'size', 'color', 'cost_price', 
+                        'selling_price', 'stock_quantity', 'min_stock_level')
 
 class BarcodeGenerator:
     @staticmethod
     def generate_barcode(code, product_name, price):
+        # Imaging libraries are only needed once a label is printed, keep them off the startup path
+        import barcode
+        from barcode.writer import ImageWriter
+        from PIL import Image, ImageDraw, ImageFont
+        
         # Generate barcode image
         EAN = barcode.get_barcode_class('code128')
         ean = EAN(code, writer=ImageWriter())
@@ -228,18 +79,79 @@ class InventoryManagementSystem:
         
         self.db = InventoryDatabase()
         self.current_scan = ""
+        self.current_report = None
+        
+        # barcode -> product row, filled in the background for the POS
+        self.product_cache = {}
+        self.cache_queue = queue.Queue()
+        self.cache_invalidated = None  # barcodes changed while the preload runs
+        self.cache_cleared = False     # the whole cache was dropped while it ran
+        
+        self.promotions = promotions.PromotionEngine(self.db)
+        self.cart = promotions.Cart(self.promotions)
+        self.receipts = ReceiptSpooler(self.db.db_path)
         
         # Style configuration
         self.style = ttk.Style()
         self.style.theme_use('clam')
         self.configure_styles()
         
+        self.backups = BackupManager(self.db.db_path)
+        
         self.create_widgets()
-        self.load_products()
+        self.preload_product_cache()
+        # First check shortly after start-up, then every few minutes
+        self.root.after(60 * 1000, self.scheduled_backup)
         
         # Bind barcode scanner input
         self.root.bind('<Key>', self.on_barcode_scan)
     
+    def preload_product_cache(self):
+        # The loader uses its own connection, sqlite3 connections stay on the thread that made them
+        self.cache_invalidated = set()
+        self.cache_cleared = False
+        threading.Thread(target=lambda: self.cache_queue.put(
+            inventory_core.load_product_cache(self.db.db_path)), daemon=True).start()
+        self.root.after(100, self.poll_product_cache)
+    
+    def poll_product_cache(self):
+        try:
+            products = self.cache_queue.get_nowait()
+        except queue.Empty:
+            self.root.after(100, self.poll_product_cache)
+            return
+        invalidated, self.cache_invalidated = self.cache_invalidated, None
+        if self.cache_cleared:
+            # Any row may have been read before the change, load them all again
+            self.preload_product_cache()
+            return
+        # The loader may have read these before they changed
+        for barcode in invalidated:
+            products.pop(barcode, None)
+        # Rows looked up while loading are at least as fresh as the preload
+        products.update(self.product_cache)
+        self.product_cache = products
+    
+    def lookup_product(self, barcode):
+        barcode = str(barcode)
+        product = self.product_cache.get(barcode)
+        if product is None:
+            product = self.db.get_product(barcode)
+            if product:
+                self.product_cache[barcode] = product
+        return product
+    
+    def invalidate_products(self, *barcodes):
+        for barcode in barcodes:
+            self.product_cache.pop(str(barcode), None)
+            if self.cache_invalidated is not None:
+                self.cache_invalidated.add(str(barcode))
+    
+    def clear_product_cache(self):
+        self.product_cache.clear()
+        if self.cache_invalidated is not None:
+            self.cache_cleared = True
+    
     def configure_styles(self):
         # Configure custom styles
         self.style.configure('TNotebook', background='#1a1a2e', borderwidth=0)
@@ -268,20 +180,50 @@ class InventoryManagementSystem:
         tk.Label(header, text="🏪 GARMENTS INVENTORY SYSTEM", 
                 font=('Arial', 24, 'bold'), bg='#0f3460', fg='#00d4ff').pack(pady=20)
         
+        # Low stock badge, kept current by the database's low stock monitor
+        self.low_stock_badge = tk.Label(header, text="", font=('Arial', 12, 'bold'), 
+                                        bg='#0f3460', fg='#ff4757', cursor='hand2')
+        self.low_stock_badge.place(relx=1.0, rely=0.5, anchor='e', x=-20)
+        self.low_stock_badge.bind('<Button-1>', lambda e: self.open_low_stock_report())
+        self.update_low_stock_badge()
+        self.db.low_stock.subscribe(self.on_low_stock_changed)
+        
+        # Backup status, updated while a backup runs in the background
+        self.backup_label = tk.Label(header, text="", font=('Arial', 10), 
+                                     bg='#0f3460', fg='#a4b0be')
+        self.backup_label.place(relx=0.0, rely=0.5, anchor='w', x=20)
+        self.update_backup_label()
+        
         # Notebook for tabs
         self.notebook = ttk.Notebook(main_container)
         self.notebook.pack(fill='both', expand=True)
         
-        # Create tabs
-        self.create_inventory_tab()
-        self.create_pos_tab()
-        self.create_returns_tab()
-        self.create_exchange_tab()
-        self.create_reports_tab()
+        # Create tabs, their contents are built the first time they are selected
+        self.tab_builders = {}
+        self.built_tabs = set()
+        tabs = [
+            ('inventory', '📦 Inventory', self.create_inventory_tab),
+            ('pos', '💰 Point of Sale', self.create_pos_tab),
+            ('returns', '↩️ Returns', self.create_returns_tab),
+            ('exchange', '🔄 Exchange', self.create_exchange_tab),
+            ('reports', '📊 Reports', self.create_reports_tab)
+        ]
+        for key, text, builder in tabs:
+            tab = tk.Frame(self.notebook, bg='#1a1a2e')
+            self.notebook.add(tab, text=text)
+            self.tab_builders[str(tab)] = (key, tab, builder)
+        
+        self.notebook.bind('<<NotebookTabChanged>>', self.on_tab_changed)
+        # Build the first tab once the window is on screen
+        self.root.after_idle(self.on_tab_changed)
+    
+    def on_tab_changed(self, event=None):
+        key, tab, builder = self.tab_builders[self.notebook.select()]
+        if key not in self.built_tabs:
+            self.built_tabs.add(key)
+            builder(tab)
     
-    def create_inventory_tab(self):
-        tab = tk.Frame(self.notebook, bg='#1a1a2e')
-        self.notebook.add(tab, text='📦 Inventory')
+    def create_inventory_tab(self, tab):
         
         # Top controls
         controls = tk.Frame(tab, bg='#1a1a2e')
@@ -310,6 +252,10 @@ class InventoryManagementSystem:
                  **btn_style).pack(side='left', padx=5)
         tk.Button(controls, text="🖨️ Print Barcode", command=self.print_barcode, 
                  **btn_style).pack(side='left', padx=5)
+        tk.Button(controls, text="📥 Import", command=self.import_products, 
+                 **btn_style).pack(side='left', padx=5)
+        tk.Button(controls, text="📋 Stock Take", command=self.stock_take_dialog, 
+                 **btn_style).pack(side='left', padx=5)
         tk.Button(controls, text="🔄 Refresh", command=self.load_products, 
                  **btn_style).pack(side='left', padx=5)
         
@@ -342,10 +288,10 @@ class InventoryManagementSystem:
         scrollbar_x.pack(side='bottom', fill='x')
         
         self.products_tree.bind('<Double-1>', lambda e: self.edit_product_dialog())
+        
+        self.load_products()
     
-    def create_pos_tab(self):
-        tab = tk.Frame(self.notebook, bg='#1a1a2e')
-        self.notebook.add(tab, text='💰 Point of Sale')
+    def create_pos_tab(self, tab):
         
         # Left panel - Cart
         left_panel = tk.Frame(tab, bg='#1a1a2e')
@@ -359,10 +305,10 @@ class InventoryManagementSystem:
         cart_frame.pack(fill='both', expand=True)
         
         self.cart_tree = ttk.Treeview(cart_frame, columns=(
-            'Barcode', 'Product', 'Qty', 'Price', 'Discount', 'Total'
+            'Barcode', 'Product', 'Qty', 'Price', 'Discount', 'Total', 'Offer'
         ), show='headings', height=15)
         
-        for col in ['Barcode', 'Product', 'Qty', 'Price', 'Discount', 'Total']:
+        for col in ['Barcode', 'Product', 'Qty', 'Price', 'Discount', 'Total', 'Offer']:
             self.cart_tree.heading(col, text=col)
             self.cart_tree.column(col, width=120)
         
@@ -410,6 +356,8 @@ class InventoryManagementSystem:
         
         tk.Button(right_panel, text="Apply Discount", command=self.apply_discount, 
                  **btn_style).pack(pady=5, padx=20, fill='x')
+        tk.Button(right_panel, text="🏷️ Promotions", command=self.promotions_dialog, 
+                 **btn_style).pack(pady=5, padx=20, fill='x')
         
         # Totals
         totals_frame = tk.Frame(right_panel, bg='#0f3460')
@@ -435,10 +383,10 @@ class InventoryManagementSystem:
         
         tk.Button(right_panel, text="🗑️ Clear Cart", command=self.clear_cart, 
                  **btn_style).pack(pady=5, padx=20, fill='x')
+        tk.Button(right_panel, text="🧾 Reprint Receipt", command=self.reprint_receipt, 
+                 **btn_style).pack(pady=5, padx=20, fill='x')
     
-    def create_returns_tab(self):
-        tab = tk.Frame(self.notebook, bg='#1a1a2e')
-        self.notebook.add(tab, text='↩️ Returns')
+    def create_returns_tab(self, tab):
         
         # Controls
         controls = tk.Frame(tab, bg='#16213e')
@@ -498,9 +446,7 @@ class InventoryManagementSystem:
         
         self.load_returns()
     
-    def create_exchange_tab(self):
-        tab = tk.Frame(self.notebook, bg='#1a1a2e')
-        self.notebook.add(tab, text='🔄 Exchange')
+    def create_exchange_tab(self, tab):
         
         # Controls
         controls = tk.Frame(tab, bg='#16213e')
@@ -571,9 +517,7 @@ class InventoryManagementSystem:
         
         self.load_exchanges()
     
-    def create_reports_tab(self):
-        tab = tk.Frame(self.notebook, bg='#1a1a2e')
-        self.notebook.add(tab, text='📊 Reports')
+    def create_reports_tab(self, tab):
         
         # Report buttons
         btn_frame = tk.Frame(tab, bg='#1a1a2e')
@@ -585,12 +529,22 @@ class InventoryManagementSystem:
         
         tk.Button(btn_frame, text="📦 Stock Report", command=self.show_stock_report, 
                  **btn_style).pack(pady=10, fill='x', padx=50)
+        tk.Button(btn_frame, text="📅 Stock On Date", command=self.show_stock_on_date, 
+                 **btn_style).pack(pady=10, fill='x', padx=50)
         tk.Button(btn_frame, text="⚠️ Low Stock Alert", command=self.show_low_stock, 
                  **btn_style).pack(pady=10, fill='x', padx=50)
+        tk.Button(btn_frame, text="📤 Export Reorder List", command=self.export_reorder_list, 
+                 **btn_style).pack(pady=10, fill='x', padx=50)
+        tk.Button(btn_frame, text="🔮 Forecast Reorder Levels", command=self.show_forecast, 
+                 **btn_style).pack(pady=10, fill='x', padx=50)
         tk.Button(btn_frame, text="💰 Sales Report", command=self.show_sales_report, 
                  **btn_style).pack(pady=10, fill='x', padx=50)
         tk.Button(btn_frame, text="📈 Revenue Analysis", command=self.show_revenue_analysis, 
                  **btn_style).pack(pady=10, fill='x', padx=50)
+        tk.Button(btn_frame, text="🩺 Query Diagnostics", command=self.show_diagnostics, 
+                 **btn_style).pack(pady=10, fill='x', padx=50)
+        tk.Button(btn_frame, text="💾 Backup Now", command=self.backup_now, 
+                 **btn_style).pack(pady=10, fill='x', padx=50)
         
         # Report display area
         self.report_text = tk.Text(tab, font=('Courier', 10), bg='#16213e', 
@@ -744,6 +698,7 @@ class InventoryManagementSystem:
                 )
                 
                 self.db.update_product(barcode, data)
+                self.invalidate_products(barcode)
                 messagebox.showinfo("Success", "Product updated successfully!")
                 self.load_products()
                 dialog.destroy()
@@ -763,6 +718,251 @@ class InventoryManagementSystem:
                  bg='#0f3460', fg='white', activebackground='#ff4757', 
                  **btn_style).pack(side='left', padx=10)
     
+    def import_products(self):
+        filename = filedialog.askopenfilename(
+            title="Import Products",
+            filetypes=[("Product files", "*.csv *.json *.jsonl"), ("CSV files", "*.csv"), 
+                       ("JSON files", "*.json *.jsonl"), ("All files", "*.*")]
+        )
+        if not filename:
+            return
+        
+        self.root.config(cursor='watch')
+        self.root.update_idletasks()
+        try:
+            result = product_import.import_products(self.db, filename)
+        except Exception as e:
+            messagebox.showerror("Error", f"Import failed: {str(e)}")
+            return
+        finally:
+            self.root.config(cursor='')
+        
+        message = f"Imported {result.imported} products in {result.seconds:.1f} seconds."
+        if result.rejected:
+            message += f"\n\n{result.rejected} rows were rejected, see:\n{result.reject_path}"
+        messagebox.showinfo("Import Complete", message)
+        self.load_products()
+    
+    def promotions_dialog(self):
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Promotions")
+        dialog.geometry("950x650")
+        dialog.configure(bg='#16213e')
+        dialog.transient(self.root)
+        
+        tk.Label(dialog, text="Promotions", font=('Arial', 16, 'bold'), 
+                bg='#16213e', fg='#00d4ff').pack(pady=10)
+        
+        form = tk.Frame(dialog, bg='#16213e')
+        form.pack(pady=5, padx=20, fill='x')
+        
+        fields = {
+            'Name:': tk.StringVar(),
+            'Type:': tk.StringVar(value='percent'),
+            'Applies To:': tk.StringVar(value='category'),
+            'Barcode/Category/Size:': tk.StringVar(),
+            'Discount %:': tk.StringVar(value="10"),
+            'Buy Qty:': tk.StringVar(value="2"),
+            'Free Qty:': tk.StringVar(value="1"),
+            'Starts (YYYY-MM-DD):': tk.StringVar(),
+            'Ends (YYYY-MM-DD):': tk.StringVar(),
+        }
+        choices = {'Type:': promotions.KINDS, 'Applies To:': promotions.SCOPES}
+        
+        for i, (label, var) in enumerate(fields.items()):
+            row, col = divmod(i, 3)
+            tk.Label(form, text=label, bg='#16213e', fg='white', 
+                    font=('Arial', 10)).grid(row=row * 2, column=col, sticky='w', padx=5)
+            if label in choices:
+                ttk.Combobox(form, textvariable=var, values=choices[label], state='readonly', 
+                            width=22).grid(row=row * 2 + 1, column=col, padx=5, pady=(0, 8))
+            else:
+                tk.Entry(form, textvariable=var, font=('Arial', 10), bg='#0f3460', fg='white', 
+                        insertbackground='white', width=25).grid(row=row * 2 + 1, column=col, 
+                                                                 padx=5, pady=(0, 8))
+        
+        table_frame = tk.Frame(dialog, bg='#16213e')
+        table_frame.pack(fill='both', expand=True, padx=10, pady=10)
+        
+        columns = ('ID', 'Name', 'Type', 'Applies To', 'Target', 'Deal', 'Starts', 'Ends', 'Active')
+        tree = ttk.Treeview(table_frame, columns=columns, show='headings')
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=180 if col == 'Name' else 90)
+        
+        scrollbar = ttk.Scrollbar(table_frame, orient='vertical', command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        tree.pack(side='left', fill='both', expand=True)
+        scrollbar.pack(side='right', fill='y')
+        
+        def refresh():
+            tree.delete(*tree.get_children())
+            for (promo_id, name, kind, scope, target, percent, buy_qty, free_qty, 
+                 starts, ends, active) in self.promotions.all_promotions():
+                deal = f"{percent:g}% off" if kind == 'percent' else f"Buy {buy_qty} get {free_qty}"
+                tree.insert('', 'end', values=(promo_id, name, kind, scope, target or '', deal, 
+                                               starts or '', ends or '', "Yes" if active else "No"))
+        
+        def add():
+            try:
+                starts = fields['Starts (YYYY-MM-DD):'].get().strip()
+                ends = fields['Ends (YYYY-MM-DD):'].get().strip()
+                for value in (starts, ends):
+                    if value:
+                        datetime.datetime.strptime(value, '%Y-%m-%d')
+                self.promotions.add(
+                    fields['Name:'].get().strip(),
+                    fields['Type:'].get(),
+                    fields['Applies To:'].get(),
+                    fields['Barcode/Category/Size:'].get().strip(),
+                    float(fields['Discount %:'].get() or 0),
+                    int(fields['Buy Qty:'].get() or 0),
+                    int(fields['Free Qty:'].get() or 0),
+                    starts + ' 00:00:00' if starts else '',
+                    ends + ' 23:59:59' if ends else '',
+                )
+            except InventoryError as e:
+                messagebox.showerror("Error", str(e), parent=dialog)
+                return
+            except ValueError:
+                messagebox.showerror("Error", "Please enter valid numbers and dates!", parent=dialog)
+                return
+            refresh()
+        
+        def deactivate():
+            for item in tree.selection():
+                self.promotions.deactivate(tree.item(item)['values'][0])
+            refresh()
+        
+        btn_frame = tk.Frame(dialog, bg='#16213e')
+        btn_frame.pack(pady=10)
+        
+        btn_style = {'font': ('Arial', 11, 'bold'), 'bg': '#0f3460', 'fg': 'white', 
+                    'activebackground': '#00d4ff', 'activeforeground': 'black', 
+                    'relief': 'flat', 'cursor': 'hand2', 'padx': 20, 'pady': 8}
+        
+        tk.Button(btn_frame, text="➕ Add Promotion", command=add, **btn_style).pack(side='left', padx=5)
+        tk.Button(btn_frame, text="⏹️ Deactivate", command=deactivate, **btn_style).pack(side='left', padx=5)
+        tk.Button(btn_frame, text="❌ Close", command=dialog.destroy, **btn_style).pack(side='left', padx=5)
+        
+        refresh()
+    
+    def stock_take_dialog(self):
+        if StockTakeSession.exists():
+            if messagebox.askyesno("Stock Take", "A paused stock take was found.\n\nResume it?"):
+                session = StockTakeSession.load()
+            else:
+                StockTakeSession().discard()
+                session = StockTakeSession()
+        else:
+            session = StockTakeSession()
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Stock Take")
+        dialog.geometry("900x700")
+        dialog.configure(bg='#16213e')
+        dialog.transient(self.root)
+        
+        tk.Label(dialog, text=f"Stock Take (started {session.started})", font=('Arial', 16, 'bold'), 
+                bg='#16213e', fg='#00d4ff').pack(pady=10)
+        
+        scan_entry = tk.Entry(dialog, font=('Arial', 16), bg='#0f3460', fg='white', 
+                              insertbackground='white', justify='center')
+        scan_entry.pack(pady=10, padx=20, fill='x')
+        scan_entry.focus()
+        
+        status_label = tk.Label(dialog, text="", font=('Arial', 12), bg='#16213e', fg='white')
+        status_label.pack(pady=5)
+        
+        full_count_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(dialog, text="Full shop count (products not scanned count as zero)", 
+                      variable=full_count_var, bg='#16213e', fg='white', selectcolor='#0f3460', 
+                      activebackground='#16213e', font=('Arial', 10)).pack()
+        
+        table_frame = tk.Frame(dialog, bg='#16213e')
+        table_frame.pack(fill='both', expand=True, padx=10, pady=10)
+        
+        columns = ('Barcode', 'Product', 'System', 'Counted', 'Variance')
+        tree = ttk.Treeview(table_frame, columns=columns, show='headings')
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=250 if col == 'Product' else 110)
+        
+        scrollbar = ttk.Scrollbar(table_frame, orient='vertical', command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        tree.pack(side='left', fill='both', expand=True)
+        scrollbar.pack(side='right', fill='y')
+        
+        def update_status(last=""):
+            status_label.config(text=f"{last}Products: {len(session.counts)}   Pieces: {session.pieces}")
+        
+        def on_scan(event=None):
+            # Only counts in memory here, the database is not touched until the variance report
+            barcode = scan_entry.get().strip()
+            scan_entry.delete(0, tk.END)
+            if barcode:
+                count = session.scan(barcode)
+                update_status(f"Last: {barcode} x{count}   |   ")
+        
+        def show_variance():
+            tree.delete(*tree.get_children())
+            for barcode, name, system, counted, variance in session.variance(self.db, full_count_var.get()):
+                if name is None:
+                    tree.insert('', 'end', values=(barcode, "UNKNOWN BARCODE", '-', counted, '-'), 
+                               tags=('unknown',))
+                else:
+                    # The row id keeps the barcode as text (leading zeros included)
+                    tree.insert('', 'end', iid=barcode, 
+                               values=(barcode, name, system, counted, f"{variance:+d}"))
+        
+        def apply_adjustments():
+            # Selected lines only, or every known product in the report if nothing is selected
+            items = tree.selection() or tree.get_children()
+            adjustments = [(item, int(tree.item(item)['values'][3])) 
+                           for item in items if 'unknown' not in tree.item(item)['tags']]
+            if not adjustments:
+                messagebox.showwarning("Warning", "Run the variance report first!", parent=dialog)
+                return
+            
+            if not messagebox.askyesno("Confirm", 
+                                       f"Set stock for {len(adjustments)} products to the counted quantity?", 
+                                       parent=dialog):
+                return
+            
+            self.db.apply_stock_counts(adjustments)
+            self.invalidate_products(*(barcode for barcode, counted in adjustments))
+            session.discard()
+            messagebox.showinfo("Success", f"Stock updated for {len(adjustments)} products!", parent=dialog)
+            self.load_products()
+            dialog.destroy()
+        
+        def pause():
+            session.save()
+            dialog.destroy()
+        
+        def discard():
+            if messagebox.askyesno("Confirm", "Discard all counts of this stock take?", parent=dialog):
+                session.discard()
+                dialog.destroy()
+        
+        scan_entry.bind('<Return>', on_scan)
+        update_status()
+        
+        btn_frame = tk.Frame(dialog, bg='#16213e')
+        btn_frame.pack(pady=10)
+        
+        btn_style = {'font': ('Arial', 11, 'bold'), 'bg': '#0f3460', 'fg': 'white', 
+                    'activebackground': '#00d4ff', 'activeforeground': 'black', 
+                    'relief': 'flat', 'cursor': 'hand2', 'padx': 15, 'pady': 8}
+        
+        tk.Button(btn_frame, text="📊 Variance Report", command=show_variance, **btn_style).pack(side='left', padx=5)
+        tk.Button(btn_frame, text="✅ Apply Adjustments", command=apply_adjustments, **btn_style).pack(side='left', padx=5)
+        tk.Button(btn_frame, text="⏸️ Pause", command=pause, **btn_style).pack(side='left', padx=5)
+        tk.Button(btn_frame, text="🗑️ Discard", command=discard, **btn_style).pack(side='left', padx=5)
+        
+        # Closing the window keeps the counts for later
+        dialog.protocol("WM_DELETE_WINDOW", pause)
+    
     def delete_product(self):
         selected = self.products_tree.selection()
         if not selected:
@@ -776,17 +976,20 @@ class InventoryManagementSystem:
         if messagebox.askyesno("Confirm Delete", 
                                f"Are you sure you want to delete:\n{name} (Barcode: {barcode})?"):
             self.db.delete_product(barcode)
+            self.invalidate_products(barcode)
             messagebox.showinfo("Success", "Product deleted successfully!")
             self.load_products()
     
     def load_products(self):
+        if 'inventory' not in self.built_tabs:
+            return  # loaded when the tab is first opened
+        
         for item in self.products_tree.get_children():
             self.products_tree.delete(item)
         
         products = self.db.get_all_products()
         for product in products:
-            values = product[1:10]  # Exclude id and dates
-            self.products_tree.insert('', 'end', values=values)
+            self.products_tree.insert('', 'end', values=product.values(PRODUCT_TABLE_FIELDS))
     
     def search_products(self):
         query = self.search_var.get().strip()
@@ -800,8 +1003,7 @@ class InventoryManagementSystem:
             products = self.db.get_all_products()
         
         for product in products:
-            values = product[1:10]
-            self.products_tree.insert('', 'end', values=values)
+            self.products_tree.insert('', 'end', values=product.values(PRODUCT_TABLE_FIELDS))
     
     def print_barcode(self):
         selected = self.products_tree.selection()
@@ -825,6 +1027,7 @@ class InventoryManagementSystem:
             label.save(filename)
             
             # Show preview
+            from PIL import ImageTk
             preview = tk.Toplevel(self.root)
             preview.title(f"Barcode Preview - {barcode}")
             preview.configure(bg='white')
@@ -872,47 +1075,42 @@ class InventoryManagementSystem:
         if not barcode:
             return
         
-        product = self.db.get_product(barcode)
+        product = self.lookup_product(barcode)
         if not product:
             messagebox.showerror("Error", f"Product with barcode {barcode} not found!")
             self.barcode_entry.delete(0, tk.END)
             return
         
-        if product[8] <= 0:  # stock_quantity
+        if product.stock_quantity <= 0:
             messagebox.showerror("Error", "Product out of stock!")
             self.barcode_entry.delete(0, tk.END)
             return
         
-        # Check if already in cart
-        for item in self.cart_tree.get_children():
-            if self.cart_tree.item(item)['values'][0] == barcode:
-                # Increase quantity
-                values = list(self.cart_tree.item(item)['values'])
-                values[2] += 1
-                values[5] = values[2] * values[3]
-                self.cart_tree.item(item, values=values)
-                self.update_cart_totals()
-                self.barcode_entry.delete(0, tk.END)
-                return
-        
-        # Add new item
-        self.cart_tree.insert('', 'end', values=(
-            barcode,
-            product[2],  # name
-            1,  # quantity
-            product[7],  # selling_price
-            0,  # discount
-            product[7]  # total
-        ))
+        # Scanning an item again adds one more, only that line is re-priced
+        line = self.cart.add(product)
+        self.show_cart_line(line)
         
         self.update_cart_totals()
         self.barcode_entry.delete(0, tk.END)
         self.barcode_entry.focus()
     
+    def show_cart_line(self, line):
+        # Cart rows use the barcode as item id
+        barcode = line.product.barcode
+        values = (barcode, line.product.name, line.quantity, line.product.selling_price, 
+                  round(line.discount, 2), round(line.total, 2), 
+                  line.promotion.name if line.promotion else "")
+        if self.cart_tree.exists(barcode):
+            self.cart_tree.item(barcode, values=values)
+        else:
+            self.cart_tree.insert('', 'end', iid=barcode, values=values)
+    
     def remove_from_cart(self):
         selected = self.cart_tree.selection()
         if selected:
-            self.cart_tree.delete(selected)
+            for barcode in selected:
+                self.cart.remove(barcode)
+            self.cart_tree.delete(*selected)
             self.update_cart_totals()
     
     def apply_discount(self):
@@ -922,14 +1120,10 @@ class InventoryManagementSystem:
                 messagebox.showerror("Error", "Discount must be between 0 and 100!")
                 return
             
-            for item in self.cart_tree.get_children():
-                values = list(self.cart_tree.item(item)['values'])
-                original_price = values[3]
-                quantity = values[2]
-                discount_amount = (original_price * discount_percent / 100)
-                values[4] = discount_amount
-                values[5] = (original_price - discount_amount) * quantity
-                self.cart_tree.item(item, values=values)
+            # Lines with a better promotion keep it
+            self.cart.set_bargain(discount_percent)
+            for line in self.cart.lines.values():
+                self.show_cart_line(line)
             
             self.update_cart_totals()
             messagebox.showinfo("Success", f"{discount_percent}% discount applied!")
@@ -938,40 +1132,32 @@ class InventoryManagementSystem:
             messagebox.showerror("Error", "Please enter a valid discount percentage!")
     
     def update_cart_totals(self):
-        subtotal = 0
-        total_discount = 0
-        
-        for item in self.cart_tree.get_children():
-            values = self.cart_tree.item(item)['values']
-            subtotal += values[2] * values[3]
-            total_discount += values[4] * values[2]
-        
-        total = subtotal - total_discount
+        subtotal = self.cart.subtotal
+        total_discount = self.cart.discount
+        total = self.cart.total
         
         self.subtotal_label.config(text=f"Subtotal: Rs. {subtotal:.2f}")
         self.discount_label.config(text=f"Discount: Rs. {total_discount:.2f}")
         self.total_label.config(text=f"TOTAL: Rs. {total:.2f}")
     
     def checkout(self):
-        if not self.cart_tree.get_children():
+        if not self.cart.lines:
             messagebox.showwarning("Warning", "Cart is empty!")
             return
         
         try:
-            for item in self.cart_tree.get_children():
-                values = self.cart_tree.item(item)['values']
-                sale_data = (
-                    values[0],  # barcode
-                    values[1],  # product_name
-                    values[2],  # quantity
-                    values[3],  # original_price
-                    values[4],  # discount_price
-                    values[5],  # final_price
-                    datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                )
-                self.db.add_sale(sale_data)
+            lines = self.cart.sale_lines()
+            receipt = Receipt([
+                (line.product.barcode, line.product.name, line.quantity, line.product.selling_price, 
+                 line.discount, line.total, line.promotion.name if line.promotion else None)
+                for line in self.cart.lines.values()
+            ])
+            total = inventory_core.checkout(self.db, lines, receipt)
+            self.invalidate_products(*(line[0] for line in lines))
             
-            total = float(self.total_label.cget("text").split("Rs. ")[1])
+            # Stored with the sale; printed in the background, the next customer does not wait for it
+            self.receipts.submit(receipt)
+            self.poll_receipts()
             
             messagebox.showinfo("Success", 
                                f"Sale completed!\n\nTotal: Rs. {total:.2f}\n\nThank you!")
@@ -985,34 +1171,36 @@ class InventoryManagementSystem:
     def clear_cart(self):
         for item in self.cart_tree.get_children():
             self.cart_tree.delete(item)
+        self.cart.clear()
         self.discount_var.set("0")
         self.update_cart_totals()
     
+    def reprint_receipt(self):
+        receipt_id = simpledialog.askinteger("Reprint Receipt", "Receipt number:", 
+                                             minvalue=1, parent=self.root)
+        if receipt_id:
+            self.receipts.reprint(receipt_id)
+            self.poll_receipts()
+    
+    def poll_receipts(self):
+        while True:
+            try:
+                receipt_id, error = self.receipts.results.get_nowait()
+            except queue.Empty:
+                break
+            if error:
+                messagebox.showerror("Receipt", f"Printing failed: {error}")
+        if self.receipts.pending():
+            self.root.after(200, self.poll_receipts)
+    
     def process_return(self):
         try:
             barcode = self.return_vars['Barcode:'].get().strip()
             quantity = int(self.return_vars['Quantity:'].get())
             reason = self.return_vars['Reason:'].get().strip()
             
-            if not barcode or quantity <= 0 or not reason:
-                messagebox.showerror("Error", "Please fill all fields correctly!")
-                return
-            
-            product = self.db.get_product(barcode)
-            if not product:
-                messagebox.showerror("Error", "Product not found!")
-                return
-            
-            return_data = (
-                barcode,
-                product[2],  # name
-                quantity,
-                reason,
-                datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                None  # sale_id
-            )
-            
-            self.db.add_return(return_data)
+            inventory_core.process_return(self.db, barcode, quantity, reason)
+            self.invalidate_products(barcode)
             messagebox.showinfo("Success", "Return processed successfully!")
             
             for var in self.return_vars.values():
@@ -1021,6 +1209,8 @@ class InventoryManagementSystem:
             self.load_returns()
             self.load_products()
             
+        except InventoryError as e:
+            messagebox.showerror("Error", str(e))
         except ValueError:
             messagebox.showerror("Error", "Please enter valid quantity!")
     
@@ -1028,31 +1218,30 @@ class InventoryManagementSystem:
         for item in self.returns_tree.get_children():
             self.returns_tree.delete(item)
         
-        cursor = self.db.conn.cursor()
-        cursor.execute('SELECT * FROM returns ORDER BY return_date DESC')
-        returns = cursor.fetchall()
+        returns = self.db.get_returns()
         
         for ret in returns:
-            self.returns_tree.insert('', 'end', values=ret[:6])
+            self.returns_tree.insert('', 'end', values=(ret.id, ret.barcode, ret.product_name, 
+                                                        ret.quantity, ret.reason, ret.return_date))
     
     def update_exchange_info(self, *args):
         old_barcode = self.exchange_vars['Old Barcode:'].get().strip()
         new_barcode = self.exchange_vars['New Barcode:'].get().strip()
         
         if old_barcode:
-            product = self.db.get_product(old_barcode)
+            product = self.lookup_product(old_barcode)
             if product:
                 self.old_product_label.config(
-                    text=f"Old: {product[2]} - Rs. {product[7]}"
+                    text=f"Old: {product.name} - Rs. {product.selling_price}"
                 )
             else:
                 self.old_product_label.config(text="Old: Product not found")
         
         if new_barcode:
-            product = self.db.get_product(new_barcode)
+            product = self.lookup_product(new_barcode)
             if product:
                 self.new_product_label.config(
-                    text=f"New: {product[2]} - Rs. {product[7]}"
+                    text=f"New: {product.name} - Rs. {product.selling_price}"
                 )
             else:
                 self.new_product_label.config(text="New: Product not found")
@@ -1061,30 +1250,13 @@ class InventoryManagementSystem:
         old_barcode = self.exchange_vars['Old Barcode:'].get().strip()
         new_barcode = self.exchange_vars['New Barcode:'].get().strip()
         
-        if not old_barcode or not new_barcode:
-            messagebox.showerror("Error", "Please enter both barcodes!")
-            return
-        
-        old_product = self.db.get_product(old_barcode)
-        new_product = self.db.get_product(new_barcode)
-        
-        if not old_product or not new_product:
-            messagebox.showerror("Error", "One or both products not found!")
-            return
-        
-        if new_product[8] <= 0:  # stock_quantity
-            messagebox.showerror("Error", "New product out of stock!")
+        try:
+            inventory_core.process_exchange(self.db, old_barcode, new_barcode)
+        except InventoryError as e:
+            messagebox.showerror("Error", str(e))
             return
+        self.invalidate_products(old_barcode, new_barcode)
         
-        exchange_data = (
-            old_barcode,
-            new_barcode,
-            old_product[2],  # old name
-            new_product[2],  # new name
-            datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        )
-        
-        self.db.add_exchange(exchange_data)
         messagebox.showinfo("Success", "Exchange processed successfully!")
         
         for var in self.exchange_vars.values():
@@ -1100,14 +1272,13 @@ class InventoryManagementSystem:
         for item in self.exchange_tree.get_children():
             self.exchange_tree.delete(item)
         
-        cursor = self.db.conn.cursor()
-        cursor.execute('SELECT * FROM exchanges ORDER BY exchange_date DESC')
-        exchanges = cursor.fetchall()
+        exchanges = self.db.get_exchanges()
         
         for exc in exchanges:
-            self.exchange_tree.insert('', 'end', values=exc)
+            self.exchange_tree.insert('', 'end', values=exc.values())
     
     def show_stock_report(self):
+        self.current_report = None
         self.report_text.delete(1.0, tk.END)
         
         products = self.db.get_all_products()
@@ -1123,9 +1294,9 @@ class InventoryManagementSystem:
         
         total_value = 0
         for product in products:
-            value = product[7] * product[8]  # price * quantity
+            value = product.selling_price * product.stock_quantity
             total_value += value
-            report += f"{product[1]:<10} {product[2]:<30} {product[8]:<10} {value:<15.2f}\n"
+            report += f"{product.barcode:<10} {product.name:<30} {product.stock_quantity:<10} {value:<15.2f}\n"
         
         report += "-" * 80 + "\n"
         report += f"{'TOTAL INVENTORY VALUE:':<51} Rs. {total_value:.2f}\n"
@@ -1133,16 +1304,149 @@ class InventoryManagementSystem:
         
         self.report_text.insert(1.0, report)
     
+    def show_stock_on_date(self):
+        when = simpledialog.askstring("Stock On Date", "Date (YYYY-MM-DD) or date and time (YYYY-MM-DD HH:MM:SS):", 
+                                      initialvalue=datetime.date.today().strftime('%Y-%m-%d'), parent=self.root)
+        if not when:
+            return
+        when = when.strip()
+        try:
+            datetime.datetime.strptime(when, '%Y-%m-%d' if len(when) == 10 else '%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            messagebox.showerror("Error", "Please enter a date like 2024-05-31 or 2024-05-31 18:00:00")
+            return
+        
+        self.current_report = None
+        self.report_text.delete(1.0, tk.END)
+        
+        report = "=" * 80 + "\n"
+        report += f"STOCK ON {when}\n"
+        report += "=" * 80 + "\n\n"
+        report += f"Generated: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+        report += f"Stock history starts: {self.db.history_start()}\n\n"
+        
+        try:
+            stock = self.db.stock_on(when)
+        except InventoryError as e:
+            # Earlier stock was never recorded, show the boundary rather than figures
+            report += f"{e}, no figures for this date.\n"
+            self.report_text.insert(1.0, report)
+            return
+        products = {product.barcode: product for product in self.db.get_all_products()}
+        
+        report += f"{'Barcode':<10} {'Product Name':<30} {'Then':<8} {'Now':<8} {'Value (Rs.)':<15}\n"
+        report += "-" * 80 + "\n"
+        
+        total_value = 0
+        for barcode in sorted(stock):
+            quantity = stock[barcode]
+            product = products.get(barcode)
+            if not quantity and product is None:
+                continue  # added and deleted again before that date
+            name = product.name if product else "(deleted)"
+            current = product.stock_quantity if product else 0
+            value = quantity * product.selling_price if product else 0  # at today's price
+            total_value += value
+            report += f"{barcode:<10} {name[:30]:<30} {quantity:<8} {current:<8} {value:<15.2f}\n"
+        
+        report += "-" * 80 + "\n"
+        report += f"{'TOTAL VALUE AT CURRENT PRICES:':<59} Rs. {total_value:.2f}\n"
+        report += "=" * 80 + "\n"
+        
+        self.report_text.insert(1.0, report)
+    
+    def update_low_stock_badge(self):
+        count = self.db.low_stock.count
+        self.low_stock_badge.config(text=f"⚠️ Low stock: {count}" if count else "✅ Stock OK")
+    
+    def on_low_stock_changed(self, monitor, changes):
+        self.update_low_stock_badge()
+        # Keep the alert list live while it is on screen
+        if self.current_report == 'low_stock':
+            self.show_low_stock()
+    
+    def open_low_stock_report(self):
+        for tab_id, (key, tab, builder) in self.tab_builders.items():
+            if key == 'reports':
+                self.notebook.select(tab_id)
+                self.on_tab_changed()
+        self.show_low_stock()
+    
+    def export_reorder_list(self):
+        products = self.db.get_low_stock_products()
+        if not products:
+            messagebox.showinfo("Reorder List", "All products are adequately stocked!")
+            return
+        
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
+            initialfile=f"reorder_{datetime.datetime.now().strftime('%Y%m%d')}.csv"
+        )
+        if not filename:
+            return
+        
+        with open(filename, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Barcode', 'Name', 'Category', 'Size', 'Color', 
+                             'Stock', 'Min Level', 'Reorder Qty'])
+            for product in products:
+                # Use the forecast's order size, otherwise get back to twice the minimum level
+                reorder_qty = product.reorder_quantity or max(product.min_stock_level * 2 - product.stock_quantity, 1)
+                writer.writerow([product.barcode, product.name, product.category, product.size, 
+                                 product.color, product.stock_quantity, product.min_stock_level, 
+                                 reorder_qty])
+        
+        messagebox.showinfo("Success", f"Reorder list saved to:\n{filename}")
+    
+    def show_forecast(self):
+        self.current_report = None
+        self.report_text.delete(1.0, tk.END)
+        
+        self.root.config(cursor='watch')
+        self.root.update_idletasks()
+        try:
+            result = forecasting.forecast(self.db)
+        except InventoryError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        finally:
+            self.root.config(cursor='')
+        
+        changed = result.changed()
+        # Biggest moves first
+        order = abs(result.min_stock_level[changed] - result.current_min[changed]).argsort()[::-1]
+        
+        report = "=" * 80 + "\n"
+        report += "DEMAND FORECAST\n"
+        report += "=" * 80 + "\n\n"
+        report += f"Generated: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+        report += f"Based on the last {result.days} days of sales, {forecasting.LEAD_TIME_DAYS} day lead time\n"
+        report += f"Products: {len(result)}   Suggested minimum changed: {len(changed)}\n\n"
+        
+        report += f"{'Barcode':<10} {'Per Day':<10} {'Min Now':<10} {'Suggested':<10} {'Reorder Qty':<12}\n"
+        report += "-" * 80 + "\n"
+        for i in changed[order][:200]:
+            report += (f"{result.barcodes[i]:<10} {result.daily_demand[i]:<10.2f} {result.current_min[i]:<10} "
+                       f"{result.min_stock_level[i]:<10} {result.reorder_quantity[i]:<12}\n")
+        if len(changed) > 200:
+            report += f"... and {len(changed) - 200} more\n"
+        report += "=" * 80 + "\n"
+        
+        self.report_text.insert(1.0, report)
+        
+        if len(changed) and messagebox.askyesno("Forecast", 
+                f"Update minimum stock levels and reorder quantities for {len(result)} products?"):
+            forecasting.apply_forecast(self.db, result)
+            self.clear_product_cache()
+            self.load_products()
+            messagebox.showinfo("Success", "Reorder levels updated!")
+    
     def show_low_stock(self):
+        self.current_report = 'low_stock'
         self.report_text.delete(1.0, tk.END)
         
-        cursor = self.db.conn.cursor()
-        cursor.execute('''
-            SELECT * FROM products 
-            WHERE stock_quantity <= min_stock_level 
-            ORDER BY stock_quantity ASC
-        ''')
-        products = cursor.fetchall()
+        products = self.db.get_low_stock_products()
         
         report = "=" * 80 + "\n"
         report += "LOW STOCK ALERT\n"
@@ -1155,7 +1459,8 @@ class InventoryManagementSystem:
             report += "-" * 80 + "\n"
             
             for product in products:
-                report += f"{product[1]:<10} {product[2]:<30} {product[8]:<10} {product[9]:<10}\n"
+                report += (f"{product.barcode:<10} {product.name:<30} "
+                           f"{product.stock_quantity:<10} {product.min_stock_level:<10}\n")
         else:
             report += "All products are adequately stocked!\n"
         
@@ -1164,11 +1469,10 @@ class InventoryManagementSystem:
         self.report_text.insert(1.0, report)
     
     def show_sales_report(self):
+        self.current_report = None
         self.report_text.delete(1.0, tk.END)
         
-        cursor = self.db.conn.cursor()
-        cursor.execute('SELECT * FROM sales ORDER BY sale_date DESC LIMIT 50')
-        sales = cursor.fetchall()
+        sales = self.db.get_recent_sales(50)
         
         report = "=" * 80 + "\n"
         report += "RECENT SALES REPORT (Last 50 Transactions)\n"
@@ -1181,8 +1485,8 @@ class InventoryManagementSystem:
         
         total_revenue = 0
         for sale in sales:
-            total_revenue += sale[6]  # final_price
-            report += f"{sale[7]:<20} {sale[2]:<25} {sale[3]:<5} Rs. {sale[6]:<12.2f}\n"
+            total_revenue += sale.final_price
+            report += f"{sale.sale_date:<20} {sale.product_name:<25} {sale.quantity:<5} Rs. {sale.final_price:<12.2f}\n"
         
         report += "-" * 80 + "\n"
         report += f"{'TOTAL REVENUE:':<46} Rs. {total_revenue:.2f}\n"
@@ -1191,41 +1495,12 @@ class InventoryManagementSystem:
         self.report_text.insert(1.0, report)
     
     def show_revenue_analysis(self):
+        self.current_report = None
         self.report_text.delete(1.0, tk.END)
         
-        cursor = self.db.conn.cursor()
-        
-        # Today's sales
-        cursor.execute('''
-            SELECT SUM(final_price) FROM sales 
-            WHERE DATE(sale_date) = DATE('now')
-        ''')
-        today_revenue = cursor.fetchone()[0] or 0
-        
-        # This month's sales
-        cursor.execute('''
-            SELECT SUM(final_price) FROM sales 
-            WHERE strftime('%Y-%m', sale_date) = strftime('%Y-%m', 'now')
-        ''')
-        month_revenue = cursor.fetchone()[0] or 0
-        
-        # Total sales
-        cursor.execute('SELECT SUM(final_price) FROM sales')
-        total_revenue = cursor.fetchone()[0] or 0
-        
-        # Total products sold
-        cursor.execute('SELECT SUM(quantity) FROM sales')
-        total_items = cursor.fetchone()[0] or 0
-        
-        # Top selling products
-        cursor.execute('''
-            SELECT product_name, SUM(quantity) as total_qty, SUM(final_price) as revenue
-            FROM sales
-            GROUP BY product_name
-            ORDER BY total_qty DESC
-            LIMIT 10
-        ''')
-        top_products = cursor.fetchall()
+        today_revenue, month_revenue, total_revenue, total_items = self.db.get_revenue_summary()
+        top_products = self.db.get_top_selling_products(10)
+        top_week = self.db.get_top_selling_products(10, period='week')
         
         report = "=" * 80 + "\n"
         report += "REVENUE ANALYSIS\n"
@@ -1243,13 +1518,113 @@ class InventoryManagementSystem:
         report += f"{'Product':<40} {'Qty Sold':<15} {'Revenue':<15}\n"
         report += "-" * 80 + "\n"
         
-        for product in top_products:
-            report += f"{product[0]:<40} {product[1]:<15} Rs. {product[2]:<12.2f}\n"
+        for name, quantity, revenue in top_products:
+            report += f"{name:<40} {quantity:<15} Rs. {revenue:<12.2f}\n"
+        
+        report += "\nTOP 10 THIS WEEK:\n"
+        report += "-" * 80 + "\n"
+        report += f"{'Product':<40} {'Qty Sold':<15} {'Revenue':<15}\n"
+        report += "-" * 80 + "\n"
+        
+        for name, quantity, revenue in top_week:
+            report += f"{name:<40} {quantity:<15} Rs. {revenue:<12.2f}\n"
         
         report += "=" * 80 + "\n"
         
         self.report_text.insert(1.0, report)
 
+    def show_diagnostics(self):
+        stats = self.db.conn.stats
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Query Diagnostics")
+        dialog.geometry("1200x600")
+        dialog.configure(bg='#16213e')
+        dialog.transient(self.root)
+        
+        tk.Label(dialog, text="SQL Statement Statistics", font=('Arial', 16, 'bold'), 
+                bg='#16213e', fg='#00d4ff').pack(pady=10)
+        tk.Label(dialog, text=f"Statements slower than {stats.slow_ms} ms are logged with their "
+                              f"query plan to {os.path.abspath(stats.log_path)}", 
+                bg='#16213e', fg='white', font=('Arial', 10)).pack()
+        
+        table_frame = tk.Frame(dialog, bg='#16213e')
+        table_frame.pack(fill='both', expand=True, padx=10, pady=10)
+        
+        columns = ('Statement', 'Calls', 'Total ms', 'Avg ms', 'p50 ms', 'p95 ms', 'Max ms', 'Rows')
+        tree = ttk.Treeview(table_frame, columns=columns, show='headings')
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=500 if col == 'Statement' else 90)
+        
+        scrollbar = ttk.Scrollbar(table_frame, orient='vertical', command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        tree.pack(side='left', fill='both', expand=True)
+        scrollbar.pack(side='right', fill='y')
+        
+        def refresh():
+            tree.delete(*tree.get_children())
+            for stmt in stats.snapshot():
+                tree.insert('', 'end', values=(
+                    stmt.sql, stmt.calls, f"{stmt.total_ms:.2f}", f"{stmt.avg_ms:.3f}", 
+                    f"{stmt.percentile(50):.3f}", f"{stmt.percentile(95):.3f}", 
+                    f"{stmt.max_ms:.3f}", stmt.rows
+                ))
+        
+        def reset():
+            stats.reset()
+            refresh()
+        
+        btn_frame = tk.Frame(dialog, bg='#16213e')
+        btn_frame.pack(pady=10)
+        
+        btn_style = {'font': ('Arial', 11, 'bold'), 'bg': '#0f3460', 'fg': 'white', 
+                    'activebackground': '#00d4ff', 'activeforeground': 'black', 
+                    'relief': 'flat', 'cursor': 'hand2', 'padx': 20, 'pady': 8}
+        
+        tk.Button(btn_frame, text="🔄 Refresh", command=refresh, **btn_style).pack(side='left', padx=5)
+        tk.Button(btn_frame, text="🧹 Reset", command=reset, **btn_style).pack(side='left', padx=5)
+        tk.Button(btn_frame, text="❌ Close", command=dialog.destroy, **btn_style).pack(side='left', padx=5)
+        
+        refresh()
+
+    def update_backup_label(self):
+        latest = self.backups.latest_time()
+        text = f"💾 Last backup: {latest.strftime('%Y-%m-%d %H:%M')}" if latest else "💾 No backup yet"
+        result = self.backups.last_result
+        if result is not None and not result.ok:
+            # Stays up until a backup succeeds, so a failed scheduled run is not missed
+            text += f" | ⚠ Backup failed at {result.finished.strftime('%H:%M')}"
+        self.backup_label.config(text=text)
+    
+    def backup_now(self):
+        if not self.backups.start():
+            messagebox.showinfo("Backup", "A backup is already running")
+            return
+        self.poll_backup(notify=True)
+    
+    def scheduled_backup(self):
+        if self.backups.is_due() and self.backups.start():
+            self.poll_backup(notify=False)
+        self.root.after(10 * 60 * 1000, self.scheduled_backup)
+    
+    def poll_backup(self, notify):
+        # The copy runs on its own thread and connection, only its progress is read here
+        if self.backups.running:
+            copied, total = self.backups.progress
+            percent = copied * 100 // total if total else 0
+            self.backup_label.config(text=f"💾 Backing up... {percent}%")
+            self.root.after(250, lambda: self.poll_backup(notify))
+            return
+        
+        self.update_backup_label()
+        result = self.backups.last_result
+        if not result.ok:
+            messagebox.showerror("Backup Failed", result.error)
+        elif notify:
+            messagebox.showinfo("Backup", f"Backup saved to:\n{result.path}\n\n"
+                                f"{result.size / 1024 / 1024:.1f} MB in {result.seconds:.1f} seconds")
+
 if __name__ == "__main__":
     root = tk.Tk()
     app = InventoryManagementSystem(root)
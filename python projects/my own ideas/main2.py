@@ -1,13 +1,32 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, simpledialog
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
-import os
 from typing import Dict, List
 import barcode
 from barcode.writer import ImageWriter
 from PIL import Image, ImageTk, ImageDraw, ImageFont
 import io
+from product_index import FACETS, ProductIndex
+from shop_stats import ShopTotals, changed_products
+from shop_store import open_store
+
+class DashboardStats:
+    # Figures shown on the dashboard. Each one is a Tk variable that its stat card
+    # displays through textvariable, so a refresh only sets values and the labels follow.
+    def __init__(self, root):
+        self.products = tk.StringVar(root)
+        self.stock_value = tk.StringVar(root)
+        self.low_stock = tk.StringVar(root)
+        self.today_sales = tk.StringVar(root)
+    
+    def update(self, products, stock_value, low_stock, today_sales):
+        for var, text in ((self.products, str(products)),
+                          (self.stock_value, f"Rs. {stock_value}"),
+                          (self.low_stock, str(low_stock)),
+                          (self.today_sales, f"Rs. {today_sales}")):
+            if var.get() != text:
+                var.set(text)
 
 class GarmentShopManager:
     def __init__(self, root):
@@ -16,18 +35,21 @@ class GarmentShopManager:
         self.root.geometry("1400x800")
         self.root.configure(bg='#2c3e50')
         
-        # Data storage
-        self.products = {}
-        self.sales = []
-        self.stock_history = []
-        self.barcode_counter = 1
-        
-        # Load existing data
-        self.load_data()
+        # Data storage; the catalogue is kept in memory, sales and history are queried from the store
+        self.store = open_store()
+        self.products = self.store.products
+        self.totals = ShopTotals(self.store)
+        self.low_stock = self.totals.low
+        self.index = ProductIndex(self.products)
+        if self.store.load_error:
+            messagebox.showerror("Error", self.store.load_error)
+        self.root.protocol("WM_DELETE_WINDOW", self.exit)
+        self.stats = DashboardStats(self.root)
         
         # Create main interface
         self.create_menu()
         self.create_main_frame()
+        self.refresh_dashboard()
         
     def create_menu(self):
         menubar = tk.Menu(self.root)
@@ -39,7 +61,7 @@ class GarmentShopManager:
         file_menu.add_command(label="Backup Data", command=self.backup_data)
         file_menu.add_command(label="Restore Data", command=self.restore_data)
         file_menu.add_separator()
-        file_menu.add_command(label="Exit", command=self.root.quit)
+        file_menu.add_command(label="Exit", command=self.exit)
         
         # Inventory Menu
         inventory_menu = tk.Menu(menubar, tearoff=0)
@@ -60,6 +82,7 @@ class GarmentShopManager:
         reports_menu.add_command(label="Sales Report", command=self.show_sales_report)
         reports_menu.add_command(label="Stock Report", command=self.show_stock_report)
         reports_menu.add_command(label="Low Stock Alert", command=self.show_low_stock_alert)
+        reports_menu.add_command(label="Stock History", command=self.show_stock_history)
         
     def create_main_frame(self):
         # Main container
@@ -79,10 +102,10 @@ class GarmentShopManager:
         stats_frame = tk.Frame(dashboard, bg='#34495e')
         stats_frame.pack(fill=tk.X, pady=20)
         
-        self.create_stat_card(stats_frame, "Total Products", len(self.products), '#3498db', 0)
-        self.create_stat_card(stats_frame, "Total Stock Value", f"Rs. {self.calculate_total_stock_value()}", '#2ecc71', 1)
-        self.create_stat_card(stats_frame, "Low Stock Items", self.count_low_stock(), '#e74c3c', 2)
-        self.create_stat_card(stats_frame, "Today's Sales", f"Rs. {self.calculate_today_sales()}", '#f39c12', 3)
+        self.create_stat_card(stats_frame, "Total Products", self.stats.products, '#3498db', 0)
+        self.create_stat_card(stats_frame, "Total Stock Value", self.stats.stock_value, '#2ecc71', 1)
+        self.create_stat_card(stats_frame, "Low Stock Items", self.stats.low_stock, '#e74c3c', 2)
+        self.create_stat_card(stats_frame, "Today's Sales", self.stats.today_sales, '#f39c12', 3)
         
         # Quick Actions
         actions_frame = tk.LabelFrame(dashboard, text="Quick Actions", font=('Arial', 14, 'bold'),
@@ -104,13 +127,13 @@ class GarmentShopManager:
                           width=20, height=2, cursor='hand2')
             btn.grid(row=i//3, column=i%3, padx=10, pady=10)
         
-    def create_stat_card(self, parent, title, value, color, col):
+    def create_stat_card(self, parent, title, variable, color, col):
         card = tk.Frame(parent, bg=color, relief=tk.RAISED, borderwidth=2)
         card.grid(row=0, column=col, padx=10, sticky='ew')
         parent.grid_columnconfigure(col, weight=1)
         
         tk.Label(card, text=title, font=('Arial', 12), bg=color, fg='white').pack(pady=(10, 5))
-        tk.Label(card, text=str(value), font=('Arial', 20, 'bold'), bg=color, fg='white').pack(pady=(0, 10))
+        tk.Label(card, textvariable=variable, font=('Arial', 20, 'bold'), bg=color, fg='white').pack(pady=(0, 10))
     
     def show_add_stock(self):
         window = tk.Toplevel(self.root)
@@ -147,7 +170,7 @@ class GarmentShopManager:
         
         def save_product():
             try:
-                barcode_num = str(self.barcode_counter).zfill(4)
+                barcode_num = str(self.store.barcode_counter).zfill(4)
                 product_id = f"{fields['secret_code'].get().upper()}{barcode_num}"
                 
                 if not fields['secret_code'].get():
@@ -169,16 +192,18 @@ class GarmentShopManager:
                     'added_date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                 }
                 
-                self.products[product_id] = product
-                self.barcode_counter += 1
-                self.stock_history.append({
-                    'product_id': product_id,
-                    'action': 'Added',
-                    'quantity': product['quantity'],
-                    'date': product['added_date']
+                self.commit({
+                    'op': 'product',
+                    'product': product,
+                    'barcode_counter': self.store.barcode_counter + 1,
+                    'history': [{
+                        'product_id': product_id,
+                        'action': 'Added',
+                        'quantity': product['quantity'],
+                        'date': product['added_date']
+                    }]
                 })
                 
-                self.save_data()
                 messagebox.showinfo("Success", f"Product added successfully!\nProduct ID: {product_id}")
                 window.destroy()
                 self.refresh_dashboard()
@@ -223,12 +248,12 @@ class GarmentShopManager:
         
         def populate_tree(search_term=""):
             tree.delete(*tree.get_children())
-            for pid, prod in self.products.items():
-                if search_term.lower() in prod['name'].lower() or search_term.lower() in pid.lower():
-                    tree.insert('', tk.END, values=(
-                        prod['id'], prod['name'], prod['category'], 
-                        prod['size'], prod['color'], prod['selling_price'], prod['quantity']
-                    ))
+            for pid in self.index.search(search_term):
+                prod = self.products[pid]
+                tree.insert('', tk.END, values=(
+                    prod['id'], prod['name'], prod['category'], 
+                    prod['size'], prod['color'], prod['selling_price'], prod['quantity']
+                ))
         
         populate_tree()
         search_var.trace('w', lambda *args: populate_tree(search_var.get()))
@@ -278,18 +303,20 @@ class GarmentShopManager:
                     old_qty = product['quantity']
                     new_qty = int(fields['quantity'].get())
                     
-                    product['name'] = fields['name'].get()
-                    product['category'] = fields['category'].get()
-                    product['size'] = fields['size'].get()
-                    product['color'] = fields['color'].get()
-                    product['purchase_price'] = float(fields['purchase_price'].get())
-                    product['selling_price'] = float(fields['selling_price'].get())
-                    product['quantity'] = new_qty
-                    product['secret_code'] = fields['secret_code'].get().upper()
-                    product['min_stock'] = int(fields['min_stock'].get())
+                    updated = dict(product)
+                    updated['name'] = fields['name'].get()
+                    updated['category'] = fields['category'].get()
+                    updated['size'] = fields['size'].get()
+                    updated['color'] = fields['color'].get()
+                    updated['purchase_price'] = float(fields['purchase_price'].get())
+                    updated['selling_price'] = float(fields['selling_price'].get())
+                    updated['quantity'] = new_qty
+                    updated['secret_code'] = fields['secret_code'].get().upper()
+                    updated['min_stock'] = int(fields['min_stock'].get())
                     
+                    history = []
                     if old_qty != new_qty:
-                        self.stock_history.append({
+                        history.append({
                             'product_id': product_id,
                             'action': 'Updated',
                             'old_quantity': old_qty,
@@ -297,7 +324,7 @@ class GarmentShopManager:
                             'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                         })
                     
-                    self.save_data()
+                    self.commit({'op': 'product', 'product': updated, 'history': history})
                     messagebox.showinfo("Success", "Product updated successfully!")
                     edit_win.destroy()
                     populate_tree()
@@ -346,12 +373,12 @@ class GarmentShopManager:
         
         def populate_tree(search_term=""):
             tree.delete(*tree.get_children())
-            for pid, prod in self.products.items():
-                if search_term.lower() in prod['name'].lower() or search_term.lower() in pid.lower():
-                    tree.insert('', tk.END, values=(
-                        prod['id'], prod['name'], prod['category'], 
-                        prod['size'], prod['color'], prod['selling_price'], prod['quantity']
-                    ))
+            for pid in self.index.search(search_term):
+                prod = self.products[pid]
+                tree.insert('', tk.END, values=(
+                    prod['id'], prod['name'], prod['category'], 
+                    prod['size'], prod['color'], prod['selling_price'], prod['quantity']
+                ))
         
         populate_tree()
         search_var.trace('w', lambda *args: populate_tree(search_var.get()))
@@ -367,14 +394,16 @@ class GarmentShopManager:
             
             confirm = messagebox.askyesno("Confirm", f"Are you sure you want to remove product {product_id}?")
             if confirm:
-                self.stock_history.append({
+                self.commit({
+                    'op': 'remove',
                     'product_id': product_id,
-                    'action': 'Removed',
-                    'product_data': self.products[product_id],
-                    'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    'history': [{
+                        'product_id': product_id,
+                        'action': 'Removed',
+                        'product_data': self.products[product_id],
+                        'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    }]
                 })
-                del self.products[product_id]
-                self.save_data()
                 messagebox.showinfo("Success", "Product removed successfully!")
                 populate_tree()
                 self.refresh_dashboard()
@@ -583,6 +612,13 @@ class GarmentShopManager:
         search_entry.pack(side=tk.LEFT, padx=5)
         search_entry.focus()
         
+        # In scan mode a barcode followed by Enter (as scanners send it) adds one item
+        scan_mode = tk.BooleanVar(value=True)
+        tk.Checkbutton(search_frame, text="Scan mode", variable=scan_mode,
+                      font=('Arial', 10), bg='#ecf0f1').pack(side=tk.LEFT, padx=5)
+        scan_status = tk.Label(left_frame, text="", font=('Arial', 10), bg='#ecf0f1', fg='#e74c3c')
+        scan_status.pack()
+        
         # Product list
         columns = ('ID', 'Name', 'Size', 'Color', 'Price', 'Stock')
         tree = ttk.Treeview(left_frame, columns=columns, show='tree headings', height=20)
@@ -598,14 +634,12 @@ class GarmentShopManager:
         
         def populate_products(search_term=""):
             tree.delete(*tree.get_children())
-            for pid, prod in self.products.items():
-                if (search_term.lower() in prod['name'].lower() or 
-                    search_term.lower() in pid.lower() or
-                    search_term in prod['barcode']):
-                    tree.insert('', tk.END, values=(
-                        prod['id'], prod['name'], prod['size'], 
-                        prod['color'], prod['selling_price'], prod['quantity']
-                    ))
+            for pid in self.index.search(search_term):
+                prod = self.products[pid]
+                tree.insert('', tk.END, values=(
+                    prod['id'], prod['name'], prod['size'], 
+                    prod['color'], prod['selling_price'], prod['quantity']
+                ))
         
         populate_products()
         search_var.trace('w', lambda *args: populate_products(search_var.get()))
@@ -652,14 +686,38 @@ class GarmentShopManager:
             qty = simpledialog.askinteger("Quantity", f"Enter quantity for {product['name']}:",
                                          minvalue=1, maxvalue=product['quantity'])
             if qty:
-                if product_id in cart_items:
-                    cart_items[product_id]['qty'] += qty
-                else:
-                    cart_items[product_id] = {
-                        'product': product,
-                        'qty': qty
-                    }
-                update_cart()
+                put_in_cart(product, qty)
+        
+        def put_in_cart(product, qty):
+            if product['id'] in cart_items:
+                cart_items[product['id']]['qty'] += qty
+            else:
+                cart_items[product['id']] = {
+                    'product': product,
+                    'qty': qty
+                }
+            update_cart()
+        
+        def scan_barcode(event=None):
+            if not scan_mode.get():
+                return
+            code = search_var.get()
+            product_id = self.index.scan(code)
+            if product_id is None:
+                scan_status.config(text=f"No product with barcode {code.strip()}")
+                window.bell()
+                return
+            product = self.products[product_id]
+            in_cart = cart_items[product_id]['qty'] if product_id in cart_items else 0
+            if in_cart >= product['quantity']:
+                scan_status.config(text=f"{product['name']} is out of stock")
+                window.bell()
+                return
+            put_in_cart(product, 1)
+            scan_status.config(text="")
+            search_var.set("")
+        
+        search_entry.bind('<Return>', scan_barcode)
         
         def update_cart():
             cart_tree.delete(*cart_tree.get_children())
@@ -724,23 +782,13 @@ class GarmentShopManager:
                 messagebox.showwarning("Warning", "Cart is empty!")
                 return
             
-            # Update stock
-            for pid, item in cart_items.items():
-                self.products[pid]['quantity'] -= item['qty']
-                self.stock_history.append({
-                    'product_id': pid,
-                    'action': 'Sold',
-                    'quantity': item['qty'],
-                    'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                })
-            
-            # Record sale
+            # Record sale, stock is taken off when it is applied
             subtotal = sum(item['product']['selling_price'] * item['qty'] for item in cart_items.values())
             discount_amount = subtotal * (discount_var.get() / 100)
             total = subtotal - discount_amount
             
             sale = {
-                'sale_id': f"SALE{len(self.sales) + 1:04d}",
+                'sale_id': self.store.next_sale_id(),
                 'items': [{
                     'product_id': pid,
                     'name': item['product']['name'],
@@ -754,8 +802,17 @@ class GarmentShopManager:
                 'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             }
             
-            self.sales.append(sale)
-            self.save_data()
+            self.commit({
+                'op': 'sale',
+                'sale': sale,
+                'sale_counter': self.store.sale_counter + 1,
+                'history': [{
+                    'product_id': pid,
+                    'action': 'Sold',
+                    'quantity': item['qty'],
+                    'date': sale['date']
+                } for pid, item in cart_items.items()]
+            })
             
             messagebox.showinfo("Success", f"Sale completed!\nTotal: Rs. {total:.2f}\nSale ID: {sale['sale_id']}")
             window.destroy()
@@ -804,12 +861,11 @@ class GarmentShopManager:
         
         def populate_sales(search_term=""):
             tree.delete(*tree.get_children())
-            for sale in reversed(self.sales):
-                if search_term.lower() in sale['sale_id'].lower():
-                    items_str = ", ".join([f"{item['name']} x{item['quantity']}" for item in sale['items']])
-                    tree.insert('', tk.END, values=(
-                        sale['sale_id'], sale['date'], items_str, f"Rs. {sale['total']:.2f}"
-                    ))
+            for sale in self.store.find_sales(search_term):
+                items_str = ", ".join([f"{item['name']} x{item['quantity']}" for item in sale['items']])
+                tree.insert('', tk.END, values=(
+                    sale['sale_id'], sale['date'], items_str, f"Rs. {sale['total']:.2f}"
+                ))
         
         populate_sales()
         search_var.trace('w', lambda *args: populate_sales(search_var.get()))
@@ -824,7 +880,7 @@ class GarmentShopManager:
             sale_id = values[0]
             
             # Find the sale
-            sale = next((s for s in self.sales if s['sale_id'] == sale_id), None)
+            sale = self.store.get_sale(sale_id)
             if not sale:
                 return
             
@@ -862,20 +918,22 @@ class GarmentShopManager:
                     messagebox.showwarning("Warning", "Please select items to return!")
                     return
                 
-                # Update stock
-                for pid in returned:
-                    item = return_items[pid]['item']
-                    if pid in self.products:
-                        self.products[pid]['quantity'] += item['quantity']
-                        self.stock_history.append({
-                            'product_id': pid,
-                            'action': 'Returned',
-                            'quantity': item['quantity'],
-                            'sale_id': sale_id,
-                            'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        })
+                # Update stock, products removed since the sale are not restocked
+                items = [(pid, return_items[pid]['item']['quantity']) for pid in returned if pid in self.products]
+                now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                self.commit({
+                    'op': 'return',
+                    'sale_id': sale_id,
+                    'items': items,
+                    'history': [{
+                        'product_id': pid,
+                        'action': 'Returned',
+                        'quantity': qty,
+                        'sale_id': sale_id,
+                        'date': now
+                    } for pid, qty in items]
+                })
                 
-                self.save_data()
                 messagebox.showinfo("Success", "Return processed successfully!")
                 return_win.destroy()
                 self.refresh_dashboard()
@@ -951,7 +1009,20 @@ class GarmentShopManager:
             total = 0
             items_count = 0
             
-            for sale in reversed(self.sales):
+            # Start of the chosen period, the store reads from there on by date
+            now = datetime.now()
+            period = date_var.get()
+            if period == 'Today':
+                start = now.strftime("%Y-%m-%d")
+            elif period == 'This Week':
+                start = (now - timedelta(days=now.weekday())).strftime("%Y-%m-%d")
+            elif period == 'This Month':
+                start = now.strftime("%Y-%m")
+            else:
+                start = ''
+            sales = self.store.sales_between(start)
+            
+            for sale in reversed(sales):
                 items_str = ", ".join([f"{item['name']} x{item['quantity']}" for item in sale['items']])
                 tree.insert('', tk.END, values=(
                     sale['sale_id'], sale['date'], items_str, 
@@ -964,10 +1035,11 @@ class GarmentShopManager:
             
             total_sales_label.config(text=f"Total Sales: Rs. {total:.2f}")
             total_items_label.config(text=f"Items Sold: {items_count}")
-            avg_sale = total / len(self.sales) if self.sales else 0
+            avg_sale = total / len(sales) if sales else 0
             avg_sale_label.config(text=f"Avg Sale: Rs. {avg_sale:.2f}")
         
         update_report()
+        date_dropdown.bind('<<ComboboxSelected>>', lambda e: update_report())
         
         def export_report():
             filename = filedialog.asksaveasfilename(
@@ -978,7 +1050,7 @@ class GarmentShopManager:
                 with open(filename, 'w') as f:
                     f.write("SALES REPORT\n")
                     f.write("=" * 80 + "\n\n")
-                    for sale in self.sales:
+                    for sale in self.store.sales_between():
                         f.write(f"Sale ID: {sale['sale_id']}\n")
                         f.write(f"Date: {sale['date']}\n")
                         f.write(f"Items:\n")
@@ -1009,11 +1081,17 @@ class GarmentShopManager:
         search_entry = tk.Entry(search_frame, textvariable=search_var, font=('Arial', 11), width=40)
         search_entry.pack(side=tk.LEFT, padx=5)
         
-        tk.Label(search_frame, text="Category:", font=('Arial', 11), bg='#ecf0f1').pack(side=tk.LEFT, padx=20)
-        categories = ['All'] + list(set(p['category'] for p in self.products.values()))
-        category_var = tk.StringVar(value='All')
-        category_dropdown = ttk.Combobox(search_frame, textvariable=category_var, values=categories, width=15)
-        category_dropdown.pack(side=tk.LEFT, padx=5)
+        # Category, size and color filters; each lists its values with how many
+        # products would match given the other filters
+        chosen = {field: None for field in FACETS}  # None shows all
+        choices = {}                                # (field, text shown) -> value
+        facet_boxes = {}
+        for field in FACETS:
+            tk.Label(search_frame, text=f"{field.title()}:", font=('Arial', 11), bg='#ecf0f1').pack(side=tk.LEFT, padx=(15, 5))
+            box = ttk.Combobox(search_frame, state='readonly', width=12)
+            box.pack(side=tk.LEFT, padx=5)
+            box.bind('<<ComboboxSelected>>', lambda e, field=field: choose(field))
+            facet_boxes[field] = box
         
         # Stock list
         list_frame = tk.Frame(window, bg='#ecf0f1', padx=20)
@@ -1033,33 +1111,47 @@ class GarmentShopManager:
         
         def update_stock_list():
             tree.delete(*tree.get_children())
-            search_term = search_var.get().lower()
-            category = category_var.get()
             
-            for pid, prod in self.products.items():
-                if (search_term in prod['name'].lower() or search_term in pid.lower()) and \
-                   (category == 'All' or prod['category'] == category):
-                    value = prod['purchase_price'] * prod['quantity']
-                    
-                    # Color code low stock items
-                    tags = ()
-                    if prod['quantity'] <= prod['min_stock']:
-                        tags = ('low_stock',)
-                    
-                    tree.insert('', tk.END, values=(
-                        prod['id'], prod['name'], prod['category'], 
-                        prod['size'], prod['color'], 
-                        f"Rs. {prod['purchase_price']}", 
-                        f"Rs. {prod['selling_price']}", 
-                        prod['quantity'],
-                        f"Rs. {value:.2f}"
-                    ), tags=tags)
+            # A report lists every match, unlike the pickers
+            for pid in self.index.search(search_var.get(), limit=None, within=self.index.facet_ids(chosen)):
+                prod = self.products[pid]
+                value = prod['purchase_price'] * prod['quantity']
+                
+                # Color code low stock items
+                tags = ()
+                if prod['quantity'] <= prod['min_stock']:
+                    tags = ('low_stock',)
+                
+                tree.insert('', tk.END, values=(
+                    prod['id'], prod['name'], prod['category'], 
+                    prod['size'], prod['color'], 
+                    f"Rs. {prod['purchase_price']}", 
+                    f"Rs. {prod['selling_price']}", 
+                    prod['quantity'],
+                    f"Rs. {value:.2f}"
+                ), tags=tags)
             
             tree.tag_configure('low_stock', background='#ffcccc')
         
+        def update_facets():
+            for field, box in facet_boxes.items():
+                counts = self.index.facet_counts(field, chosen)
+                options = [(None, f"All ({sum(counts.values())})")]
+                options += [(value, f"{value} ({count})") for value, count in counts.items()]
+                box['values'] = [text for value, text in options]
+                for value, text in options:
+                    choices[field, text] = value
+                    if value == chosen[field]:
+                        box.set(text)
+        
+        def choose(field):
+            chosen[field] = choices[field, facet_boxes[field].get()]
+            update_facets()
+            update_stock_list()
+        
+        update_facets()
         update_stock_list()
         search_var.trace('w', lambda *args: update_stock_list())
-        category_var.trace('w', lambda *args: update_stock_list())
         
         def export_stock():
             filename = filedialog.asksaveasfilename(
@@ -1116,73 +1208,128 @@ class GarmentShopManager:
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         tree.pack(fill=tk.BOTH, expand=True, pady=10)
         
-        low_stock_count = 0
-        out_of_stock_count = 0
+        tree.tag_configure('low_stock', background='#fff3cd')
+        tree.tag_configure('out_stock', background='#ffcccc')
         
-        for pid, prod in self.products.items():
-            if prod['quantity'] <= prod['min_stock']:
+        # Summary
+        summary_frame = tk.Frame(window, bg='#ecf0f1', padx=20, pady=10)
+        summary_frame.pack(fill=tk.X)
+        
+        low_label = tk.Label(summary_frame, font=('Arial', 12, 'bold'), bg='#fff3cd', padx=20, pady=10)
+        low_label.pack(side=tk.LEFT, padx=10)
+        out_label = tk.Label(summary_frame, font=('Arial', 12, 'bold'), bg='#ffcccc', padx=20, pady=10)
+        out_label.pack(side=tk.LEFT, padx=10)
+        
+        def show_changes(low_stock, changes):
+            # Rows are keyed by product id, only the products that changed are redrawn
+            for pid, item in changes.items():
+                if tree.exists(pid):
+                    tree.delete(pid)
+                if item is None:
+                    continue
+                prod = self.products[pid]
                 status = "OUT OF STOCK" if prod['quantity'] == 0 else "LOW STOCK"
                 tags = ('out_stock',) if prod['quantity'] == 0 else ('low_stock',)
                 
-                tree.insert('', tk.END, values=(
+                tree.insert('', tk.END, iid=pid, values=(
                     prod['id'], prod['name'], prod['category'], 
                     prod['size'], prod['quantity'], prod['min_stock'], status
                 ), tags=tags)
-                
-                if prod['quantity'] == 0:
-                    out_of_stock_count += 1
-                else:
-                    low_stock_count += 1
+            
+            out_of_stock_count = sum(1 for quantity, min_stock in low_stock.items.values() if quantity == 0)
+            low_label.config(text=f"Low Stock Items: {low_stock.count - out_of_stock_count}")
+            out_label.config(text=f"Out of Stock Items: {out_of_stock_count}")
+        
+        # The list follows the low stock set while the window is open
+        show_changes(self.low_stock, self.low_stock.items)
+        unsubscribe = self.low_stock.subscribe(show_changes)
+        window.bind('<Destroy>', lambda e: unsubscribe() if e.widget is window else None)
+    
+    def show_stock_history(self):
+        window = tk.Toplevel(self.root)
+        window.title("Stock History")
+        window.geometry("900x600")
+        window.configure(bg='#ecf0f1')
         
-        tree.tag_configure('low_stock', background='#fff3cd')
-        tree.tag_configure('out_stock', background='#ffcccc')
+        # Search frame
+        search_frame = tk.Frame(window, bg='#ecf0f1', padx=20, pady=10)
+        search_frame.pack(fill=tk.X)
         
-        # Summary
-        summary_frame = tk.Frame(window, bg='#ecf0f1', padx=20, pady=10)
-        summary_frame.pack(fill=tk.X)
+        tk.Label(search_frame, text="Product ID:", font=('Arial', 11), bg='#ecf0f1').pack(side=tk.LEFT, padx=5)
+        product_var = tk.StringVar()
+        product_entry = tk.Entry(search_frame, textvariable=product_var, font=('Arial', 11), width=30)
+        product_entry.pack(side=tk.LEFT, padx=5)
+        product_entry.focus()
+        
+        # Movements list
+        list_frame = tk.Frame(window, bg='#ecf0f1', padx=20)
+        list_frame.pack(fill=tk.BOTH, expand=True)
         
-        tk.Label(summary_frame, text=f"Low Stock Items: {low_stock_count}", 
-                font=('Arial', 12, 'bold'), bg='#fff3cd', padx=20, pady=10).pack(side=tk.LEFT, padx=10)
-        tk.Label(summary_frame, text=f"Out of Stock Items: {out_of_stock_count}", 
-                font=('Arial', 12, 'bold'), bg='#ffcccc', padx=20, pady=10).pack(side=tk.LEFT, padx=10)
+        columns = ('Date', 'Action', 'Quantity', 'Details')
+        tree = ttk.Treeview(list_frame, columns=columns, show='tree headings', height=20)
+        
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=180)
+        
+        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscroll=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        tree.pack(fill=tk.BOTH, expand=True, pady=10)
+        
+        def show_history():
+            # History is read from the store only now, for this one product
+            tree.delete(*tree.get_children())
+            product_id = product_var.get().strip().upper()
+            if not product_id:
+                return
+            for entry in reversed(self.store.product_history(product_id)):
+                if entry['action'] == 'Updated':
+                    quantity = entry['new_quantity']
+                    details = f"{entry['old_quantity']} -> {entry['new_quantity']}"
+                elif entry['action'] == 'Returned':
+                    quantity = entry['quantity']
+                    details = f"Sale {entry['sale_id']}"
+                elif entry['action'] == 'Removed':
+                    quantity = entry['product_data']['quantity']
+                    details = entry['product_data']['name']
+                else:
+                    quantity = entry['quantity']
+                    details = ''
+                tree.insert('', tk.END, values=(entry['date'], entry['action'], quantity, details))
+        
+        product_entry.bind('<Return>', lambda e: show_history())
+        tk.Button(search_frame, text="Show", command=show_history,
+                 bg='#3498db', fg='white', font=('Arial', 10, 'bold')).pack(side=tk.LEFT, padx=5)
     
+    # Running totals, updated by every commit
     def calculate_total_stock_value(self):
-        return sum(prod['purchase_price'] * prod['quantity'] for prod in self.products.values())
+        return round(self.totals.stock_value, 2)
     
     def count_low_stock(self):
-        return sum(1 for prod in self.products.values() if prod['quantity'] <= prod['min_stock'])
+        return self.low_stock.count
     
     def calculate_today_sales(self):
-        today = datetime.now().strftime("%Y-%m-%d")
-        return sum(sale['total'] for sale in self.sales if sale['date'].startswith(today))
+        return round(self.totals.today_sales(), 2)
     
     def refresh_dashboard(self):
-        self.root.destroy()
-        root = tk.Tk()
-        app = GarmentShopManager(root)
-        root.mainloop()
+        # The stat cards follow the model, nothing is rebuilt or reloaded
+        self.stats.update(len(self.products), self.calculate_total_stock_value(),
+                          self.count_low_stock(), self.calculate_today_sales())
     
-    def save_data(self):
-        data = {
-            'products': self.products,
-            'sales': self.sales,
-            'stock_history': self.stock_history,
-            'barcode_counter': self.barcode_counter
-        }
-        with open('shop_data.json', 'w') as f:
-            json.dump(data, f, indent=4)
+    def commit(self, record):
+        try:
+            self.totals.commit(record)
+        finally:
+            for pid in changed_products(record):
+                self.index.update(pid)
     
-    def load_data(self):
-        if os.path.exists('shop_data.json'):
-            try:
-                with open('shop_data.json', 'r') as f:
-                    data = json.load(f)
-                    self.products = data.get('products', {})
-                    self.sales = data.get('sales', [])
-                    self.stock_history = data.get('stock_history', [])
-                    self.barcode_counter = data.get('barcode_counter', 1)
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to load data: {str(e)}")
+    def shutdown(self):
+        self.store.close()
+    
+    def exit(self):
+        self.shutdown()
+        self.root.quit()
     
     def backup_data(self):
         filename = filedialog.asksaveasfilename(
@@ -1191,9 +1338,11 @@ class GarmentShopManager:
             initialfile=f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
         )
         if filename:
-            self.save_data()
-            import shutil
-            shutil.copy('shop_data.json', filename)
+            try:
+                self.store.backup(filename)
+            except Exception as e:
+                messagebox.showerror("Error", f"Failed to back up data: {str(e)}")
+                return
             messagebox.showinfo("Success", f"Data backed up to {filename}")
     
     def restore_data(self):
@@ -1204,11 +1353,9 @@ class GarmentShopManager:
             try:
                 with open(filename, 'r') as f:
                     data = json.load(f)
-                    self.products = data.get('products', {})
-                    self.sales = data.get('sales', [])
-                    self.stock_history = data.get('stock_history', [])
-                    self.barcode_counter = data.get('barcode_counter', 1)
-                    self.save_data()
+                self.store.restore(data)
+                self.totals.recompute()
+                self.index.rebuild()
                 messagebox.showinfo("Success", "Data restored successfully!")
                 self.refresh_dashboard()
             except Exception as e:
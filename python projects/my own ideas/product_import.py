@@ -0,0 +1,203 @@
+import csv
+import json
+import os
+import time
+
+from inventory_core import timestamp
+
+BATCH_SIZE = 5000           # rows per executemany call
+TRANSACTION_ROWS = 50000    # rows per commit
+BARCODE_BLOCK = 1000        # barcodes reserved at a time for rows without one
+
+# Accepted column names -> products column
+COLUMN_ALIASES = {
+    'barcode': 'barcode', 'code': 'barcode',
+    'name': 'name', 'product name': 'name', 'product': 'name',
+    'category': 'category',
+    'size': 'size',
+    'color': 'color', 'colour': 'color',
+    'cost_price': 'cost_price', 'cost': 'cost_price', 'purchase_price': 'cost_price',
+    'selling_price': 'selling_price', 'price': 'selling_price',
+    'stock_quantity': 'stock_quantity', 'stock': 'stock_quantity', 'quantity': 'stock_quantity',
+    'min_stock_level': 'min_stock_level', 'min_stock': 'min_stock_level',
+}
+
+
+class ImportResult:
+    def __init__(self):
+        self.imported = 0
+        self.rejected = 0
+        self.reject_path = None
+        self.seconds = 0.0
+
+
+def iter_csv(path):
+    with open(path, 'r', newline='', encoding='utf-8-sig') as f:
+        yield from csv.DictReader(f)
+
+
+def iter_json(path, chunk_size=64 * 1024):
+    # JSON Lines files are one object per line, plain JSON must be an array of
+    # objects which is decoded one element at a time instead of loaded whole
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        if path.lower().endswith(('.jsonl', '.ndjson')):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+
+        decoder = json.JSONDecoder()
+        buffer = ''
+        eof = False
+        started = False
+
+        def read_more():
+            nonlocal buffer, eof
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+
+        while True:
+            buffer = buffer.lstrip()
+            if not buffer:
+                if eof:
+                    raise ValueError("Unexpected end of JSON file")
+                read_more()
+                continue
+            if not started:
+                if buffer[0] != '[':
+                    raise ValueError("JSON import expects an array of products")
+                buffer = buffer[1:]
+                started = True
+                continue
+            if buffer[0] == ']':
+                return
+            if buffer[0] == ',':
+                buffer = buffer[1:]
+                continue
+            try:
+                obj, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                read_more()
+                continue
+            yield obj
+            buffer = buffer[end:]
+
+
+def iter_rows(path):
+    if path.lower().endswith(('.json', '.jsonl', '.ndjson')):
+        return iter_json(path)
+    return iter_csv(path)
+
+
+def validate(raw):
+    if not isinstance(raw, dict):
+        raise ValueError("Expected a product object")
+
+    row = {}
+    for key, value in raw.items():
+        column = COLUMN_ALIASES.get(str(key).strip().lower())
+        if column:
+            row[column] = value.strip() if isinstance(value, str) else value
+
+    name = row.get('name')
+    if not name:
+        raise ValueError("Product name is required")
+
+    barcode = row.get('barcode')
+    barcode = str(barcode) if barcode not in (None, '') else None
+    if barcode is not None and not barcode.isdigit():
+        raise ValueError(f"Barcode must be digits only: {barcode}")
+
+    try:
+        cost = float(row.get('cost_price') or 0)
+        price = float(row.get('selling_price') or 0)
+        stock = int(row.get('stock_quantity') or 0)
+        min_level = int(row.get('min_stock_level') or 5)
+    except (TypeError, ValueError):
+        raise ValueError("Prices and quantities must be numeric")
+
+    if cost < 0 or price < 0 or stock < 0 or min_level < 0:
+        raise ValueError("Prices and quantities cannot be negative")
+
+    return [barcode, str(name), row.get('category') or '', row.get('size') or '',
+            row.get('color') or '', cost, price, stock, min_level]
+
+
+class BarcodeAllocator:
+    def __init__(self, db, taken):
+        self.db = db
+        self.taken = taken
+        self.block = []
+
+    def next(self):
+        while True:
+            if not self.block:
+                self.block = self.db.reserve_barcodes(BARCODE_BLOCK)[::-1]
+            barcode = self.block.pop()
+            if barcode not in self.taken:
+                return barcode
+
+
+def import_products(db, path, reject_path=None):
+    result = ImportResult()
+    start = time.perf_counter()
+    reject_path = reject_path or os.path.splitext(path)[0] + '.rejects.csv'
+
+    # Existing barcodes are checked in memory so a duplicate never fails a whole batch
+    taken = {row[0] for row in db.conn.execute('SELECT barcode FROM products')}
+    allocator = BarcodeAllocator(db, taken)
+    now = timestamp()
+
+    reject_file = None
+    reject_writer = None
+    batch = []
+    in_transaction = 0
+
+    def flush():
+        nonlocal batch, in_transaction
+        if batch:
+            db.insert_products(batch)
+            result.imported += len(batch)
+            in_transaction += len(batch)
+            batch = []
+        if in_transaction >= TRANSACTION_ROWS:
+            db.commit()
+            in_transaction = 0
+
+    try:
+        for number, raw in enumerate(iter_rows(path), start=1):
+            try:
+                row = validate(raw)
+                if row[0] is None:
+                    row[0] = allocator.next()
+                elif row[0] in taken:
+                    raise ValueError(f"Barcode already exists: {row[0]}")
+                taken.add(row[0])
+            except ValueError as e:
+                if reject_writer is None:
+                    reject_file = open(reject_path, 'w', newline='', encoding='utf-8')
+                    reject_writer = csv.writer(reject_file)
+                    reject_writer.writerow(['Row', 'Reason', 'Data'])
+                reject_writer.writerow([number, str(e), json.dumps(raw, ensure_ascii=False)])
+                result.rejected += 1
+                continue
+
+            batch.append((*row, now, now))
+            if len(batch) >= BATCH_SIZE:
+                flush()
+        flush()
+        db.commit()
+    except Exception:
+        # Batches committed before the failure stay imported
+        db.conn.rollback()
+        raise
+    finally:
+        if reject_file:
+            reject_file.close()
+
+    result.reject_path = reject_path if result.rejected else None
+    result.seconds = time.perf_counter() - start
+    return result
@@ -0,0 +1,120 @@
+from array import array
+from bisect import bisect_left
+from itertools import islice
+
+RESULT_LIMIT = 200   # rows a product picker shows for one search
+GRAM = 3             # length of the n-grams in the index
+FACETS = ('category', 'size', 'color')  # fields the stock report filters on
+
+
+def grams_of(text):
+    return {text[i:i + GRAM] for i in range(len(text) - GRAM + 1)}
+
+
+def search_text(product):
+    # What a search is matched against, lowercased once when the product changes
+    return f"{product['name']}\n{product['id']}\n{product['barcode']}".lower()
+
+
+class ProductIndex:
+    # Substring search over the products' name, id and barcode. Every product gets a
+    # number in catalogue order and each trigram of its text lists the numbers holding
+    # it, in order. A search walks the shortest list among the term's trigrams and
+    # checks those texts only. Entries left behind by edits and removals are weeded
+    # out by that check, so a change never has to take anything out.
+    # Each facet maps its values to the ids of the products having them, so filters
+    # on several facets are a set intersection and their counts are set sizes.
+    def __init__(self, products):
+        self.products = products  # the store's dict, kept in step by update()
+        self.rebuild()
+
+    def rebuild(self):
+        self.ids = []      # number -> product id, None once removed
+        self.texts = []    # number -> search text, None once removed
+        self.numbers = {}  # product id -> number
+        self.codes = []    # number -> barcode
+        self.barcodes = {}  # barcode -> product id, for scanning
+        self.values = []   # number -> the product's facet values
+        self.facets = {field: {} for field in FACETS}  # field -> value -> product ids
+        self.grams = {}    # trigram -> ascending numbers of the products that had it
+        for pid in self.products:
+            self.update(pid)
+
+    def update(self, pid):
+        # Brings one product's entry in line with self.products after a change
+        product = self.products.get(pid)
+        number = self.numbers.get(pid)
+        if number is None:
+            if product is None:
+                return
+            number = self.numbers[pid] = len(self.ids)
+            self.ids.append(pid)
+            self.texts.append(None)
+            self.codes.append(None)
+            self.values.append(None)
+            old = set()
+        else:
+            if self.barcodes.get(self.codes[number]) == pid:
+                del self.barcodes[self.codes[number]]
+            for field, value in zip(FACETS, self.values[number]):
+                ids = self.facets[field][value]
+                ids.discard(pid)
+                if not ids:
+                    del self.facets[field][value]
+            if product is None:
+                del self.numbers[pid]
+                self.ids[number] = self.texts[number] = self.codes[number] = self.values[number] = None
+                return
+            old = grams_of(self.texts[number])
+        self.codes[number] = product['barcode']
+        self.barcodes[product['barcode']] = pid
+        self.values[number] = tuple(product[field] for field in FACETS)
+        for field, value in zip(FACETS, self.values[number]):
+            self.facets[field].setdefault(value, set()).add(pid)
+        text = self.texts[number] = search_text(product)
+        for gram in grams_of(text) - old:
+            numbers = self.grams.get(gram)
+            if numbers is None:
+                numbers = self.grams[gram] = array('I')
+            if not numbers or numbers[-1] < number:
+                numbers.append(number)
+            else:
+                # An edited product keeps its place in the catalogue order
+                i = bisect_left(numbers, number)
+                if i == len(numbers) or numbers[i] != number:
+                    numbers.insert(i, number)
+
+    def scan(self, code):
+        # Product id for a complete barcode, None if no product has it
+        return self.barcodes.get(code.strip())
+
+    def facet_ids(self, chosen):
+        # Ids of the products having every chosen value ({field: value}, None for any),
+        # None when nothing is chosen
+        sets = sorted((self.facets[field].get(value, set()) for field, value in chosen.items()
+                       if value is not None), key=len)
+        if not sets:
+            return None
+        return sets[0].intersection(*sets[1:])
+
+    def facet_counts(self, field, chosen):
+        # {value: products having it} among the products matching the other chosen values
+        within = self.facet_ids({other: value for other, value in chosen.items() if other != field})
+        return {value: len(ids) if within is None else len(ids & within)
+                for value, ids in sorted(self.facets[field].items())}
+
+    def search(self, term='', limit=RESULT_LIMIT, within=None):
+        # Ids of the matching products in catalogue order, at most `limit` (None for all);
+        # `within` keeps only the ids in a set such as facet_ids() returns
+        term = term.lower()
+        numbers = range(len(self.texts))
+        if len(term) >= GRAM:
+            numbers = min((self.grams.get(gram, ()) for gram in grams_of(term)), key=len)
+        if within is not None:
+            if len(within) < len(numbers):
+                numbers = sorted(self.numbers[pid] for pid in within)
+            else:
+                numbers = (n for n in numbers if self.ids[n] in within)
+        texts = self.texts
+        found = (n for n in numbers if texts[n] is not None and term in texts[n])
+        return [self.ids[n] for n in islice(found, limit)]
@@ -0,0 +1,207 @@
+from inventory_core import InventoryError, timestamp
+
+KINDS = ('percent', 'buy_x_get_y')
+SCOPES = ('all', 'barcode', 'category', 'size')
+
+
+class Promotion:
+    __slots__ = ('id', 'name', 'kind', 'scope', 'target', 'percent', 'buy_qty', 'free_qty',
+                 'starts', 'ends')
+
+    def __init__(self, id, name, kind, scope, target, percent, buy_qty, free_qty, starts, ends):
+        self.id = id
+        self.name = name
+        self.kind = kind
+        self.scope = scope
+        self.target = target
+        self.percent = percent or 0
+        self.buy_qty = buy_qty or 0
+        self.free_qty = free_qty or 0
+        self.starts = starts
+        self.ends = ends
+
+    def is_live(self, now):
+        return (not self.starts or self.starts <= now) and (not self.ends or now <= self.ends)
+
+    def discount(self, price, quantity):
+        # Discount per unit for `quantity` units at `price`
+        if self.kind == 'percent':
+            return price * self.percent / 100
+        # Every buy_qty + free_qty units, free_qty of them cost nothing
+        group = self.buy_qty + self.free_qty
+        free = quantity // group * self.free_qty if group else 0
+        return price * free / quantity if quantity else 0
+
+
+class PromotionIndex:
+    # Rules bucketed by what they match on, so pricing a line only looks at
+    # the rules for its barcode, category and size plus the store-wide ones
+    def __init__(self, promotions=()):
+        self.by_barcode = {}
+        self.by_category = {}
+        self.by_size = {}
+        self.store_wide = []
+        for promotion in promotions:
+            self.add(promotion)
+
+    def add(self, promotion):
+        target = (promotion.target or '').strip().lower()
+        if promotion.scope == 'barcode':
+            self.by_barcode.setdefault(target, []).append(promotion)
+        elif promotion.scope == 'category':
+            self.by_category.setdefault(target, []).append(promotion)
+        elif promotion.scope == 'size':
+            self.by_size.setdefault(target, []).append(promotion)
+        else:
+            self.store_wide.append(promotion)
+
+    def matching(self, product):
+        return (self.by_barcode.get(str(product.barcode).lower(), []) +
+                self.by_category.get((product.category or '').lower(), []) +
+                self.by_size.get((product.size or '').lower(), []) +
+                self.store_wide)
+
+    def best(self, product, quantity, now):
+        # (discount per unit, promotion) giving the customer the lowest price, promotions don't stack
+        best_discount, best_promotion = 0, None
+        for promotion in self.matching(product):
+            if promotion.is_live(now):
+                discount = promotion.discount(product.selling_price, quantity)
+                if discount > best_discount:
+                    best_discount, best_promotion = discount, promotion
+        return best_discount, best_promotion
+
+
+class PromotionEngine:
+    def __init__(self, db):
+        self.db = db
+        self.index = PromotionIndex()
+        self.reload()
+
+    def reload(self):
+        # Expired promotions never match again, so they are not loaded
+        cursor = self.db.conn.cursor()
+        cursor.execute('''
+            SELECT id, name, kind, scope, target, percent, buy_qty, free_qty, starts, ends
+            FROM promotions
+            WHERE active = 1 AND (ends IS NULL OR ends = '' OR ends >= ?)
+        ''', (timestamp(),))
+        self.index = PromotionIndex(Promotion(*row) for row in cursor.fetchall())
+
+    def all_promotions(self):
+        cursor = self.db.conn.cursor()
+        cursor.execute('''
+            SELECT id, name, kind, scope, target, percent, buy_qty, free_qty, starts, ends, active
+            FROM promotions ORDER BY active DESC, id DESC
+        ''')
+        return cursor.fetchall()
+
+    def add(self, name, kind, scope, target='', percent=0, buy_qty=0, free_qty=0, starts='', ends=''):
+        if not name:
+            raise InventoryError("Promotion name is required!")
+        if kind not in KINDS or scope not in SCOPES:
+            raise InventoryError("Unknown promotion type!")
+        if scope != 'all' and not target:
+            raise InventoryError(f"Enter the {scope} the promotion applies to!")
+        if kind == 'percent' and not 0 < percent <= 100:
+            raise InventoryError("Discount must be between 0 and 100!")
+        if kind == 'buy_x_get_y' and (buy_qty < 1 or free_qty < 1):
+            raise InventoryError("Buy and free quantities must be at least 1!")
+        if starts and ends and ends < starts:
+            raise InventoryError("Promotion ends before it starts!")
+
+        cursor = self.db.conn.cursor()
+        cursor.execute('''
+            INSERT INTO promotions (name, kind, scope, target, percent, buy_qty, free_qty,
+                                    starts, ends, active)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
+        ''', (name, kind, scope, target, percent, buy_qty, free_qty, starts, ends))
+        self.db.commit()
+        self.reload()
+        return cursor.lastrowid
+
+    def deactivate(self, promotion_id):
+        cursor = self.db.conn.cursor()
+        cursor.execute('UPDATE promotions SET active = 0 WHERE id = ?', (promotion_id,))
+        self.db.commit()
+        self.reload()
+
+
+class CartLine:
+    __slots__ = ('product', 'quantity', 'discount', 'promotion')
+
+    def __init__(self, product):
+        self.product = product
+        self.quantity = 0
+        self.discount = 0  # per unit
+        self.promotion = None
+
+    @property
+    def subtotal(self):
+        return self.product.selling_price * self.quantity
+
+    @property
+    def total(self):
+        return (self.product.selling_price - self.discount) * self.quantity
+
+
+class Cart:
+    # Scanning an item re-prices only its own line and adjusts the running totals
+    def __init__(self, engine):
+        self.engine = engine
+        self.lines = {}  # barcode -> CartLine, in scan order
+        self.bargain_percent = 0
+        self.subtotal = 0
+        self.discount = 0
+
+    @property
+    def total(self):
+        return self.subtotal - self.discount
+
+    def add(self, product, quantity=1):
+        line = self.lines.get(product.barcode)
+        if line is None:
+            line = self.lines[product.barcode] = CartLine(product)
+        self._reprice(line, line.quantity + quantity)
+        return line
+
+    def remove(self, barcode):
+        line = self.lines.pop(barcode, None)
+        if line:
+            self.subtotal -= line.subtotal
+            self.discount -= line.discount * line.quantity
+        return line
+
+    def set_bargain(self, percent):
+        # A haggled percentage is compared with the promotions on every line
+        self.bargain_percent = percent
+        for line in self.lines.values():
+            self._reprice(line, line.quantity)
+
+    def clear(self):
+        self.lines.clear()
+        self.bargain_percent = 0
+        self.subtotal = 0
+        self.discount = 0
+
+    def _reprice(self, line, quantity):
+        self.subtotal -= line.subtotal
+        self.discount -= line.discount * line.quantity
+
+        price = line.product.selling_price
+        discount, promotion = self.engine.index.best(line.product, quantity, timestamp())
+        bargain = price * self.bargain_percent / 100
+        if bargain > discount:
+            discount, promotion = bargain, None
+        line.quantity = quantity
+        line.discount = discount
+        line.promotion = promotion
+
+        self.subtotal += line.subtotal
+        self.discount += line.discount * line.quantity
+
+    def sale_lines(self):
+        # Lines for inventory_core.checkout, each records the promotion it got
+        return [(line.product.barcode, line.product.name, line.quantity, line.product.selling_price,
+                 line.discount, line.total, line.promotion.id if line.promotion else None)
+                for line in self.lines.values()]
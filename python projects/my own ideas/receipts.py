@@ -0,0 +1,199 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import zlib
+
+from inventory_core import timestamp
+
+SHOP_NAME = "GARMENTS SHOP"
+FOOTER = "Thank you for shopping with us!"
+RECEIPT_WIDTH = 42        # characters per line on an 80mm printer (32 for 58mm)
+OUTPUT_DIR = 'receipts_out'
+PRINTER_DEVICE = None     # e.g. '/dev/usb/lp0' or a shared printer path, None writes files
+
+# ESC/POS commands
+ESC_INIT = b'\x1b@'
+ESC_ALIGN = {'left': b'\x1ba\x00', 'center': b'\x1ba\x01', 'right': b'\x1ba\x02'}
+ESC_BOLD_ON = b'\x1bE\x01'
+ESC_BOLD_OFF = b'\x1bE\x00'
+ESC_CUT = b'\x1dV\x41\x03'  # feed three lines and cut
+
+
+class Receipt:
+    def __init__(self, lines, receipt_date=None, receipt_id=None, reprint=False):
+        # lines: (barcode, name, quantity, price, discount per unit, total, offer name)
+        self.lines = lines
+        self.receipt_date = receipt_date or timestamp()
+        self.receipt_id = receipt_id
+        self.reprint = reprint
+
+    @property
+    def subtotal(self):
+        return sum(line[2] * line[3] for line in self.lines)
+
+    @property
+    def discount(self):
+        return sum(line[2] * line[4] for line in self.lines)
+
+    @property
+    def total(self):
+        return sum(line[5] for line in self.lines)
+
+    def to_payload(self):
+        # Compact copy for reprinting, a typical receipt is a couple of hundred bytes
+        data = {'date': self.receipt_date, 'lines': self.lines}
+        return zlib.compress(json.dumps(data, separators=(',', ':')).encode('utf-8'), 9)
+
+    @classmethod
+    def from_payload(cls, receipt_id, payload):
+        data = json.loads(zlib.decompress(payload).decode('utf-8'))
+        return cls([tuple(line) for line in data['lines']], data['date'], receipt_id, reprint=True)
+
+
+class ReceiptTemplate:
+    # Layout is worked out once; rendering only calls the prepared format methods
+    def __init__(self, width=RECEIPT_WIDTH, shop_name=SHOP_NAME, footer=FOOTER):
+        self.width = width
+        self.rule = '-' * width
+        self.shop_name = shop_name.center(width)
+        self.footer = footer.center(width)
+        self.heading = f"{{:<{width - 20}}}{{:>20}}".format
+        self.name = f"{{:<{width}.{width}}}".format
+        self.amount = f"{{:<{width - 14}.{width - 14}}}{{:>14.2f}}".format
+        self.total_line = f"{{:<{width - 18}}}{{:>18}}".format
+
+    def render(self, receipt):
+        # [(style, text)] where style is 'center', 'bold' or '' and the text is one printed line
+        out = [('bold', self.shop_name)]
+        if receipt.reprint:
+            out.append(('center', "*** REPRINT ***".center(self.width)))
+        out.append(('', self.heading(f"Receipt #{receipt.receipt_id or '-'}", receipt.receipt_date[:16])))
+        out.append(('', self.rule))
+        for barcode, name, quantity, price, discount, total, offer in receipt.lines:
+            out.append(('', self.name(name)))
+            out.append(('', self.amount(f"  {quantity} x {price:.2f}", quantity * price)))
+            if discount:
+                out.append(('', self.amount(f"  {offer or 'Discount'}", -discount * quantity)))
+        out.append(('', self.rule))
+        out.append(('', self.amount("Subtotal", receipt.subtotal)))
+        if receipt.discount:
+            out.append(('', self.amount("Discount", -receipt.discount)))
+        out.append(('bold', self.total_line("TOTAL", f"Rs. {receipt.total:.2f}")))
+        out.append(('', self.rule))
+        out.append(('center', self.footer))
+        return out
+
+    def text(self, receipt):
+        return '\n'.join(line for style, line in self.render(receipt)) + '\n'
+
+    def escpos(self, receipt):
+        out = [ESC_INIT]
+        for style, line in self.render(receipt):
+            data = line.strip().encode('ascii', 'replace') if style == 'center' else line.encode('ascii', 'replace')
+            if style == 'bold':
+                out += [ESC_BOLD_ON, data, b'\n', ESC_BOLD_OFF]
+            elif style == 'center':
+                out += [ESC_ALIGN['center'], data, b'\n', ESC_ALIGN['left']]
+            else:
+                out += [data, b'\n']
+        out.append(ESC_CUT)
+        return b''.join(out)
+
+
+class FileSink:
+    # Stands in for the printer: one file per receipt
+    def __init__(self, directory=OUTPUT_DIR, escpos=False):
+        self.directory = directory
+        self.escpos = escpos
+
+    def send(self, template, receipt):
+        os.makedirs(self.directory, exist_ok=True)
+        suffix = '_reprint' if receipt.reprint else ''
+        if self.escpos:
+            path = os.path.join(self.directory, f"receipt_{receipt.receipt_id}{suffix}.bin")
+            with open(path, 'wb') as f:
+                f.write(template.escpos(receipt))
+        else:
+            path = os.path.join(self.directory, f"receipt_{receipt.receipt_id}{suffix}.txt")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(template.text(receipt))
+        return path
+
+
+class DeviceSink:
+    # Raw ESC/POS to a printer device or shared printer path
+    def __init__(self, device=PRINTER_DEVICE):
+        self.device = device
+
+    def send(self, template, receipt):
+        with open(self.device, 'wb') as f:
+            f.write(template.escpos(receipt))
+        return self.device
+
+
+def default_sink():
+    return DeviceSink(PRINTER_DEVICE) if PRINTER_DEVICE else FileSink()
+
+
+class ReceiptSpooler:
+    # Prints receipts on a background thread so the till never waits on the
+    # printer. Receipts are stored with their sale before they get here; the
+    # thread's own connection only reads them back for reprints.
+    def __init__(self, db_path, sink=None, template=None):
+        self.db_path = db_path
+        self.sink = sink or default_sink()
+        self.template = template or ReceiptTemplate()
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()  # (receipt id, error message or None)
+        self.thread = None
+
+    def submit(self, receipt):
+        # A receipt already stored by inventory_core.checkout
+        self._start()
+        self.jobs.put(('print', receipt))
+
+    def reprint(self, receipt_id):
+        self._start()
+        self.jobs.put(('reprint', receipt_id))
+
+    def pending(self):
+        return self.jobs.unfinished_tasks > 0
+
+    def wait(self):
+        self.jobs.join()
+
+    def _start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            while True:
+                kind, job = self.jobs.get()
+                receipt_id = None
+                try:
+                    if kind == 'print':
+                        receipt = job
+                        receipt_id = receipt.receipt_id
+                    else:
+                        receipt_id = job
+                        receipt = load_receipt(conn, receipt_id)
+                        if receipt is None:
+                            raise LookupError(f"Receipt #{receipt_id} not found!")
+                    self.sink.send(self.template, receipt)
+                    self.results.put((receipt_id, None))
+                except Exception as e:
+                    self.results.put((receipt_id, str(e)))
+                finally:
+                    self.jobs.task_done()
+        finally:
+            conn.close()
+
+
+def load_receipt(conn, receipt_id):
+    row = conn.execute('SELECT payload FROM receipts WHERE id = ?', (receipt_id,)).fetchone()
+    return Receipt.from_payload(receipt_id, row[0]) if row else None
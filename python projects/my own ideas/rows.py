@@ -0,0 +1,71 @@
+from operator import itemgetter
+
+
+class Record:
+    # Fixed-shape row object. Columns are matched to slots by name, so a
+    # SELECT * keeps working when a column is added to the table; columns
+    # without a slot are ignored and slots without a column are None.
+    __slots__ = ()
+
+    def __init_subclass__(cls, **kwargs):
+        # Plain assignments are much faster than a setattr loop when building
+        # thousands of rows, so each record class gets its own __init__ (as
+        # dataclasses and namedtuple do)
+        super().__init_subclass__(**kwargs)
+        args = ', '.join(f"{name}=None" for name in cls.__slots__)
+        body = ''.join(f"\n    self.{name} = {name}" for name in cls.__slots__)
+        namespace = {}
+        exec(f"def __init__(self, {args}):{body}", namespace)
+        cls.__init__ = namespace['__init__']
+
+    def values(self, names=None):
+        return tuple(getattr(self, name) for name in (names or self.__slots__))
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.values() == other.values()
+
+
+class Product(Record):
+    __slots__ = ('id', 'barcode', 'name', 'category', 'size', 'color', 'cost_price',
+                 'selling_price', 'stock_quantity', 'min_stock_level', 'date_added',
+                 'last_updated', 'reorder_quantity')
+
+
+class Sale(Record):
+    __slots__ = ('id', 'barcode', 'product_name', 'quantity', 'original_price',
+                 'discount_price', 'final_price', 'sale_date', 'promotion_id')
+
+
+class Return(Record):
+    __slots__ = ('id', 'barcode', 'product_name', 'quantity', 'reason', 'return_date',
+                 'sale_id')
+
+
+class Exchange(Record):
+    __slots__ = ('id', 'old_barcode', 'new_barcode', 'old_product', 'new_product',
+                 'exchange_date')
+
+
+_factories = {}
+
+
+def record_factory(record, description):
+    # sqlite3 row_factory building `record` objects for a cursor with this description.
+    # The column -> slot mapping is worked out once per query shape, not per row.
+    columns = tuple(column[0] for column in description)
+    key = (record, columns)
+    make = _factories.get(key)
+    if make is None:
+        index = {name: i for i, name in enumerate(columns)}
+        positions = [index.get(name) for name in record.__slots__]
+        if None not in positions:
+            getter = itemgetter(*positions)
+            make = lambda cursor, row: record(*getter(row))
+        else:
+            make = lambda cursor, row: record(*[row[i] if i is not None else None for i in positions])
+        _factories[key] = make
+    return make
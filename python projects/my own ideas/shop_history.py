@@ -0,0 +1,206 @@
+import gzip
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+
+from shop_journal import SYNC_WRITES
+
+HISTORY_DIR = 'shop_history'
+
+
+def month_of(entry):
+    date = entry.get('date') or ''
+    return date[:7] if len(date) >= 7 else datetime.now().strftime("%Y-%m")
+
+
+class HistoryLog:
+    # Stock history as one JSON-lines file per month, each line [journal seq, entry].
+    # Nothing is read at startup. Months before the current one are sealed: gzipped,
+    # with the ids of the products they mention kept beside them, so the movements
+    # of one product only open the months that have any.
+    def __init__(self, directory=HISTORY_DIR):
+        self.directory = directory
+        self.last_seq = 0            # newest journal record whose entries are stored
+        self.sealed_ids = {}         # month -> product ids in it, read when first needed
+        self.lock = threading.Lock() # the sealing thread swaps files under appends
+        self.sealer = None
+
+    def path(self, month, suffix='.jsonl'):
+        return os.path.join(self.directory, month + suffix)
+
+    def months(self):
+        # [(month, sealed)] oldest first
+        if not os.path.isdir(self.directory):
+            return []
+        found = {}
+        for name in os.listdir(self.directory):
+            if name.endswith('.jsonl'):
+                found.setdefault(name[:-6], False)
+            elif name.endswith('.jsonl.gz'):
+                found[name[:-9]] = True
+        return sorted(found.items())
+
+    def open(self):
+        # Finds the last sequence stored so replaying the journal after a crash
+        # does not store entries twice, and seals months that have ended
+        months = self.months()
+        if months:
+            month, sealed = months[-1]
+            if sealed:
+                for seq, entry in self.read(month, True):
+                    self.last_seq = seq
+            else:
+                path = self.path(month)
+                good = 0
+                with open(path, 'rb') as f:
+                    for line in f:
+                        try:
+                            self.last_seq = json.loads(line)[0]
+                        except ValueError:
+                            break
+                        good += len(line)
+                if good < os.path.getsize(path):
+                    # A line cut short by a crash, the journal still has it
+                    with open(path, 'r+b') as f:
+                        f.truncate(good)
+        self.seal_later()
+
+    def append(self, entries, seq):
+        if not entries or seq <= self.last_seq:
+            return
+        by_month = {}
+        for entry in entries:
+            by_month.setdefault(month_of(entry), []).append(entry)
+        new_month = False
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            for month, rows in by_month.items():
+                lines = ''.join(json.dumps([seq, entry], separators=(',', ':')) + '\n' for entry in rows)
+                if os.path.exists(self.path(month, '.jsonl.gz')):
+                    # An entry dated in a sealed month, e.g. after the clock was changed
+                    with gzip.open(self.path(month, '.jsonl.gz'), 'at', encoding='utf-8') as f:
+                        f.write(lines)
+                    ids = self.products_in(month) | {entry.get('product_id') for entry in rows}
+                    self.write_ids(month, ids)
+                    continue
+                path = self.path(month)
+                new_month = new_month or not os.path.exists(path)
+                with open(path, 'a', encoding='utf-8') as f:
+                    f.write(lines)
+                    if SYNC_WRITES:
+                        f.flush()
+                        os.fsync(f.fileno())
+        self.last_seq = seq
+        if new_month:
+            self.seal_later()
+
+    def lines(self, month, sealed):
+        if sealed:
+            f = gzip.open(self.path(month, '.jsonl.gz'), 'rt', encoding='utf-8')
+        else:
+            f = open(self.path(month), 'r', encoding='utf-8')
+        with f:
+            yield from f
+
+    def read(self, month, sealed, needle=None):
+        # (seq, entry) pairs of one month; lines without `needle` are not parsed at all
+        for line in self.lines(month, sealed):
+            if needle is not None and needle not in line:
+                continue
+            try:
+                seq, entry = json.loads(line)
+            except ValueError:
+                continue
+            yield seq, entry
+
+    def products_in(self, month):
+        ids = self.sealed_ids.get(month)
+        if ids is None:
+            with open(self.path(month, '.products.json'), 'r', encoding='utf-8') as f:
+                ids = self.sealed_ids[month] = set(json.load(f))
+        return ids
+
+    def write_ids(self, month, ids):
+        tmp = self.path(month, '.products.json.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(sorted(i for i in ids if i is not None), f)
+        os.replace(tmp, self.path(month, '.products.json'))
+        self.sealed_ids[month] = set(ids)
+
+    def for_product(self, product_id):
+        # Oldest first
+        needle = '"product_id":' + json.dumps(product_id)
+        found = []
+        for month, sealed in self.months():
+            if sealed and product_id not in self.products_in(month):
+                continue
+            found.extend(entry for seq, entry in self.read(month, sealed, needle)
+                         if entry.get('product_id') == product_id)
+        return found
+
+    def entries(self, max_seq=None):
+        # Every entry oldest first, optionally only those from journal records up to max_seq
+        for month, sealed in self.months():
+            for seq, entry in self.read(month, sealed):
+                if max_seq is None or seq <= max_seq:
+                    yield entry
+
+    def seal_later(self):
+        if self.sealer is None or not self.sealer.is_alive():
+            self.sealer = threading.Thread(target=self.seal, daemon=True)
+            self.sealer.start()
+
+    def seal(self):
+        # Compresses every month before the current one; runs on a background thread
+        current = datetime.now().strftime("%Y-%m")
+        for month, sealed in self.months():
+            if sealed or month >= current:
+                continue
+            path = self.path(month)
+            size = os.path.getsize(path)
+            ids = set()
+            tmp = self.path(month, '.jsonl.gz.tmp')
+            with open(path, 'rb') as src, gzip.open(tmp, 'wb') as dst:
+                for line in src:
+                    dst.write(line)
+                    ids.add(json.loads(line)[1].get('product_id'))
+            with self.lock:
+                if os.path.getsize(path) != size:
+                    # Written to while compressing, try again next time
+                    os.remove(tmp)
+                    continue
+                self.write_ids(month, ids)
+                os.replace(tmp, self.path(month, '.jsonl.gz'))
+                os.remove(path)
+
+    def replace_all(self, entries, seq):
+        # Swaps in a whole new history (a restore or the move out of shop_data.json).
+        # It is written beside the old one and renamed into place when complete.
+        if self.sealer:
+            self.sealer.join()
+        by_month = {}
+        for entry in entries:
+            by_month.setdefault(month_of(entry), []).append(entry)
+        tmp = self.directory + '.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for month, rows in by_month.items():
+            with open(os.path.join(tmp, month + '.jsonl'), 'w', encoding='utf-8') as f:
+                for entry in rows:
+                    f.write(json.dumps([seq, entry], separators=(',', ':')) + '\n')
+        with self.lock:
+            old = self.directory + '.old'
+            shutil.rmtree(old, ignore_errors=True)
+            if os.path.isdir(self.directory):
+                os.replace(self.directory, old)
+            os.replace(tmp, self.directory)
+            shutil.rmtree(old, ignore_errors=True)
+            self.sealed_ids = {}
+            self.last_seq = seq
+        self.seal_later()
+
+    def close(self):
+        if self.sealer:
+            self.sealer.join()
@@ -0,0 +1,88 @@
+import json
+import os
+import threading
+
+JOURNAL_FILE = 'shop_data.journal'
+COMPACT_AFTER = 500   # records in the journal before they are folded into shop_data.json
+SYNC_WRITES = True    # fsync every record so a finished sale survives a power cut
+
+
+class ShopJournal:
+    # Append-only log of the changes made since shop_data.json was last written.
+    # Every change is one JSON line with a sequence number and the snapshot keeps
+    # the last sequence it contains, so a record is never applied twice on replay.
+    def __init__(self, path=JOURNAL_FILE):
+        self.path = path
+        self.rotated = path + '.1'  # being folded into a snapshot
+        self.seq = 0
+        self.count = 0              # records not yet in a snapshot
+        self.file = None
+        self.rotated_seq = 0        # last sequence in the rotated journal
+        self.lock = threading.Lock()  # the snapshot writer drops the rotated journal
+
+    def replay(self, since):
+        # Yields the records newer than the snapshot, oldest first
+        for path in (self.rotated, self.path):
+            if not os.path.exists(path):
+                continue
+            with open(path, 'rb') as f:
+                good = 0
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    good += len(line)
+                    self.seq = max(self.seq, record['seq'])
+                    if path == self.rotated:
+                        self.rotated_seq = self.seq
+                    if record['seq'] > since:
+                        self.count += 1
+                        yield record
+            if path == self.path and good < os.path.getsize(path):
+                # A line cut short by a crash; the change it held never finished
+                with open(path, 'r+b') as f:
+                    f.truncate(good)
+
+    def open(self, since=0):
+        self.seq = max(self.seq, since)
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    def append(self, record):
+        self.seq += 1
+        line = json.dumps({'seq': self.seq, **record}, separators=(',', ':'))
+        self.file.write(line + '\n')
+        self.file.flush()
+        if SYNC_WRITES:
+            os.fsync(self.file.fileno())
+        self.count += 1
+        return self.seq
+
+    def rotate(self):
+        # Starts an empty journal and returns the last sequence in the old one, which
+        # is kept until a snapshot holding its records is on disk
+        with self.lock:
+            self.file.close()
+            if os.path.exists(self.rotated):
+                # An earlier snapshot is not on disk yet, keep its records too
+                with open(self.path, 'rb') as src, open(self.rotated, 'ab') as dst:
+                    dst.write(src.read())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, self.rotated)
+            self.file = open(self.path, 'a', encoding='utf-8')
+            self.count = 0
+            self.rotated_seq = self.seq
+        return self.seq
+
+    def drop_rotated(self, seq):
+        # Once a snapshot up to `seq` is on disk; records added to the rotated
+        # journal after that snapshot was taken keep it alive
+        with self.lock:
+            if self.rotated_seq <= seq and os.path.exists(self.rotated):
+                os.remove(self.rotated)
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
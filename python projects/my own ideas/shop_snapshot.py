@@ -0,0 +1,96 @@
+import json
+import os
+import threading
+import time
+
+SNAPSHOT_FILE = 'shop_data.json'
+SAVE_DELAY = 0.5   # seconds to gather a burst of saves into one write
+
+
+def write_snapshot(path, data):
+    # The old file stays whole until the new one is completely on disk
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    if hasattr(os, 'O_DIRECTORY'):
+        # Make the rename itself durable (not possible, or needed, on Windows)
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def read_snapshot(path=SNAPSHOT_FILE):
+    # None when there is no snapshot yet. A temp file left by a crash is stale,
+    # the journal still holds everything it would have added.
+    if os.path.exists(path + '.tmp'):
+        os.remove(path + '.tmp')
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def set_aside(path=SNAPSHOT_FILE):
+    # Keeps a file that could not be read instead of letting the next save replace it
+    kept = f"{path}.bad-{time.strftime('%Y%m%d_%H%M%S')}"
+    os.replace(path, kept)
+    return kept
+
+
+class SnapshotWriter:
+    # Writes snapshots on a background thread so the till never waits on the disk.
+    # Callers hand over a copy of the data; only the newest pending copy is
+    # written, so a burst of saves turns into one write.
+    def __init__(self, path=SNAPSHOT_FILE, on_saved=None):
+        self.path = path
+        self.on_saved = on_saved  # called on the writer thread with the data written
+        self.cond = threading.Condition()
+        self.pending = None
+        self.busy = False
+        self.hurry = False
+        self.error = None         # last failed write, cleared by the next good one
+        self.thread = None
+
+    def save(self, data):
+        with self.cond:
+            self.pending = data
+            self.cond.notify_all()
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def flush(self):
+        # Waits until everything handed over has been written
+        with self.cond:
+            self.hurry = True
+            self.cond.notify_all()
+            while self.pending is not None or self.busy:
+                self.cond.wait()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.pending is None:
+                    self.cond.wait()
+                deadline = time.monotonic() + SAVE_DELAY
+                while not self.hurry and time.monotonic() < deadline:
+                    self.cond.wait(deadline - time.monotonic())
+                data, self.pending = self.pending, None
+                self.busy = True
+                self.hurry = False
+            try:
+                write_snapshot(self.path, data)
+                self.error = None
+                if self.on_saved:
+                    self.on_saved(data)
+            except Exception as e:
+                self.error = e
+            finally:
+                with self.cond:
+                    self.busy = False
+                    self.cond.notify_all()
@@ -0,0 +1,118 @@
+from datetime import datetime
+
+
+def today():
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+def changed_products(record):
+    # Ids of the products a store record changes
+    op = record['op']
+    if op == 'product':
+        return {record['product']['id']}
+    if op == 'remove':
+        return {record['product_id']}
+    if op == 'sale':
+        return {item['product_id'] for item in record['sale']['items']}
+    if op == 'return':
+        return {pid for pid, qty in record['items']}
+    return set()
+
+
+class LowStock:
+    # The products at or below their minimum stock. A change re-checks only the
+    # products it touched and tells subscribers what changed, so neither the
+    # dashboard nor the alert window walks the catalogue.
+    def __init__(self, products):
+        self.items = {}  # product id -> (quantity, min_stock)
+        self.listeners = []
+        self.reload(products)
+
+    def reload(self, products):
+        # Works the set out from scratch, for a loaded or restored catalogue
+        self.products = products
+        old = self.items
+        self.items = {pid: (product['quantity'], product['min_stock'])
+                      for pid, product in products.items()
+                      if product['quantity'] <= product['min_stock']}
+        changes = dict.fromkeys(old.keys() - self.items.keys())
+        changes.update(self.items)
+        self.notify(changes)
+
+    @property
+    def count(self):
+        return len(self.items)
+
+    def subscribe(self, callback):
+        # callback(low_stock, changes) where changes maps product id -> (quantity, min_stock)
+        # or None once the product is no longer low
+        self.listeners.append(callback)
+        return lambda: self.listeners.remove(callback)
+
+    def update(self, *pids):
+        # Re-checks the products a change touched, removed ones included
+        changes = {}
+        for pid in pids:
+            product = self.products.get(pid)
+            if product is not None and product['quantity'] <= product['min_stock']:
+                self.items[pid] = changes[pid] = (product['quantity'], product['min_stock'])
+            elif self.items.pop(pid, None) is not None:
+                changes[pid] = None
+        self.notify(changes)
+        return changes
+
+    def notify(self, changes):
+        if changes:
+            for callback in list(self.listeners):
+                callback(self, changes)
+
+
+class ShopTotals:
+    # Dashboard figures kept up to date one change at a time, so reading them never
+    # walks the products or the sales. recompute() works them out from scratch.
+    def __init__(self, store):
+        self.store = store
+        self.low = LowStock({})  # products at or below their minimum stock
+        self.recompute()
+
+    def recompute(self):
+        self.stock_value = 0.0   # purchase price times quantity over every product
+        for product in self.store.products.values():
+            self.count(product, 1)
+        self.low.reload(self.store.products)
+        self.day = today()
+        self.day_sales = self.store.sales_total(self.day)
+
+    def count(self, product, sign):
+        self.stock_value += sign * product['purchase_price'] * product['quantity']
+
+    def commit(self, record):
+        # Takes the products a record changes out of the totals, has the store apply
+        # it and counts them back in as they are now
+        products = self.store.products
+        ids = changed_products(record)
+        for pid in ids:
+            if pid in products:
+                self.count(products[pid], -1)
+        try:
+            self.store.commit(record)
+        finally:
+            for pid in ids:
+                if pid in products:
+                    self.count(products[pid], 1)
+            self.low.update(*ids)
+        if record['op'] == 'sale' and record['sale']['date'].startswith(self.day):
+            self.day_sales += record['sale']['total']
+
+    def today_sales(self):
+        if self.day != today():
+            # A new day, one lookup in the store's date index
+            self.day = today()
+            self.day_sales = self.store.sales_total(self.day)
+        return self.day_sales
+
+    def check(self):
+        # Recomputes everything; True when the running figures were right
+        running = (round(self.stock_value, 2), self.low.items, round(self.today_sales(), 2))
+        self.recompute()
+        return running == (round(self.stock_value, 2), self.low.items, round(self.day_sales, 2))
@@ -0,0 +1,613 @@
+import argparse
+import bisect
+import json
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+
+from shop_history import HistoryLog, HISTORY_DIR
+from shop_journal import ShopJournal, JOURNAL_FILE, COMPACT_AFTER
+from shop_snapshot import SnapshotWriter, SNAPSHOT_FILE, read_snapshot, set_aside
+
+DATABASE_FILE = 'shop_data.db'
+STORAGE = 'json'        # or 'sqlite', which moves shop_data.json into shop_data.db on first start
+SEARCH_LIMIT = 500      # sales a search returns, newest first
+MIGRATE_BATCH = 1000    # rows per insert while migrating
+
+PRODUCT_FIELDS = ('id', 'barcode', 'secret_code', 'name', 'category', 'size', 'color',
+                  'purchase_price', 'selling_price', 'quantity', 'min_stock', 'added_date')
+SALE_FIELDS = ('sale_id', 'date', 'subtotal', 'discount_percent', 'discount_amount', 'total')
+ITEM_FIELDS = ('product_id', 'name', 'price', 'quantity')
+
+
+class ShopStore(ABC):
+    # Storage behind GarmentShopManager. Every store keeps the catalogue in
+    # self.products, which the pickers and the dashboard need in full; sales and
+    # stock history stay in the store and are read through the query methods.
+    # Changes arrive as the journal records built by the manager. A store that
+    # leaves out one of the abstract methods fails when it is created.
+    def __init__(self):
+        self.products = {}
+        self.barcode_counter = 1
+        self.sale_counter = 1   # number of the next sale, never reused
+        self.load_error = None  # shown to the user after load()
+
+    def next_sale_id(self):
+        return f"SALE{self.sale_counter:04d}"
+
+    def apply_catalogue(self, record):
+        # The part of a record that changes self.products, the same for every store
+        op = record['op']
+        if op == 'product':
+            self.products[record['product']['id']] = record['product']
+            self.barcode_counter = record.get('barcode_counter', self.barcode_counter)
+        elif op == 'remove':
+            self.products.pop(record['product_id'], None)
+        elif op == 'sale':
+            for item in record['sale']['items']:
+                if item['product_id'] in self.products:
+                    self.products[item['product_id']]['quantity'] -= item['quantity']
+            self.sale_counter = record.get('sale_counter', self.sale_counter)
+        elif op == 'return':
+            for pid, qty in record['items']:
+                if pid in self.products:
+                    self.products[pid]['quantity'] += qty
+
+    @abstractmethod
+    def load(self):
+        ...
+
+    @abstractmethod
+    def commit(self, record):
+        ...
+
+    @abstractmethod
+    def get_sale(self, sale_id):
+        ...
+
+    @abstractmethod
+    def find_sales(self, term='', limit=SEARCH_LIMIT):
+        # Newest first, sales whose id contains `term`
+        ...
+
+    @abstractmethod
+    def sales_between(self, start='', end=None):
+        # Oldest first; dates compare as text so '2024-05' is a valid start, `end` is exclusive
+        ...
+
+    def sales_total(self, start='', end=None):
+        return sum(sale['total'] for sale in self.sales_between(start, end))
+
+    @abstractmethod
+    def product_history(self, product_id):
+        ...
+
+    @abstractmethod
+    def all_history(self):
+        # Every stock movement oldest first, read lazily
+        ...
+
+    @abstractmethod
+    def restore(self, data):
+        # Replaces everything with a document in the shop_data.json layout
+        ...
+
+    def backup(self, path):
+        # Written in the shop_data.json layout a row at a time, so a backup can be
+        # restored into either store
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('{\n    "products": {')
+            for i, (pid, product) in enumerate(self.products.items()):
+                f.write(f"{',' if i else ''}\n        {json.dumps(pid)}: {json.dumps(product)}")
+            f.write('\n    },\n    "sales": [')
+            for i, sale in enumerate(self.sales_between()):
+                f.write(f"{',' if i else ''}\n        {json.dumps(sale)}")
+            f.write('\n    ],\n    "stock_history": [')
+            for i, entry in enumerate(self.all_history()):
+                f.write(f"{',' if i else ''}\n        {json.dumps(entry)}")
+            f.write(f'\n    ],\n    "barcode_counter": {self.barcode_counter},'
+                    f'\n    "sale_counter": {self.sale_counter}\n}}\n')
+
+    def close(self):
+        pass
+
+
+class JsonShopStore(ShopStore):
+    # shop_data.json snapshot plus the journal of changes made since it was written.
+    # Stock history is kept apart in monthly files and only read when asked for.
+    def __init__(self, path=SNAPSHOT_FILE, journal_path=JOURNAL_FILE, history_dir=HISTORY_DIR):
+        super().__init__()
+        self.path = path
+        self.sales = []          # in date order
+        self.sale_dates = []     # date of each sale in self.sales, for bisecting
+        self.sales_by_id = {}
+        self.history = HistoryLog(history_dir)
+        self.journal = ShopJournal(journal_path)
+        self.writer = SnapshotWriter(path, on_saved=lambda data: self.journal.drop_rotated(data['journal_seq']))
+
+    def load(self):
+        since = 0
+        moved = False
+        try:
+            data = read_snapshot(self.path)
+            if data is not None:
+                self.products.update(data.get('products', {}))
+                self.index_sales(data.get('sales', []), data.get('sale_counter'))
+                self.barcode_counter = data.get('barcode_counter', 1)
+                since = data.get('journal_seq', 0)
+                if 'stock_history' in data:
+                    # Older snapshots held the history; it is moved out once, and a
+                    # history folder means that already happened
+                    moved = True
+                    if not os.path.isdir(self.history.directory):
+                        self.history.replace_all(data['stock_history'], since)
+        except Exception as e:
+            kept = set_aside(self.path)
+            self.load_error = f"Failed to load data: {str(e)}\nThe file was kept as {kept}"
+        self.history.open()
+
+        # Changes made since the snapshot was written
+        for record in self.journal.replay(since):
+            self.apply(record, record['seq'])
+        self.journal.open(since)
+        if moved or self.journal.count >= COMPACT_AFTER:
+            self.save()
+
+    def commit(self, record):
+        # Every change is written to the journal before it is applied, a sale
+        # costs one short append however much history the shop has
+        seq = self.journal.append(record)
+        self.apply(record, seq)
+        if self.journal.count >= COMPACT_AFTER:
+            self.save()
+
+    def apply(self, record, seq):
+        # Applies one journal record, for new changes and on replay
+        self.apply_catalogue(record)
+        if record['op'] == 'sale':
+            self.add_sale(record['sale'])
+        self.history.append(record.get('history', []), seq)
+
+    def index_sales(self, sales, sale_counter=None):
+        # Snapshots keep sales in date order already, so the sort costs one pass
+        self.sales = sorted(sales, key=lambda sale: sale['date'])
+        self.sale_dates = [sale['date'] for sale in self.sales]
+        self.sales_by_id = {sale['sale_id']: sale for sale in self.sales}
+        self.sale_counter = sale_counter or first_free_sale_number(self.sales_by_id)
+
+    def add_sale(self, sale):
+        date = sale['date']
+        if not self.sale_dates or date >= self.sale_dates[-1]:
+            self.sales.append(sale)
+            self.sale_dates.append(date)
+        else:
+            # Only after the clock was put back
+            i = bisect.bisect_right(self.sale_dates, date)
+            self.sales.insert(i, sale)
+            self.sale_dates.insert(i, date)
+        self.sales_by_id[sale['sale_id']] = sale
+
+    def snapshot_data(self, seq):
+        # Copy the snapshot thread can serialise while the till keeps changing the
+        # originals; sales are never changed once added
+        return {
+            'products': {pid: dict(prod) for pid, prod in self.products.items()},
+            'sales': list(self.sales),
+            'barcode_counter': self.barcode_counter,
+            'sale_counter': self.sale_counter,
+            'journal_seq': seq
+        }
+
+    def save(self):
+        # Hands a copy of everything to the snapshot writer and starts a new journal;
+        # the old journal is deleted once the snapshot is safely on disk
+        self.writer.save(self.snapshot_data(self.journal.rotate()))
+
+    def get_sale(self, sale_id):
+        return self.sales_by_id.get(sale_id)
+
+    def find_sales(self, term='', limit=SEARCH_LIMIT):
+        term = term.lower()
+        found = []
+        for sale in reversed(self.sales):
+            if term in sale['sale_id'].lower():
+                found.append(sale)
+                if len(found) >= limit:
+                    break
+        return found
+
+    def sales_between(self, start='', end=None):
+        i = bisect.bisect_left(self.sale_dates, start)
+        j = bisect.bisect_left(self.sale_dates, end) if end is not None else len(self.sales)
+        return self.sales[i:j]
+
+    def product_history(self, product_id):
+        return self.history.for_product(product_id)
+
+    def all_history(self):
+        return self.history.entries()
+
+    def restore(self, data):
+        self.products.clear()
+        self.products.update(data.get('products', {}))
+        self.index_sales(data.get('sales', []), data.get('sale_counter'))
+        self.barcode_counter = data.get('barcode_counter', 1)
+        self.history.replace_all(data.get('stock_history', []), self.journal.seq)
+        self.save()
+
+    def close(self):
+        self.writer.flush()
+        self.history.close()
+        self.journal.close()
+
+
+class SqliteShopStore(ShopStore):
+    # Sales and history live in indexed tables and are only read when asked for;
+    # each change is one transaction
+    def __init__(self, path=DATABASE_FILE):
+        super().__init__()
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.create_tables()
+
+    def create_tables(self):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS products (
+                id TEXT PRIMARY KEY,
+                barcode TEXT,
+                secret_code TEXT,
+                name TEXT,
+                category TEXT,
+                size TEXT,
+                color TEXT,
+                purchase_price REAL,
+                selling_price REAL,
+                quantity INTEGER,
+                min_stock INTEGER,
+                added_date TEXT
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sales (
+                seq INTEGER PRIMARY KEY,
+                sale_id TEXT,
+                date TEXT,
+                subtotal REAL,
+                discount_percent REAL,
+                discount_amount REAL,
+                total REAL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_sales_sale_id ON sales(sale_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_sales_date ON sales(date)')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sale_items (
+                id INTEGER PRIMARY KEY,
+                sale_seq INTEGER,
+                product_id TEXT,
+                name TEXT,
+                price REAL,
+                quantity INTEGER
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_sale_items_sale ON sale_items(sale_seq)')
+        # The whole entry is kept as JSON, entries for different actions have different fields
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_history (
+                id INTEGER PRIMARY KEY,
+                product_id TEXT,
+                action TEXT,
+                date TEXT,
+                entry TEXT
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_stock_history_product ON stock_history(product_id, id)')
+        cursor.execute('CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value)')
+        self.conn.commit()
+
+    def load(self):
+        cursor = self.conn.execute(f"SELECT {', '.join(PRODUCT_FIELDS)} FROM products")
+        self.products.clear()
+        for row in cursor:
+            self.products[row[0]] = dict(zip(PRODUCT_FIELDS, row))
+        row = self.conn.execute("SELECT value FROM settings WHERE key = 'barcode_counter'").fetchone()
+        self.barcode_counter = row[0] if row else 1
+        row = self.conn.execute("SELECT value FROM settings WHERE key = 'sale_counter'").fetchone()
+        if row:
+            self.sale_counter = row[0]
+        else:
+            cursor = self.conn.execute("SELECT sale_id FROM sales WHERE sale_id LIKE 'SALE%'")
+            self.sale_counter = first_free_sale_number(row[0] for row in cursor)
+
+    def commit(self, record):
+        with self.conn:
+            self.write(record)
+        self.apply_catalogue(record)
+
+    def write(self, record):
+        op = record['op']
+        if op == 'product':
+            insert_products(self.conn, [record['product']])
+            if 'barcode_counter' in record:
+                set_setting(self.conn, 'barcode_counter', record['barcode_counter'])
+        elif op == 'remove':
+            self.conn.execute('DELETE FROM products WHERE id = ?', (record['product_id'],))
+        elif op == 'sale':
+            insert_sales(self.conn, [record['sale']])
+            if 'sale_counter' in record:
+                set_setting(self.conn, 'sale_counter', record['sale_counter'])
+            self.conn.executemany('UPDATE products SET quantity = quantity - ? WHERE id = ?',
+                                  [(item['quantity'], item['product_id']) for item in record['sale']['items']])
+        elif op == 'return':
+            self.conn.executemany('UPDATE products SET quantity = quantity + ? WHERE id = ?',
+                                  [(qty, pid) for pid, qty in record['items']])
+        insert_history(self.conn, record.get('history', []))
+
+    def query_sales(self, sales_query, params, order='ASC'):
+        # Sales picked by `sales_query` (a SELECT over sales) with their items, in one pass
+        cursor = self.conn.execute(f'''
+            SELECT s.seq, s.sale_id, s.date, s.subtotal, s.discount_percent, s.discount_amount, s.total,
+                   i.product_id, i.name, i.price, i.quantity
+            FROM ({sales_query}) s LEFT JOIN sale_items i ON i.sale_seq = s.seq
+            ORDER BY s.seq {order}, i.id
+        ''', params)
+        sales = []
+        last = None
+        for row in cursor:
+            if row[0] != last:
+                last = row[0]
+                sales.append(dict(zip(SALE_FIELDS, row[1:7]), items=[]))
+            if row[7] is not None:
+                sales[-1]['items'].append(dict(zip(ITEM_FIELDS, row[7:])))
+        return sales
+
+    def get_sale(self, sale_id):
+        sales = self.query_sales('SELECT * FROM sales WHERE sale_id = ? LIMIT 1', (sale_id,))
+        return sales[0] if sales else None
+
+    def find_sales(self, term='', limit=SEARCH_LIMIT):
+        # Walks the sales backwards and stops once `limit` have matched
+        pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        return self.query_sales('''
+            SELECT * FROM sales WHERE sale_id LIKE ? ESCAPE '\\' ORDER BY seq DESC LIMIT ?
+        ''', (pattern, limit), 'DESC')
+
+    def sales_between(self, start='', end=None):
+        if end is None:
+            return self.query_sales('SELECT * FROM sales WHERE date >= ?', (start,))
+        return self.query_sales('SELECT * FROM sales WHERE date >= ? AND date < ?', (start, end))
+
+    def sales_total(self, start='', end=None):
+        if end is None:
+            row = self.conn.execute('SELECT SUM(total) FROM sales WHERE date >= ?', (start,)).fetchone()
+        else:
+            row = self.conn.execute('SELECT SUM(total) FROM sales WHERE date >= ? AND date < ?',
+                                    (start, end)).fetchone()
+        return row[0] or 0
+
+    def product_history(self, product_id):
+        cursor = self.conn.execute('SELECT entry FROM stock_history WHERE product_id = ? ORDER BY id',
+                                   (product_id,))
+        return [json.loads(row[0]) for row in cursor]
+
+    def all_history(self):
+        cursor = self.conn.execute('SELECT entry FROM stock_history ORDER BY id')
+        return (json.loads(row[0]) for row in cursor)
+
+    def restore(self, data):
+        with self.conn:
+            for table in ('products', 'sales', 'sale_items', 'stock_history', 'settings'):
+                self.conn.execute(f'DELETE FROM {table}')
+            insert_products(self.conn, data.get('products', {}).values())
+            insert_sales(self.conn, data.get('sales', []))
+            insert_history(self.conn, data.get('stock_history', []))
+            set_setting(self.conn, 'barcode_counter', data.get('barcode_counter', 1))
+            if data.get('sale_counter'):
+                set_setting(self.conn, 'sale_counter', data['sale_counter'])
+        self.load()
+
+    def close(self):
+        self.conn.close()
+
+
+def insert_products(conn, products):
+    conn.executemany(f'''
+        INSERT OR REPLACE INTO products ({', '.join(PRODUCT_FIELDS)})
+        VALUES ({', '.join('?' * len(PRODUCT_FIELDS))})
+    ''', [tuple(product.get(field) for field in PRODUCT_FIELDS) for product in products])
+
+
+def insert_sales(conn, sales):
+    for sale in sales:
+        cursor = conn.execute(f'''
+            INSERT INTO sales ({', '.join(SALE_FIELDS)}) VALUES ({', '.join('?' * len(SALE_FIELDS))})
+        ''', tuple(sale.get(field) for field in SALE_FIELDS))
+        conn.executemany(f'''
+            INSERT INTO sale_items (sale_seq, {', '.join(ITEM_FIELDS)}) VALUES (?, ?, ?, ?, ?)
+        ''', [(cursor.lastrowid, *(item.get(field) for field in ITEM_FIELDS)) for item in sale['items']])
+
+
+def insert_history(conn, entries):
+    conn.executemany('''
+        INSERT INTO stock_history (product_id, action, date, entry) VALUES (?, ?, ?, ?)
+    ''', [(entry.get('product_id'), entry.get('action'), entry.get('date'), json.dumps(entry))
+          for entry in entries])
+
+
+def first_free_sale_number(sale_ids):
+    # For data saved before the sale counter existed: one past the highest SALE number
+    numbers = [int(sale_id[4:]) for sale_id in sale_ids
+               if sale_id.startswith('SALE') and sale_id[4:].isdigit()]
+    return max(numbers, default=0) + 1
+
+
+def set_setting(conn, key, value):
+    conn.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', (key, value))
+
+
+def iter_snapshot(f, chunk_size=1 << 16):
+    # Yields (section, key, value) from a shop_data.json document one entry at a
+    # time: (products, id, product), (sales, None, sale), (stock_history, None,
+    # entry), then the plain values. Only one chunk of the file is held at once.
+    decoder = json.JSONDecoder()
+    buf, pos, eof = '', 0, False
+
+    def more():
+        nonlocal buf, pos, eof
+        data = f.read(chunk_size)
+        if not data:
+            eof = True
+            return False
+        buf, pos = buf[pos:] + data, 0
+        return True
+
+    def peek():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buf):
+                return buf[pos]
+            if not more():
+                raise ValueError("Shop data ends early")
+
+    def expect(char):
+        nonlocal pos
+        if peek() != char:
+            raise ValueError(f"Expected {char!r} in shop data")
+        pos += 1
+
+    def value():
+        nonlocal pos
+        peek()
+        while True:
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if eof or not more():
+                    raise
+                continue
+            # A number at the end of the chunk may carry on in the next one
+            if end == len(buf) and not eof and more():
+                continue
+            pos = end
+            return obj
+
+    def at_end(char):
+        # True at the end of an object or list, False after a comma
+        nonlocal pos
+        found = peek()
+        pos += 1
+        if found not in (',', char):
+            raise ValueError(f"Expected ',' or {char!r} in shop data")
+        return found == char
+
+    expect('{')
+    if peek() == '}':
+        return
+    while True:
+        section = value()
+        expect(':')
+        if peek() == '{':
+            pos += 1
+            if peek() == '}':
+                pos += 1
+            else:
+                while True:
+                    key = value()
+                    expect(':')
+                    yield section, key, value()
+                    if at_end('}'):
+                        break
+        elif peek() == '[':
+            pos += 1
+            if peek() == ']':
+                pos += 1
+            else:
+                while True:
+                    yield section, None, value()
+                    if at_end(']'):
+                        break
+        else:
+            yield section, None, value()
+        if at_end('}'):
+            return
+
+
+def migrate(json_path=SNAPSHOT_FILE, db_path=DATABASE_FILE, journal_path=JOURNAL_FILE, history_dir=HISTORY_DIR):
+    # One-shot move of shop_data.json, its history folder and its journal into a new
+    # database. Everything is streamed and inserted in batches, so memory does not
+    # grow with the data; the database only appears under its real name once complete.
+    tmp = db_path + '.tmp'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    store = SqliteShopStore(tmp)
+    inserts = {'products': insert_products, 'sales': insert_sales, 'stock_history': insert_history}
+    batches = {section: [] for section in inserts}
+    since = 0
+    # History in an older snapshot only counts if it was never moved to the folder
+    history = HistoryLog(history_dir)
+    moved = os.path.isdir(history.directory)
+    try:
+        if os.path.exists(json_path):
+            with open(json_path, 'r', encoding='utf-8') as f:
+                for section, key, value in iter_snapshot(f):
+                    if section == 'stock_history' and moved:
+                        continue
+                    if section in batches:
+                        batches[section].append(value)
+                        if len(batches[section]) >= MIGRATE_BATCH:
+                            inserts[section](store.conn, batches[section])
+                            batches[section] = []
+                    elif section in ('barcode_counter', 'sale_counter'):
+                        set_setting(store.conn, section, value)
+                    elif section == 'journal_seq':
+                        since = value
+        # Entries of journal records newer than the snapshot come with the replay below
+        for entry in history.entries(since):
+            batches['stock_history'].append(entry)
+            if len(batches['stock_history']) >= MIGRATE_BATCH:
+                insert_history(store.conn, batches['stock_history'])
+                batches['stock_history'] = []
+        for section, rows in batches.items():
+            inserts[section](store.conn, rows)
+        store.conn.commit()
+
+        # Changes the JSON store had only journalled
+        store.load()
+        journal = ShopJournal(journal_path)
+        for record in journal.replay(since):
+            store.commit(record)
+    finally:
+        store.close()
+    os.replace(tmp, db_path)
+    return len(store.products)
+
+
+def open_store(kind=STORAGE):
+    if kind == 'sqlite':
+        if not os.path.exists(DATABASE_FILE) and (os.path.exists(SNAPSHOT_FILE) or os.path.exists(JOURNAL_FILE)):
+            migrate()
+        store = SqliteShopStore()
+    else:
+        store = JsonShopStore()
+    store.load()
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move shop_data.json into an SQLite database")
+    parser.add_argument('--json', default=SNAPSHOT_FILE)
+    parser.add_argument('--journal', default=JOURNAL_FILE)
+    parser.add_argument('--history', default=HISTORY_DIR)
+    parser.add_argument('--db', default=DATABASE_FILE)
+    args = parser.parse_args()
+    if os.path.exists(args.db):
+        parser.error(f"{args.db} already exists")
+    count = migrate(args.json, args.db, args.journal, args.history)
+    print(f"Migrated {count} products to {args.db}")
+
+
+if __name__ == "__main__":
+    main()
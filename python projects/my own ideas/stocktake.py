@@ -0,0 +1,80 @@
+import json
+import os
+import time
+
+from inventory_core import timestamp
+
+SESSION_FILE = 'stocktake_session.json'
+AUTOSAVE_SECONDS = 30  # counts are written to the session file at most this often while scanning
+
+
+class StockTakeSession:
+    def __init__(self, path=SESSION_FILE, started=None, counts=None):
+        self.path = path
+        self.started = started or timestamp()
+        self.counts = counts or {}  # barcode -> counted pieces
+        self.pieces = sum(self.counts.values())
+        self.last_save = time.monotonic()
+
+    @classmethod
+    def exists(cls, path=SESSION_FILE):
+        return os.path.exists(path)
+
+    @classmethod
+    def load(cls, path=SESSION_FILE):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(path, data.get('started'), data.get('counts', {}))
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'started': self.started, 'saved': timestamp(), 'counts': self.counts}, f)
+        os.replace(tmp_path, self.path)
+        self.last_save = time.monotonic()
+
+    def discard(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def scan(self, barcode, quantity=1):
+        count = self.counts.get(barcode, 0) + quantity
+        self.counts[barcode] = count
+        self.pieces += quantity
+        if time.monotonic() - self.last_save >= AUTOSAVE_SECONDS:
+            self.save()
+        return count
+
+    def set_count(self, barcode, quantity):
+        self.pieces += quantity - self.counts.get(barcode, 0)
+        self.counts[barcode] = quantity
+
+    def variance(self, db, full_count=True):
+        # One query over all counts: (barcode, name, system stock, counted, difference).
+        # With full_count, products that were never scanned count as zero.
+        # Barcodes not in the catalogue come back with name and system stock None.
+        # Done as one transaction that ends before returning, so the read lock the
+        # SELECT takes on the main database is not held while the dialog is open
+        # and the backup and sync connections can still commit
+        with db.conn:
+            cursor = db.conn.cursor()
+            cursor.execute('''
+                CREATE TEMP TABLE IF NOT EXISTS stocktake_counts (
+                    barcode TEXT PRIMARY KEY,
+                    counted INTEGER
+                )
+            ''')
+            cursor.execute('DELETE FROM temp.stocktake_counts')
+            cursor.executemany('INSERT INTO temp.stocktake_counts VALUES (?, ?)', self.counts.items())
+            cursor.execute('''
+                SELECT p.barcode, p.name, p.stock_quantity, COALESCE(c.counted, 0),
+                       COALESCE(c.counted, 0) - p.stock_quantity
+                FROM products p LEFT JOIN temp.stocktake_counts c ON c.barcode = p.barcode
+                WHERE (? OR c.barcode IS NOT NULL) AND COALESCE(c.counted, 0) != p.stock_quantity
+                UNION ALL
+                SELECT c.barcode, NULL, NULL, c.counted, NULL
+                FROM temp.stocktake_counts c
+                WHERE NOT EXISTS (SELECT 1 FROM products p WHERE p.barcode = c.barcode)
+                ORDER BY 1
+            ''', (1 if full_count else 0,))
+            return cursor.fetchall()
@@ -0,0 +1,291 @@
+import argparse
+import gzip
+import json
+import socket
+import socketserver
+
+from inventory_core import InventoryDatabase, timestamp
+
+FORMAT_VERSION = 2
+BATCH_SIZE = 1000
+DEFAULT_PORT = 8765
+
+# Shared catalogue columns; stock and minimum levels belong to each shop and are never synced.
+# catalogue_updated is the version of the other fields, only edits to them change it.
+CATALOGUE_COLUMNS = ('barcode', 'name', 'category', 'size', 'color', 'cost_price',
+                     'selling_price', 'date_added', 'catalogue_updated')
+SALES_COLUMNS = ('sale_date', 'barcode', 'quantity', 'revenue')
+
+
+class SyncError(Exception):
+    pass
+
+
+class SyncResult:
+    def __init__(self):
+        self.shop = None
+        self.products = 0   # rows received or sent
+        self.applied = 0    # rows that changed the catalogue
+        self.sales = 0
+        self.watermark = None
+        self.sales_watermark = None
+
+
+def get_watermark(db, peer, stream):
+    cursor = db.conn.cursor()
+    cursor.execute('SELECT watermark FROM sync_state WHERE peer = ? AND stream = ?', (peer, stream))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def set_watermark(db, peer, stream, watermark):
+    cursor = db.conn.cursor()
+    cursor.execute('''
+        INSERT INTO sync_state (peer, stream, watermark, updated) VALUES (?, ?, ?, ?)
+        ON CONFLICT (peer, stream) DO UPDATE SET watermark = excluded.watermark, updated = excluded.updated
+    ''', (peer, stream, watermark, timestamp()))
+
+
+def write_batches(out, kind, columns, rows):
+    # One JSON line per batch of rows, column names are sent once per batch
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            out.write(encode({'type': kind, 'columns': columns, 'rows': batch}))
+            count += len(batch)
+            batch = []
+    if batch:
+        out.write(encode({'type': kind, 'columns': columns, 'rows': batch}))
+        count += len(batch)
+    return count
+
+
+def encode(message):
+    return (json.dumps(message, separators=(',', ':'), ensure_ascii=False) + '\n').encode('utf-8')
+
+
+def export_changes(db, out, shop, peer, since=None, sales=True, confirm=True):
+    # Streams products changed since the peer's watermark (or `since`) to a binary
+    # file-like object. The watermark is this shop's change_seq, so rows received
+    # from another shop are passed on however old their catalogue version is.
+    # With confirm=False the watermarks are only moved by confirm_export().
+    result = SyncResult()
+    result.shop = shop
+    since = since if since is not None else int(get_watermark(db, peer, 'products_out') or 0)
+    sales_since = get_watermark(db, peer, 'sales_out') or ''
+
+    out.write(encode({'type': 'header', 'version': FORMAT_VERSION, 'shop': shop,
+                      'since': since, 'generated': timestamp()}))
+
+    watermark = since
+    cursor = db.conn.cursor()
+    cursor.execute(f'''
+        SELECT {', '.join(CATALOGUE_COLUMNS)}, change_seq FROM products
+        WHERE change_seq > ? ORDER BY change_seq
+    ''', (since,))
+
+    def products():
+        nonlocal watermark
+        for row in cursor:
+            watermark = row[-1]
+            yield row[:-1]
+
+    result.products = write_batches(out, 'products', CATALOGUE_COLUMNS, products())
+
+    sales_watermark = sales_since
+    if sales:
+        # Whole days from the last one sent, so a day that was still open is sent complete
+        sales_cursor = db.conn.cursor()
+        sales_cursor.execute('''
+            SELECT period_key, barcode, quantity, revenue FROM sales_counters
+            WHERE period = 'day' AND period_key >= ? ORDER BY period_key
+        ''', (sales_since,))
+
+        def sales_rows():
+            nonlocal sales_watermark
+            for row in sales_cursor:
+                sales_watermark = row[0]
+                yield row
+
+        result.sales = write_batches(out, 'sales', SALES_COLUMNS, sales_rows())
+
+    out.write(encode({'type': 'end', 'products': result.products, 'sales': result.sales,
+                      'watermark': watermark}))
+    out.flush()
+
+    result.watermark = watermark
+    result.sales_watermark = sales_watermark if sales else None
+    if confirm:
+        confirm_export(db, peer, result)
+    return result
+
+
+def confirm_export(db, peer, result):
+    set_watermark(db, peer, 'products_out', result.watermark)
+    if result.sales_watermark is not None:
+        set_watermark(db, peer, 'sales_out', result.sales_watermark)
+    db.conn.commit()
+
+
+def apply_products(cursor, columns, rows):
+    # The latest catalogue edit wins, by catalogue_updated; a stock take or sale at
+    # either shop does not make a row newer. Edits made in the same second are settled
+    # on the fields themselves, the greater one wins everywhere, so shops that swap
+    # them end up alike. A row that is not newer than the local copy changes nothing,
+    # which makes applying the same batch twice a no-op.
+    # New products start with no stock in this shop.
+    if tuple(columns) != CATALOGUE_COLUMNS:
+        raise SyncError(f"Unexpected product columns: {columns}")
+    cursor.executemany('''
+        INSERT INTO products (barcode, name, category, size, color, cost_price, selling_price,
+                            date_added, catalogue_updated, last_updated, stock_quantity)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now', 'localtime'), 0)
+        ON CONFLICT (barcode) DO UPDATE SET
+            name = excluded.name, category = excluded.category, size = excluded.size,
+            color = excluded.color, cost_price = excluded.cost_price,
+            selling_price = excluded.selling_price, catalogue_updated = excluded.catalogue_updated,
+            last_updated = excluded.last_updated,
+            change_seq = (SELECT MAX(change_seq) + 1 FROM products)
+        WHERE products.catalogue_updated IS NULL OR excluded.catalogue_updated > products.catalogue_updated
+           OR (excluded.catalogue_updated = products.catalogue_updated
+               AND json_array(excluded.name, excluded.category, excluded.size, excluded.color,
+                              excluded.cost_price, excluded.selling_price)
+                 > json_array(products.name, products.category, products.size, products.color,
+                              products.cost_price, products.selling_price))
+    ''', rows)
+    return max(cursor.rowcount, 0)
+
+
+def apply_sales(cursor, shop, columns, rows):
+    # Day totals replace what was received before for that day
+    if tuple(columns) != SALES_COLUMNS:
+        raise SyncError(f"Unexpected sales columns: {columns}")
+    cursor.executemany('''
+        INSERT INTO shop_sales (shop, sale_date, barcode, quantity, revenue) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (shop, sale_date, barcode) DO UPDATE SET
+            quantity = excluded.quantity, revenue = excluded.revenue
+    ''', [(shop, *row) for row in rows])
+    return len(rows)
+
+
+def import_changes(db, stream):
+    # Applies a stream written by export_changes in one transaction, nothing is
+    # kept if it is cut short
+    result = SyncResult()
+    cursor = db.conn.cursor()
+    finished = False
+    try:
+        for line in stream:
+            if not line.strip():
+                continue
+            message = json.loads(line)
+            kind = message.get('type')
+            if kind == 'header':
+                if message.get('version') != FORMAT_VERSION:
+                    raise SyncError(f"Unsupported sync format {message.get('version')}")
+                result.shop = message['shop']
+            elif result.shop is None:
+                raise SyncError("Sync stream has no header")
+            elif kind == 'products':
+                result.products += len(message['rows'])
+                result.applied += apply_products(cursor, message['columns'], message['rows'])
+            elif kind == 'sales':
+                result.sales += apply_sales(cursor, result.shop, message['columns'], message['rows'])
+            elif kind == 'end':
+                if message['products'] != result.products or message.get('sales', 0) != result.sales:
+                    raise SyncError("Sync stream is incomplete")
+                result.watermark = message['watermark']
+                finished = True
+                break
+        if not finished:
+            raise SyncError("Sync stream ended early")
+        set_watermark(db, result.shop, 'products_in', result.watermark)
+        db.commit()
+    except Exception:
+        db.conn.rollback()
+        raise
+    return result
+
+
+def open_file(path, mode):
+    return gzip.open(path, mode) if path.endswith('.gz') else open(path, mode)
+
+
+class SyncHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        result = import_changes(self.server.db, self.rfile)
+        self.wfile.write(encode({'type': 'ack', 'products': result.products,
+                                 'applied': result.applied, 'sales': result.sales}))
+        print(f"{result.shop}: {result.products} products ({result.applied} applied), "
+              f"{result.sales} sales rows")
+
+
+def serve(db, port=DEFAULT_PORT, host='127.0.0.1'):
+    # Receives one sync stream per connection, one at a time
+    with socketserver.TCPServer((host, port), SyncHandler) as server:
+        server.db = db
+        print(f"Listening on {host}:{port}")
+        server.serve_forever()
+
+
+def send(db, shop, peer, host, port=DEFAULT_PORT, since=None):
+    with socket.create_connection((host, port)) as sock:
+        out = sock.makefile('wb')
+        result = export_changes(db, out, shop, peer, since, confirm=False)
+        sock.shutdown(socket.SHUT_WR)
+        ack = json.loads(sock.makefile('rb').readline() or 'null')
+    # The watermark only moves once the other shop has applied everything
+    if not ack or ack.get('type') != 'ack':
+        raise SyncError("No acknowledgement from the receiving shop")
+    confirm_export(db, peer, result)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync the product catalogue and sales between shops")
+    parser.add_argument('--db', default='garments_inventory.db')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export = commands.add_parser('export', help="write changes since the last export to a file")
+    export.add_argument('path', help="output file, .gz to compress")
+    export.add_argument('--shop', required=True, help="name of this shop")
+    export.add_argument('--peer', required=True, help="shop the file is for")
+    export.add_argument('--full', action='store_true', help="send the whole catalogue")
+
+    load = commands.add_parser('import', help="apply a file written by export")
+    load.add_argument('path')
+
+    listen = commands.add_parser('serve', help="receive changes over a local socket")
+    listen.add_argument('--host', default='127.0.0.1')
+    listen.add_argument('--port', type=int, default=DEFAULT_PORT)
+
+    push = commands.add_parser('send', help="send changes to a shop running serve")
+    push.add_argument('--shop', required=True)
+    push.add_argument('--peer', required=True)
+    push.add_argument('--host', default='127.0.0.1')
+    push.add_argument('--port', type=int, default=DEFAULT_PORT)
+    push.add_argument('--full', action='store_true')
+    args = parser.parse_args()
+
+    db = InventoryDatabase(args.db)
+    if args.command == 'export':
+        with open_file(args.path, 'wb') as out:
+            result = export_changes(db, out, args.shop, args.peer, 0 if args.full else None)
+        print(f"Exported {result.products} products and {result.sales} sales rows")
+    elif args.command == 'import':
+        with open_file(args.path, 'rb') as stream:
+            result = import_changes(db, stream)
+        print(f"{result.shop}: {result.products} products ({result.applied} applied), "
+              f"{result.sales} sales rows")
+    elif args.command == 'serve':
+        serve(db, args.port, args.host)
+    else:
+        result = send(db, args.shop, args.peer, args.host, args.port, 0 if args.full else None)
+        print(f"Sent {result.products} products and {result.sales} sales rows")
+    db.conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import io
+import socket
+import threading
+
+import pytest
+
+import sync
+from inventory_core import InventoryDatabase
+
+
+def make_db(tmp_path, name):
+    return InventoryDatabase(str(tmp_path / f"{name}.db"))
+
+
+def add(db, barcode, name, when='2026-01-01 10:00:00', stock=5):
+    db.add_product((barcode, name, 'shirt', 'M', 'blue', 100.0, 200.0, stock, 2, when, when))
+
+
+def edit(db, barcode, name, when, stock=None):
+    product = db.get_product(barcode)
+    db.update_product(barcode, (name, product.category, product.size, product.color,
+                                product.cost_price, product.selling_price,
+                                product.stock_quantity if stock is None else stock,
+                                product.min_stock_level, when))
+
+
+def export(db, shop, peer, since=None, confirm=True):
+    out = io.BytesIO()
+    result = sync.export_changes(db, out, shop, peer, since, confirm=confirm)
+    return out.getvalue(), result
+
+
+def apply(db, data):
+    return sync.import_changes(db, io.BytesIO(data))
+
+
+def test_applying_a_stream_twice_changes_nothing(tmp_path):
+    a, b = make_db(tmp_path, 'a'), make_db(tmp_path, 'b')
+    add(a, '1001', 'Shirt')
+    data, _ = export(a, 'a', 'b')
+    assert apply(b, data).applied == 1
+    before = b.get_product('1001')
+    assert apply(b, data).applied == 0
+    assert b.get_product('1001') == before
+
+
+def test_an_older_row_is_ignored(tmp_path):
+    a, b = make_db(tmp_path, 'a'), make_db(tmp_path, 'b')
+    add(a, '1001', 'Shirt')
+    apply(b, export(a, 'a', 'b')[0])
+    edit(b, '1001', 'Shirt (new)', '2026-01-02 10:00:00')
+    old, _ = export(a, 'a', 'b', since=0)
+    assert apply(b, old).applied == 0
+    assert b.get_product('1001').name == 'Shirt (new)'
+
+
+def test_a_stock_take_does_not_make_a_row_newer(tmp_path):
+    a, b = make_db(tmp_path, 'a'), make_db(tmp_path, 'b')
+    add(a, '1001', 'Shirt')
+    apply(b, export(a, 'a', 'b')[0])
+    edit(a, '1001', 'Shirt (renamed)', '2026-01-02 10:00:00')
+    b.apply_stock_counts([('1001', 9)])
+    assert apply(a, export(b, 'b', 'a', since=0)[0]).applied == 0
+    assert a.get_product('1001').name == 'Shirt (renamed)'
+    apply(b, export(a, 'a', 'b')[0])
+    assert b.get_product('1001').name == 'Shirt (renamed)'
+    assert b.get_product('1001').stock_quantity == 9
+
+
+def test_a_hub_passes_on_rows_older_than_its_watermark(tmp_path):
+    a, hub, c = make_db(tmp_path, 'a'), make_db(tmp_path, 'hub'), make_db(tmp_path, 'c')
+    add(hub, '2001', 'Jeans', when='2026-03-01 10:00:00')
+    apply(c, export(hub, 'hub', 'c')[0])
+    # Edited at shop A before the hub's last export to C, received after it
+    add(a, '1001', 'Shirt', when='2026-01-01 10:00:00')
+    apply(hub, export(a, 'a', 'hub')[0])
+    data, result = export(hub, 'hub', 'c')
+    assert result.products == 1
+    apply(c, data)
+    assert c.get_product('1001').name == 'Shirt'
+
+
+def test_a_cut_off_stream_is_rolled_back(tmp_path):
+    a, b = make_db(tmp_path, 'a'), make_db(tmp_path, 'b')
+    add(a, '1001', 'Shirt')
+    add(a, '1002', 'Kurta')
+    data, _ = export(a, 'a', 'b')
+    cut = b''.join(data.splitlines(keepends=True)[:-1])
+    with pytest.raises(sync.SyncError):
+        apply(b, cut)
+    assert b.get_product('1001') is None
+    assert sync.get_watermark(b, 'a', 'products_in') is None
+
+
+def test_the_watermark_only_moves_after_an_ack(tmp_path):
+    a = make_db(tmp_path, 'a')
+    add(a, '1001', 'Shirt')
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+
+    def no_ack():
+        conn, _ = server.accept()
+        with conn:
+            while conn.recv(65536):
+                pass
+
+    thread = threading.Thread(target=no_ack)
+    thread.start()
+    with pytest.raises(sync.SyncError):
+        sync.send(a, 'a', 'b', '127.0.0.1', server.getsockname()[1])
+    thread.join()
+    server.close()
+    assert sync.get_watermark(a, 'b', 'products_out') is None
+    _, result = export(a, 'a', 'b')
+    assert result.products == 1
+    assert int(sync.get_watermark(a, 'b', 'products_out')) > 0
+
+
+def test_edits_in_the_same_second_settle_the_same_way_in_both_shops(tmp_path):
+    a, b = make_db(tmp_path, 'a'), make_db(tmp_path, 'b')
+    add(a, '1001', 'Shirt')
+    apply(b, export(a, 'a', 'b')[0])
+    edit(a, '1001', 'Shirt (a)', '2026-01-02 10:00:00')
+    edit(b, '1001', 'Shirt (b)', '2026-01-02 10:00:00')
+    from_a, _ = export(a, 'a', 'b')
+    from_b, _ = export(b, 'b', 'a')
+    apply(a, from_b)
+    apply(b, from_a)
+    for db in (a, b):
+        row = db.conn.execute("SELECT name, catalogue_updated FROM products WHERE barcode = '1001'")
+        assert row.fetchone() == ('Shirt (b)', '2026-01-02 10:00:00')
+    assert apply(a, export(b, 'b', 'a')[0]).applied == 0
+    assert apply(b, export(a, 'a', 'b')[0]).applied == 0